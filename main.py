@@ -1,18 +1,43 @@
 import json
 import os
-import numpy as np
 import sys
+from contextlib import ExitStack
 import logging
 from PyQt5.QtWidgets import (QWidget, QLabel, QApplication, QMenuBar, QDesktopWidget, QAction, QDialog, QGridLayout,
                              QVBoxLayout, QLineEdit, QPushButton, QFileDialog, QProgressBar, QComboBox, QCheckBox)
+from utils.Compression import CompressedWriter
 from utils.Conditions import NewConditions
-from utils.Model import Model
+from utils.Emission import EmissionSources, load_sources
+from utils.Model import STEADY_CHECK, STEADY_TOL, Model
+from utils.Pipeline import RenderPipeline, animation_exporter
+from utils.Export import ProgressChannel
+from utils.Steady import solve_steady
 from utils.Plotting import MPCAnimation, DefaultAnimation
 from utils.PDK_Table import SubstancesDialog
-from utils.Logs import LogViewerDialog
+from utils.Catalog import SubstanceCatalog, SubstanceCompleter, SubstanceListModel
+from utils.Logs import LogViewerDialog, setup_logging
+from utils.Live import LiveFrame, LiveViewDialog
+from utils.Statistics import ExposureAccumulator
+from utils.Storage import RESULT_PATH, ResultWriter, result_exists, species_path
 from tkinter.messagebox import showerror
 
 
+# Формат результата: несжатые кадры или сжатые блоки (режим квантования CompressedWriter)
+RESULT_FORMATS = {
+    "Без сжатия": None,
+    "Сжатие с квантованием": "scaled",
+    "Сжатие без потерь": "none",
+}
+
+# Граничные условия в интерфейсе и их имена в Model
+BOUNDARY_NAMES = {
+    "Поглощение на границе": "Dirihle",
+    "Нулевой градиент": "Neumann",
+    "Периодические": "Periodic",
+    "Свободный вынос": "Outflow",
+}
+
+
 class App(QWidget):
     def __init__(self):
         super().__init__()
@@ -105,10 +130,17 @@ class App(QWidget):
 
         self.iterate_button = QPushButton("Моделирование")
 
+        self.live_button = QPushButton("Моделирование с просмотром")
+
+        self.steady_button = QPushButton("Установившийся режим")
+
         self.ok_button = QPushButton("Просмотр")
 
         self.save_button = QPushButton("Сохранить")
 
+        self.live_export_label = QLabel("Сохранять анимацию во время расчёта")
+        self.live_export_check = QCheckBox()
+
         self.update_c_label = QLabel("Обновлять шкалу концентрации")
         self.update_c_radio = QCheckBox()
 
@@ -122,18 +154,20 @@ class App(QWidget):
         self.work_zone.hide()
         self.work_zone_check.hide()
 
-        self.substances_data = []
-        self.substance_names = []
-        self.load_substances()
-        self.pdk_values = {sub['name']: sub['pdk'] for sub in self.substances_data}
-        self.pdk_work_values = {sub['name']: sub['pdk_work'] for sub in self.substances_data}
+        self.catalog = SubstanceCatalog()
 
+        # Список веществ подгружается из базы по мере прокрутки, ввод подсказывает названия
         self.select_substance = QComboBox()
-
-        if hasattr(self, 'substance_names') and self.substance_names:
-            self.select_substance.addItems(self.substance_names)
-        else:
-            self.select_substance.addItems(["Аммиак"])
+        self.select_substance.setEditable(True)
+        self.select_substance.setInsertPolicy(QComboBox.NoInsert)
+        self.select_substance.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.select_substance.setMinimumContentsLength(20)
+        # Свой completer ставится до модели: стандартный загрузил бы весь список сразу
+        self.select_substance.setCompleter(SubstanceCompleter(self.catalog, parent=self))
+        self.substance_model = SubstanceListModel(self.catalog, self)
+        self.select_substance.setModel(self.substance_model)
+        if not self.catalog.count():
+            self.select_substance.setEditText("Аммиак")
 
         self.substance_label = QLabel("Вещество")
 
@@ -143,6 +177,14 @@ class App(QWidget):
         self.interpolation_method = QComboBox()
         self.interpolation_method.addItems(["Ступенчатая интерполяция", "Билинейная интерполяция"])
 
+        self.boundary_label = QLabel("Граничные условия")
+        self.boundary_method = QComboBox()
+        self.boundary_method.addItems(list(BOUNDARY_NAMES))
+
+        self.result_format_label = QLabel("Формат результата")
+        self.result_format = QComboBox()
+        self.result_format.addItems(list(RESULT_FORMATS))
+
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, 100)
 
@@ -176,10 +218,16 @@ class App(QWidget):
 
         self.grid_layout.addWidget(self.interpolation_method, 6, 4)
         self.grid_layout.addWidget(self.iterate_button, 6, 2)
+        self.grid_layout.addWidget(self.steady_button, 6, 3)
+        self.grid_layout.addWidget(self.boundary_label, 6, 6)
+        self.grid_layout.addWidget(self.boundary_method, 6, 7)
+        self.grid_layout.addWidget(self.result_format_label, 7, 6)
+        self.grid_layout.addWidget(self.result_format, 7, 7)
 
         self.grid_layout.addWidget(self.use_mpc, 7, 4)
         self.grid_layout.addWidget(self.use_mpc_check, 7, 5)
         self.grid_layout.addWidget(self.ok_button, 7, 2)
+        self.grid_layout.addWidget(self.live_button, 7, 3)
 
         self.grid_layout.addWidget(self.substance_label, 8, 4)
         self.grid_layout.addWidget(self.select_substance, 8, 5)
@@ -194,18 +242,23 @@ class App(QWidget):
         self.substance_label.hide()
 
         self.grid_layout.addWidget(self.save_button, 10, 2)
+        self.grid_layout.addWidget(self.live_export_label, 10, 4)
+        self.grid_layout.addWidget(self.live_export_check, 10, 5)
 
         self.grid_layout.addWidget(self.progress_bar, 11, 2)
 
         self.iterate_button.clicked.connect(self.iterate)
+        self.steady_button.clicked.connect(self.steady_state)
+        self.live_button.clicked.connect(self.live_view)
         self.ok_button.clicked.connect(self.show_it)
         self.save_button.clicked.connect(self.save_it)
 
         self.x_size = self.y_size = self.x_step = self.y_step = self.Dx = self.Dy = self.u = self.v = self.t \
             = self.t_step = self.anim_int = self.freq = self.x = self.y = self.c = self.is_const_generation \
-            = self.repeat_freq = self.condit_start = self.update_conc = self.sources = None
+            = self.emissions = self.update_conc = self.sources = self.receptors = self.species = self.window = None
 
-        self.npz_exists = os.path.isfile("model.npz")
+        self.result_exists = result_exists()
+        self.export_after_run = False
 
         self.mpc_use = False
 
@@ -220,9 +273,12 @@ class App(QWidget):
             print(f"{e}")
 
     def pdk_table_dialog(self):
-        dialog = SubstancesDialog("substances.json", parent=self)
+        dialog = SubstancesDialog(self.catalog, parent=self)
         if dialog.exec_() == QDialog.Accepted:
             logging.info("Created substances.json")
+            substance = self.select_substance.currentText()
+            self.substance_model.reload()
+            self.select_substance.setEditText(substance)
         else:
             logging.error("Error while created substances.json")
 
@@ -245,19 +301,41 @@ class App(QWidget):
             self.update_c_radio.show()
 
     def get_current_pdk(self):
-        current_substance = self.select_substance.currentText()
+        pdk, pdk_work = self.catalog.limits(self.select_substance.currentText())
         if self.work_zone_check.isChecked():
-            return self.pdk_work_values.get(current_substance, 0.0)
-        return self.pdk_values.get(current_substance, 0.0)
-
-    def load_substances(self):
-        try:
-            with open('substances.json', 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                self.substances_data = sorted(data['substances'], key=lambda x: x['name'].lower())
-                self.substance_names = sorted([sub['name'] for sub in self.substances_data], key=lambda x: x.lower())
-        except FileNotFoundError:
-            logging.error("File substances.json is not found")
+            return pdk_work or 0.0
+        return pdk or 0.0
+
+    def species_names(self):
+        return [s.get("name", f"S{i + 1}") for i, s in enumerate(self.species or [])]
+
+    def selected_species(self):
+        # В многокомпонентном расчёте показывается выбранное вещество, иначе первое
+        names = self.species_names()
+        if not names:
+            return None
+        substance = self.select_substance.currentText()
+        return names.index(substance) if substance in names else 0
+
+    def result_path(self):
+        channel = self.selected_species()
+        return RESULT_PATH if channel is None else species_path(channel)
+
+    def render_pipeline(self, model):
+        # Анимация рисуется по мере расчёта; None - если для неё нужны все кадры заранее
+        if not model.slices_freq:
+            return None
+        zoning = True if self.interpolation_method.currentText() == "Билинейная интерполяция" else False
+        total = None if model.snapshot_tol else len(range(0, model.time_steps, model.slices_freq))
+        exporter = animation_exporter("anime" + self.save_list.currentText(), self.x_size, self.y_size,
+                                      self.anim_int, repeat=self.is_const_generation, zoning=zoning,
+                                      mpc=self.get_current_pdk() if self.mpc_use else None,
+                                      update_conc=self.update_conc, total=total,
+                                      progress=ProgressChannel(self.progress_bar))
+        if exporter is None:
+            return None
+        return RenderPipeline(exporter, self.anim_int, model.dt * model.slices_freq,
+                              channel=self.selected_species())
 
     def get_params(self):
         try:
@@ -276,19 +354,24 @@ class App(QWidget):
             c_start_file = "parameters.json"
             with open(c_start_file.replace("/", "\\"), "r") as config:
                 config_data = json.load(config)
-                if "sources" in config_data:
-                    self.sources = config_data["sources"]
+                if "sources" in config_data or "sources_file" in config_data:
+                    self.sources = config_data.get("sources", [])
                 else:
-                    logging.error("Invalid config format: must contain either 'x', 'y', 'c' or 'sources'")
-
-            self.condit_start = np.zeros((int(self.x_size), int(self.y_size)))
-            for source in self.sources:
-                x = int(source["x"])
-                y = int(source["y"])
-                c = float(source["concentration"])
-                self.repeat_freq = int(source["frequency"])
-                self.is_const_generation = True if self.repeat_freq != 0 else False
-                self.condit_start[x][y] = c
+                    logging.error("Invalid config format: must contain either 'sources' or 'sources_file'")
+                self.receptors = config_data.get("receptors", [])
+                # Вещества, считаемые за один прогон: name, decay (1/с), emission (доля выброса)
+                self.species = config_data.get("species", [])
+                # Подвижное окно [x, y] в ячейках: считается только область вокруг облака
+                self.window = config_data.get("window")
+                # Адаптивные срезы: {"tol": доля изменения поля, "norm": "inf"/"l2", "max_interval": шаги}
+                self.snapshots = config_data.get("snapshots") or {}
+
+            # У каждого источника своя частота выбросов
+            self.emissions = EmissionSources.from_config(self.sources)
+            # Линии и площади в большом количестве удобнее импортировать из CSV/GeoJSON
+            if config_data.get("sources_file"):
+                self.emissions.extend(load_sources(config_data["sources_file"]))
+            self.is_const_generation = self.emissions.repeating
             self.update_conc = self.update_c_radio.isChecked()
         except Exception as e:
             logging.error(f"{e}")
@@ -331,6 +414,15 @@ class App(QWidget):
         if dialog.exec_() == QDialog.Accepted:
             try:
                 parameters = dialog.get_properties()
+                # Редактор работает с точечными источниками, остальное сохраняется как было
+                if os.path.isfile('parameters.json'):
+                    with open('parameters.json', 'r', encoding='utf-8') as f:
+                        previous = json.load(f)
+                    # Если линии и площади импортированы в редакторе, прежние заменяются ими
+                    imported = any(source.get("type", "point") != "point" for source in parameters["sources"])
+                    kept = [] if imported else [source for source in previous.get("sources", [])
+                                                if source.get("type", "point") != "point"]
+                    parameters = {**previous, **parameters, "sources": parameters["sources"] + kept}
                 with open('parameters.json', 'w', encoding='utf-8') as f:
                     json.dump(parameters, f, ensure_ascii=False, indent=4)
             except Exception as e:
@@ -352,6 +444,7 @@ class App(QWidget):
             "save_name": self.save_input.text(),
             "initial_conditions": "parameters.json",
             "update_conc": self.update_c_radio.isChecked(),
+            "boundary": BOUNDARY_NAMES[self.boundary_method.currentText()],
         }
 
         file_path, _ = QFileDialog.getSaveFileName(
@@ -388,6 +481,9 @@ class App(QWidget):
                 self.dy_input.setText(str(data.get("dy", "")))
                 self.save_input.setText(str(data.get("save_name", "")))
                 self.update_c_radio.setChecked(bool(data.get("update_conc")))
+                boundary = {value: name for name, value in BOUNDARY_NAMES.items()}.get(data.get("boundary"))
+                if boundary:
+                    self.boundary_method.setCurrentText(boundary)
 
                 if self.grid_layout not in self.main_layout.children():
                     self.main_layout.addLayout(self.grid_layout)
@@ -396,32 +492,130 @@ class App(QWidget):
                 showerror("Error", f"Failed to load file:\n{str(e)}")
                 logging.error(f"Failed to load file:\n{str(e)}")
 
+    def create_model(self, **kwargs):
+        return Model(None, self.x_size, self.y_size, int(self.x_size), int(self.y_size),
+                     int(self.t), self.Dx, self.Dy, self.x_step, self.y_step, self.t_step, int(self.u),
+                     int(self.v), self.freq, emissions=self.emissions, species=self.species,
+                     conditions=BOUNDARY_NAMES[self.boundary_method.currentText()],
+                     snapshot_tol=self.snapshots.get("tol", 0), snapshot_norm=self.snapshots.get("norm", "inf"),
+                     snapshot_max=self.snapshots.get("max_interval"), **kwargs)
+
+    def model_params(self):
+        params = {key: getattr(self, key) for key in ("x_size", "y_size", "x_step", "y_step", "Dx", "Dy",
+                                                       "u", "v", "t", "t_step", "freq")}
+        return {**params, "sources": self.sources, "species": self.species, "window": self.window,
+                "snapshots": self.snapshots,
+                "boundary": BOUNDARY_NAMES[self.boundary_method.currentText()]}
+
+    def result_writers(self):
+        quantize = RESULT_FORMATS[self.result_format.currentText()]
+        params = self.model_params()
+
+        def writer(path=RESULT_PATH, channel=None):
+            if quantize is None:
+                return ResultWriter(path, channel=channel, params=params)
+            return CompressedWriter(path, quantize=quantize, channel=channel, params=params)
+
+        names = self.species_names()
+        if names:
+            return [writer(species_path(i), channel=i) for i in range(len(names))]
+        return [writer()]
+
+    def prepare_run(self):
+        """Создаёт модель с приёмниками результата; возвращает её и функцию расчёта.
+
+        Виджеты читаются здесь, в GUI-потоке, поэтому функцию расчёта можно
+        выполнять в другом потоке.
+        """
+        names = self.species_names()
+        if names:
+            limits = [self.catalog.limits(name) for name in names]
+            exposure = ExposureAccumulator([pdk for pdk, _ in limits], [pdk_work for _, pdk_work in limits])
+        else:
+            exposure = ExposureAccumulator(*self.catalog.limits(self.select_substance.currentText()))
+        writers = self.result_writers()
+        with ExitStack() as stack:
+            for writer in writers:
+                stack.enter_context(writer)
+            model = self.create_model(writers=writers, observers=[exposure], window=self.window,
+                                      steady_check=STEADY_CHECK if self.is_const_generation else 0,
+                                      steady_tol=STEADY_TOL)
+            receptors = None
+            if self.receptors:
+                receptors = model.add_receptors([(r["x"], r["y"]) for r in self.receptors],
+                                                [r.get("name", f"R{i + 1}") for i, r in enumerate(self.receptors)])
+            pipeline = None
+            if self.live_export_check.isChecked():
+                pipeline = self.render_pipeline(model)
+                if pipeline is not None:
+                    model.writers.append(stack.enter_context(pipeline))
+            # GIF с общей шкалой строится после расчёта, когда известен максимум
+            self.export_after_run = self.live_export_check.isChecked() and pipeline is None
+            writers_open = stack.pop_all()
+
+        def run():
+            with writers_open:
+                model.iterate()
+            exposure.save()
+            if receptors is not None:
+                receptors.to_csv()
+
+        return model, run
+
     def iterate(self):
         self.get_params()
         try:
-            model = Model(self.condit_start, self.x_size, self.y_size, int(self.x_size), int(self.y_size), int(self.t),
-                          self.Dx, self.Dy, self.x_step, self.y_step, self.t_step, int(self.u), int(self.v), self.freq,
-                          repeat_freq=self.repeat_freq, repeat_start_conditions=self.is_const_generation)
-            model.iterate()
-            res = model.c_list
-            np.savez("model.npz", res=res)
+            model, run = self.prepare_run()
+            run()
+            self.result_exists = True
+            if self.export_after_run:
+                self.save_it()
+
+        except Exception as e:
+            logging.error(f"{e}")
+
+    def live_view(self):
+        # Расчёт идёт в отдельном потоке, окно показывает последний кадр и позволяет остановить расчёт
+        self.get_params()
+        try:
+            model, run = self.prepare_run()
+            frame = LiveFrame(channel=self.selected_species())
+            model.observers.append(frame)
+            dialog = LiveViewDialog(model, frame, run, self.x_size, self.y_size,
+                                    mpc=self.get_current_pdk() if self.mpc_use else None, parent=self)
+            dialog.exec_()
+            if dialog.completed:
+                self.result_exists = True
+                if self.export_after_run and not model.cancelled:
+                    self.save_it()
+        except Exception as e:
+            logging.error(f"{e}")
 
+    def steady_state(self):
+        # Предельное поле при постоянных выбросах без шагов по времени, сохраняется одним кадром
+        self.get_params()
+        try:
+            field = solve_steady(self.create_model())
+            for writer in self.result_writers():
+                with writer:
+                    writer.append(field, self.t)
+            self.result_exists = True
         except Exception as e:
             logging.error(f"{e}")
 
     def show_it(self):
-        if self.npz_exists is False:
+        if self.result_exists is False:
             self.iterate()
         self.get_params()
         try:
             zoning = True if self.interpolation_method.currentText() == "Билинейная интерполяция" else False
             if self.mpc_use:
                 plot = MPCAnimation(self.anim_int, self.is_const_generation, self.x_size, self.y_size,
-                                    self.get_current_pdk(), zoning=zoning)
+                                    self.get_current_pdk(), zoning=zoning, result_path=self.result_path())
                 plot.draw_or_save()
             else:
                 plot = DefaultAnimation(self.anim_int, self.is_const_generation, self.x_size, self.y_size,
-                                        update_conc=self.update_conc, zoning=zoning)
+                                        update_conc=self.update_conc, zoning=zoning, result_path=self.result_path())
                 plot.draw_or_save()
         except Exception as e:
             logging.error(f"{e}")
@@ -434,22 +628,20 @@ class App(QWidget):
             if self.mpc_use:
                 saver = MPCAnimation(anim_int=self.anim_int, repeat=self.is_const_generation, x_size=self.x_size,
                                      y_size=self.y_size, mpc=self.get_current_pdk(), output_file=output,
-                                     zoning=zoning, progress_bar=self.progress_bar)
+                                     zoning=zoning, progress_bar=self.progress_bar, result_path=self.result_path())
                 saver.draw_or_save()
             else:
                 saver = DefaultAnimation(anim_int=self.anim_int, repeat=self.is_const_generation,
                                          x_size=self.x_size, y_size=self.y_size, output_file=output,
-                                         zoning=zoning, progress_bar=self.progress_bar)
+                                         zoning=zoning, progress_bar=self.progress_bar,
+                                         result_path=self.result_path())
                 saver.draw_or_save()
         except Exception as e:
             logging.error(f"{e}")
 
 
 if __name__ == '__main__':
-    logging.basicConfig(filename='app.log',
-                        level=logging.INFO,
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        datefmt='%d-%b-%y %H:%M:%S')
+    setup_logging()
     QApp = QApplication(sys.argv)
     app = App()
     sys.exit(QApp.exec_())
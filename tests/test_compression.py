@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from utils.Compression import QUANTIZE_MODES, CompressedStore, CompressedWriter
+from utils.Storage import LOD_REDUCTIONS, block_reduce
+
+
+def frames(count, shape=(64, 48)):
+    """Гладкий факел, который сдвигается и растёт не больше чем вчетверо"""
+    x, y = np.meshgrid(np.linspace(0, 1, shape[0]), np.linspace(0, 1, shape[1]), indexing="ij")
+    return [(50 + 10 * k) * np.exp(-((x - 0.2 - 0.05 * k) ** 2 + (y - 0.5) ** 2) / 0.02) + 1e-3 * np.sin(7 * x + k)
+            for k in range(count)]
+
+
+def write(path, data, **kwargs):
+    with CompressedWriter(path, **kwargs) as writer:
+        for it, frame in enumerate(data):
+            writer.append(frame, float(it))
+
+
+@pytest.mark.parametrize("quantize", QUANTIZE_MODES)
+def test_round_trip_error_bound(tmp_path, quantize):
+    data = frames(10)
+    write(str(tmp_path / "model"), data, quantize=quantize, rel_error=1e-4, keyframe=4)
+    with CompressedStore(str(tmp_path / "model")) as store:
+        assert len(store) == len(data)
+        assert store.meta["complete"]
+        assert store.times == [float(it) for it in range(len(data))]
+        for it, frame in enumerate(data):
+            error = np.max(np.abs(store.read(it) - frame))
+            # Граница ошибки записана в индексе для каждого кадра (половина шага)
+            bound = store.index["step"][it] / 2
+            assert error <= bound * (1 + 1e-9)
+            assert error <= store.max_error * (1 + 1e-9)
+            if quantize == "scaled":
+                assert error <= 1e-4 * np.abs(data[store.index["key"][it]]).max() * (1 + 1e-9)
+            elif quantize == "none":
+                assert error == 0
+        assert store.minima == pytest.approx([frame.min() for frame in data])
+        assert store.maxima == pytest.approx([frame.max() for frame in data])
+
+
+def test_keyframe_boundary(tmp_path):
+    data = frames(10)
+    write(str(tmp_path / "model"), data, keyframe=4)
+    with CompressedStore(str(tmp_path / "model")) as store:
+        assert list(store.index["key"]) == [0, 0, 0, 0, 4, 4, 4, 4, 8, 8]
+        # Чтение вразброс через границу опорных кадров (кэш опорного кадра сменяется)
+        for it in (5, 3, 4, 9, 1, 8, 7, 0):
+            assert np.max(np.abs(store.read(it) - data[it])) <= store.index["step"][it] / 2 * (1 + 1e-9)
+        assert np.allclose(store.frames[2:6], np.stack(data[2:6]), atol=2 * store.max_error)
+
+
+def test_keyframe_on_scale_change(tmp_path):
+    data = frames(3)
+    data.insert(2, data[1] * 10)
+    write(str(tmp_path / "model"), data, keyframe=16)
+    with CompressedStore(str(tmp_path / "model")) as store:
+        # Рост масштаба больше чем вчетверо начинает новый опорный кадр
+        assert list(store.index["key"]) == [0, 0, 2, 3]
+        for it, frame in enumerate(data):
+            assert np.max(np.abs(store.read(it) - frame)) <= store.index["step"][it] / 2 * (1 + 1e-9)
+
+
+@pytest.mark.parametrize("reduction", sorted(LOD_REDUCTIONS))
+def test_read_lod_levels(tmp_path, reduction):
+    data = frames(5, shape=(520, 300))
+    write(str(tmp_path / "model"), data, keyframe=2)
+    with CompressedStore(str(tmp_path / "model")) as store:
+        assert store.lod_factors == [1, 2, 4]
+        for factor in store.lod_factors:
+            for it, frame in enumerate(data):
+                expected = frame if factor == 1 else block_reduce(frame, factor, LOD_REDUCTIONS[reduction])
+                reduced = store.read(it, factor, reduction)
+                assert reduced.shape == (-(-520 // factor), -(-300 // factor))
+                assert np.max(np.abs(reduced - expected)) <= store.index["step"][it] / 2 * (1 + 1e-9)
+                if factor > 1:
+                    assert np.array_equal(store.lod[factor][reduction][it], reduced)
+
+
+def test_refresh_sees_appended_frames(tmp_path):
+    path = str(tmp_path / "model")
+    data = frames(6)
+    writer = CompressedWriter(path, keyframe=4)
+    for it in range(3):
+        writer.append(data[it], float(it))
+    with CompressedStore(path) as store:
+        assert len(store) == 3
+        assert not store.meta["complete"]
+        for it in range(3, 6):
+            writer.append(data[it], float(it))
+        assert len(store) == 3
+        store.refresh()
+        assert len(store) == 6
+        assert store.times == [float(it) for it in range(6)]
+        assert len(store.frames) == 6
+        for it in (5, 4, 2):
+            assert np.max(np.abs(store.read(it) - data[it])) <= store.index["step"][it] / 2 * (1 + 1e-9)
+        writer.close()
+        store.refresh()
+        assert store.meta["complete"]
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.Emission import EmissionSources, load_sources, save_sources
+
+
+def grid(dt=0.5):
+    # Ячейки 1 x 1 м, индексация [x, y]
+    return SimpleNamespace(x_size=10, y_size=8, x_steps=10, y_steps=8, dt=dt, field_shape=(10, 8))
+
+
+def injected_steps(emissions, steps=12):
+    """Шаги, на которых был выброс, и поле после них"""
+    c = np.zeros((10, 8))
+    due = [step for step in range(steps) if np.any(emissions.inject(c, step))]
+    return due, c
+
+
+def test_duplicate_cells_grouped():
+    emissions = EmissionSources()
+    emissions.add_point(2.5, 3.5, 1.0)
+    emissions.add_point(2.5, 3.5, 1.0)
+    emissions.add_point(2.2, 3.9, 2.0)
+    emissions.add_point(7.5, 1.5, 5.0)
+    emissions.add_point(7.5, 1.5, 0.5, period=2)
+    emissions.prepare(grid())
+    # Одно расписание - одна группа с уникальными ячейками
+    assert len(emissions._global_groups) == 2
+    index, weight = emissions._global_groups[0]
+    assert len(np.unique(index)) == len(index) == 2
+    assert sorted(weight) == [4.0, 5.0]
+
+    c = np.zeros((10, 8))
+    assert emissions.inject(c, 1) == pytest.approx(9.0)
+    assert c[2, 3] == 4.0 and c[7, 1] == 5.0
+    assert emissions.inject(c, 2) == pytest.approx(9.5)
+    assert c.sum() == pytest.approx(18.5)
+
+
+def test_start_stop_window():
+    emissions = EmissionSources()
+    # Шаг 0.5 с: начало на шаге 2, окончание на шаге 6 (не включая)
+    emissions.add_point(2.5, 3.5, 1.0, period=2, start=1.0, stop=3.0)
+    emissions.prepare(grid())
+    assert emissions.initial_field(grid()).sum() == 0
+    due, c = injected_steps(emissions)
+    assert due == [2, 4]
+    assert c[2, 3] == 2.0
+    assert emissions.last_change == 6
+    # Ограниченный по времени выброс не входит в установившийся режим
+    assert not emissions.mean_rate(80).any()
+
+
+def test_start_rounded_up_to_step():
+    emissions = EmissionSources()
+    emissions.add_point(2.5, 3.5, 1.0, period=3, start=0.7)
+    emissions.prepare(grid())
+    due, _ = injected_steps(emissions)
+    assert due == [2, 5, 8, 11]
+
+
+def test_one_shot():
+    emissions = EmissionSources()
+    emissions.add_point(2.5, 3.5, 1.0, period=0)
+    emissions.add_point(7.5, 1.5, 3.0, period=0, start=1.5)
+    emissions.prepare(grid())
+    assert emissions.cycle == 1
+    # Выброс в момент 0 входит в начальное поле и больше не повторяется
+    initial = emissions.initial_field(grid())
+    assert initial[2, 3] == 1.0 and initial.sum() == 1.0
+    due, c = injected_steps(emissions)
+    assert due == [3]
+    assert c[7, 1] == 3.0 and c.sum() == 3.0
+    assert not emissions.mean_rate(80).any()
+
+
+def test_cycle_and_mean_rate():
+    emissions = EmissionSources()
+    emissions.add_point(2.5, 3.5, 6.0, period=2)
+    emissions.add_point(2.5, 3.5, 3.0, period=3)
+    emissions.prepare(grid())
+    assert emissions.repeating
+    assert emissions.cycle == 6
+    rate = emissions.mean_rate(80)
+    assert rate[2 * 8 + 3] == pytest.approx(4.0)
+    assert rate.sum() == pytest.approx(4.0)
+
+
+def test_line_and_area_totals():
+    emissions = EmissionSources()
+    emissions.add_line([(0.5, 0.5), (6.5, 0.5), (6.5, 4.5)], 2.0)
+    emissions.add_area([(2, 2), (6, 2), (6, 6), (2, 6)], 0.5)
+    emissions.prepare(grid())
+    c = np.zeros((10, 8))
+    # Линия: мощность на метр длины (10 м), площадь: на м2 (16 м2)
+    assert emissions.inject(c, 1) == pytest.approx(2.0 * 10 + 0.5 * 16)
+    assert c.sum() == pytest.approx(28.0)
+
+
+SOURCES = [
+    {"x": 2.5, "y": 3.5, "concentration": 10.0, "frequency": 1},
+    {"x": 7.25, "y": 1.5, "concentration": 2.5, "frequency": 0, "start": 1.5},
+    {"type": "line", "points": [[0.5, 0.5], [6.5, 0.5], [6.5, 4.5]], "concentration": 2.0, "frequency": 4,
+     "start": 1.0, "stop": 30.0},
+    {"type": "area", "polygon": [[2.0, 2.0], [6.0, 2.0], [6.0, 6.0], [2.0, 6.0]], "concentration": 0.5,
+     "frequency": 2},
+]
+
+
+@pytest.mark.parametrize("name", ["sources.csv", "sources.geojson"])
+def test_save_load_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    save_sources(path, SOURCES)
+    loaded = load_sources(path)
+    assert loaded.to_config() == EmissionSources.from_config(SOURCES).to_config() == SOURCES
+
+    reference = EmissionSources.from_config(SOURCES)
+    reference.prepare(grid())
+    loaded.prepare(grid())
+    for (index, weight), (expected_index, expected_weight) in zip(loaded._global_groups, reference._global_groups):
+        assert np.array_equal(index, expected_index)
+        assert weight == pytest.approx(expected_weight)
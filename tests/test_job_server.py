@@ -0,0 +1,36 @@
+import time
+
+from utils.JobServer import JobQueue
+
+PROJECT = dict(x_size="100", y_size="100", t="2500", x_step="1", y_step="1", t_step="0.1", dx="0.5", dy="0.5",
+               wind_u="1", wind_v="0", intensity="50", save_name="5")
+# Однократный выброс: установления нет, расчёт идёт до отмены
+SPEC = {"project": PROJECT, "conditions": {"sources": [{"x": 30, "y": 50, "concentration": 5.0, "frequency": 0}]}}
+
+
+def wait_running(jobs, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with jobs._condition:
+            if job_id in jobs._processes:
+                return
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not start")
+
+
+def test_duplicate_submit_while_running(tmp_path):
+    jobs = JobQueue(str(tmp_path), workers=1)
+    try:
+        job, created = jobs.submit(SPEC)
+        assert created
+        wait_running(jobs, job["id"])
+
+        duplicate, created = jobs.submit(dict(SPEC, priority=5))
+        assert not created
+        assert duplicate is job
+        assert duplicate["state"] == "running"
+
+        jobs.cancel(job["id"])
+        assert jobs.status(job["id"])["state"] == "cancelled"
+    finally:
+        jobs.close()
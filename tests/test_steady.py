@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from utils.Emission import EmissionSources
+from utils.Model import Model
+from utils.Steady import _factor_cache, solve_steady, transport_matrix
+
+BOUNDARIES = ["Dirihle", "Neumann", "Periodic", "Outflow"]
+# Через периодические границы масса не уходит, через Neumann - медленно: нужен распад
+DECAY = {"Neumann": [{"decay": 0.2}], "Periodic": [{"decay": 0.2}]}
+
+
+class LastFields:
+    """Хранит поля последних count шагов"""
+
+    def __init__(self, count):
+        self.count = count
+        self.fields = []
+
+    def start(self, model):
+        pass
+
+    def update(self, c, time, dt):
+        self.fields = (self.fields + [c.copy()])[-self.count:]
+
+    def finish(self, model):
+        pass
+
+
+def model(conditions, t=1, period=1, species=None, observers=None):
+    emissions = EmissionSources()
+    emissions.add_point(6, 8, 10.0, period=period)
+    return Model(None, 24, 16, 24, 16, t, 0.5, 0.5, 1, 1, 0.1, 1, 0.3, 0, conditions=conditions,
+                 emissions=emissions, species=species, observers=observers)
+
+
+@pytest.mark.parametrize("conditions", BOUNDARIES)
+def test_transport_matrix_matches_step(conditions):
+    rng = np.random.default_rng(1)
+    c = rng.random((24, 16))
+    # Ветер разных знаков: у Outflow часть границ входящая, часть выходящая
+    x, y = np.meshgrid(np.arange(24), np.arange(16), indexing="ij")
+    u, v = 0.5 * np.sin(x / 4 + y / 5), 0.4 * np.cos(y / 3)
+    stepped = Model(c, 24, 16, 24, 16, 0.1, 0.5, 0.5, 1, 1, 0.1, u, v, 0, conditions=conditions,
+                    check_stable=False)
+    matrix = transport_matrix(stepped)
+    stepped.iterate()
+    expected = stepped.base
+    assert np.max(np.abs(matrix @ c.reshape(-1) - expected.reshape(-1))) <= 1e-14 * np.max(np.abs(expected))
+    if conditions != "Dirihle":
+        direct = stepped._step(c)
+        assert np.max(np.abs(matrix @ c.reshape(-1) - direct.reshape(-1))) <= 1e-14 * np.max(np.abs(direct))
+
+
+@pytest.mark.parametrize("method", ["lu", "bicgstab"])
+@pytest.mark.parametrize("period", [1, 3])
+@pytest.mark.parametrize("conditions", BOUNDARIES)
+def test_solve_steady_matches_time_stepping(conditions, period, method):
+    last = LastFields(period)
+    stepped = model(conditions, t=200, period=period, species=DECAY.get(conditions), observers=[last])
+    stepped.iterate()
+    # При периодических выбросах решение - среднее поле за период
+    expected = np.mean(last.fields, axis=0)
+    solved = solve_steady(model(conditions, period=period, species=DECAY.get(conditions)), method, tol=1e-14)
+    assert solved.shape == expected.shape
+    assert np.max(np.abs(solved - expected)) <= 1e-14 * np.max(np.abs(expected))
+
+
+def test_factorization_reused_for_new_sources():
+    _factor_cache.clear()
+    first = solve_steady(model("Outflow"))
+    assert len(_factor_cache) == 1
+    shifted = model("Outflow")
+    shifted.emissions = EmissionSources()
+    shifted.emissions.add_point(10, 4, 10.0)
+    shifted.emissions.prepare(shifted)
+    second = solve_steady(shifted)
+    assert len(_factor_cache) == 1
+    assert not np.allclose(first, second)
+
+
+def test_periodic_without_decay_raises():
+    with pytest.raises(ValueError, match="Steady state does not exist"):
+        solve_steady(model("Periodic"))
+
+
+def test_moving_window_not_supported():
+    emissions = EmissionSources()
+    emissions.add_point(6, 8, 10.0)
+    windowed = Model(None, 24, 16, 24, 16, 1, 0.5, 0.5, 1, 1, 0.1, 1, 0.3, 0, emissions=emissions, window=(12, 12))
+    with pytest.raises(ValueError, match="moving window"):
+        solve_steady(windowed)
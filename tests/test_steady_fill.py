@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from utils.Compression import CompressedStore, CompressedWriter
+from utils.Emission import EmissionSources
+from utils.Model import Model
+from utils.Storage import ResultStore, ResultWriter
+
+
+def run(steady_check, writers=None, snapshot_tol=0, conditions="Dirihle", observers=None, steady_tol=1e-6):
+    emissions = EmissionSources()
+    emissions.add_point(8, 20, 50.0, period=3)
+    model = Model(None, 40, 40, 40, 40, 150, 0.5, 0.5, 1, 1, 0.1, 1, 0, 7, emissions=emissions,
+                  writers=writers, steady_check=steady_check, snapshot_tol=snapshot_tol, conditions=conditions,
+                  observers=observers, steady_tol=steady_tol)
+    model.iterate()
+    return model
+
+
+class CancelAfterSteady:
+    """Отменяет расчёт, пока после установления досчитываются фазы периода"""
+
+    def start(self, model):
+        self.model = model
+
+    def update(self, c, time, dt):
+        if self.model.steady_time is not None:
+            self.model.cancel()
+
+    def finish(self, model):
+        pass
+
+
+def assert_frames_close(frames, reference, rel=1e-4):
+    assert len(frames) == len(reference)
+    for frame, expected in zip(frames, reference):
+        assert np.max(np.abs(frame - expected)) <= rel * np.max(np.abs(expected))
+
+
+def test_periodic_fill_matches_full_run():
+    full = run(0)
+    early = run(100)
+    assert early.steady_step is not None and early.steady_step < full.time_steps - 1
+    assert early.slice_times == pytest.approx(full.slice_times)
+    assert_frames_close(early.c_list, full.c_list)
+    assert_frames_close([early.c], [full.c])
+
+
+def test_periodic_fill_adaptive_snapshots():
+    full = run(0, snapshot_tol=1e-3)
+    early = run(100, snapshot_tol=1e-3)
+    assert early.steady_step is not None
+    assert early.slice_times == pytest.approx(full.slice_times)
+    assert_frames_close(early.c_list, full.c_list)
+
+
+@pytest.mark.parametrize("writer, store", [
+    (lambda path: ResultWriter(path), ResultStore),
+    (lambda path: CompressedWriter(path, quantize="none"), CompressedStore),
+])
+def test_periodic_fill_writers(tmp_path, writer, store):
+    full = run(0)
+    path = str(tmp_path / "model")
+    with writer(path) as result:
+        early = run(100, writers=[result])
+    assert early.steady_step is not None
+    with store(path) as result:
+        assert result.times == pytest.approx(full.slice_times)
+        assert_frames_close([result.read(i) for i in range(len(result))], full.c_list)
+
+
+@pytest.mark.parametrize("conditions", ["Neumann", "Outflow"])
+def test_fill_matches_full_run_open_boundaries(conditions):
+    full = run(0, conditions=conditions)
+    early = run(100, conditions=conditions)
+    assert early.slice_times == pytest.approx(full.slice_times)
+    assert_frames_close(early.c_list, full.c_list)
+    assert_frames_close([early.c], [full.c])
+
+
+def test_slow_growth_within_tolerance():
+    # При нулевом градиенте на входящем крае масса растёт весь расчёт: изменение
+    # за steady_check шагов мало (~5e-5 от поля), но за расчёт накапливается
+    full = run(0, conditions="Neumann")
+    early = run(100, conditions="Neumann", steady_tol=1e-4)
+    assert early.slice_times == pytest.approx(full.slice_times)
+    assert_frames_close(early.c_list, full.c_list, rel=1e-4)
+
+
+def test_cancel_after_steady_skips_fill():
+    model = run(100, observers=[CancelAfterSteady()])
+    assert model.cancelled
+    assert model.steady_time is not None and model.steady_step is None
+    assert model.slice_times[-1] < model.steady_time + 3 * model.dt
+    assert len(model.c_list) == len(model.slice_times)
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import sqlite3
+
+from PyQt5.QtCore import QAbstractListModel, QAbstractTableModel, QModelIndex, QStringListModel, Qt, pyqtSignal
+from PyQt5.QtWidgets import QCompleter
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = "substances.db"
+SOURCE_PATH = "substances.json"
+# Строк, загружаемых моделью за один раз, и подсказок в списке поиска
+PAGE_SIZE = 256
+SEARCH_LIMIT = 50
+COLUMNS = ("name", "cas", "pdk", "pdk_work")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS substances (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL UNIQUE,
+    cas TEXT,
+    pdk REAL,
+    pdk_work REAL
+);
+CREATE INDEX IF NOT EXISTS substances_cas ON substances (cas);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def name_key(name):
+    # SQLite приводит к нижнему регистру только латиницу, поэтому ключ считается в Python
+    return name.strip().casefold()
+
+
+class SubstanceCatalog:
+    """Справочник ПДК в локальной базе SQLite.
+
+    Источник данных - substances.json: база пересоздаётся из него, если
+    файл изменился (по размеру и времени изменения). Поиск по названию и
+    CAS идёт по индексам. Изменения копятся в транзакции до commit(),
+    export_json() записывает справочник обратно в JSON.
+    """
+
+    def __init__(self, path=CATALOG_PATH, source=SOURCE_PATH):
+        self.path = path
+        self.source = source
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.sync()
+
+    def _source_stamp(self):
+        stat = os.stat(self.source)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def sync(self):
+        """Импортирует JSON, если он изменился после последнего импорта"""
+        if not os.path.isfile(self.source):
+            logger.error(f"File {self.source} is not found")
+            return False
+        stamp = self._source_stamp()
+        if self._meta("source_stamp") == stamp:
+            return False
+        with open(self.source, "r", encoding="utf-8") as f:
+            substances = json.load(f).get("substances", [])
+        rows = {}
+        for substance in substances:
+            # Повторы названий (без учёта регистра) схлопываются в последнюю запись
+            rows[name_key(substance["name"])] = (substance["name"].strip(), name_key(substance["name"]),
+                                                 substance.get("cas"), substance.get("pdk"),
+                                                 substance.get("pdk_work"))
+        with self.connection:
+            self.connection.execute("DELETE FROM substances")
+            self.connection.executemany(
+                "INSERT INTO substances (name, name_key, cas, pdk, pdk_work) VALUES (?, ?, ?, ?, ?)", rows.values())
+            self._set_meta("source_stamp", stamp)
+        logger.info(f"Imported {len(rows)} substances from {self.source}")
+        return True
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM substances").fetchone()[0]
+
+    def ids(self, text=""):
+        """id веществ, название или CAS которых содержит text, по алфавиту"""
+        key = name_key(text)
+        if not key:
+            query = self.connection.execute("SELECT id FROM substances ORDER BY name_key")
+        else:
+            query = self.connection.execute(
+                "SELECT id FROM substances WHERE instr(name_key, ?) > 0 OR instr(lower(cas), ?) > 0 "
+                "ORDER BY name_key", (key, key))
+        return [row[0] for row in query]
+
+    def rows(self, ids):
+        """{id: (название, CAS, ПДК, ПДК рабочей зоны)}"""
+        ids = list(ids)
+        placeholders = ",".join("?" * len(ids))
+        query = self.connection.execute(
+            f"SELECT id, name, cas, pdk, pdk_work FROM substances WHERE id IN ({placeholders})", ids)
+        return {row[0]: row[1:] for row in query}
+
+    def names(self, offset, limit):
+        query = self.connection.execute("SELECT name FROM substances ORDER BY name_key LIMIT ? OFFSET ?",
+                                        (limit, offset))
+        return [row[0] for row in query]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Названия для подсказки: сначала начинающиеся с text, затем содержащие его"""
+        key = name_key(text)
+        if not key:
+            return self.names(0, limit)
+        # Диапазон по индексу name_key вместо LIKE: поиск по префиксу без просмотра таблицы
+        names = [row[0] for row in self.connection.execute(
+            "SELECT name FROM substances WHERE name_key >= ? AND name_key < ? ORDER BY name_key LIMIT ?",
+            (key, key + "\uffff", limit))]
+        names += [row[0] for row in self.connection.execute(
+            "SELECT name FROM substances WHERE cas >= ? AND cas < ? ORDER BY name_key LIMIT ?",
+            (text.strip(), text.strip() + "\uffff", limit - len(names)))]
+        if len(names) < limit:
+            names += [row[0] for row in self.connection.execute(
+                "SELECT name FROM substances WHERE instr(name_key, ?) > 1 ORDER BY name_key LIMIT ?",
+                (key, limit - len(names)))]
+        return list(dict.fromkeys(names))
+
+    def limits(self, name):
+        """(ПДК, ПДК рабочей зоны) вещества или (None, None)"""
+        row = self.connection.execute("SELECT pdk, pdk_work FROM substances WHERE name_key = ?",
+                                      (name_key(name),)).fetchone()
+        return row if row else (None, None)
+
+    def add(self, name, cas=None, pdk=0.0, pdk_work=0.0):
+        cursor = self.connection.execute(
+            "INSERT INTO substances (name, name_key, cas, pdk, pdk_work) VALUES (?, ?, ?, ?, ?)",
+            (name.strip(), name_key(name), cas, pdk, pdk_work))
+        return cursor.lastrowid
+
+    def unique_name(self, base):
+        name, number = base, 1
+        while self.limits(name) != (None, None):
+            number += 1
+            name = f"{base} {number}"
+        return name
+
+    def update(self, substance_id, column, value):
+        """Меняет поле вещества; sqlite3.IntegrityError при повторе названия"""
+        if column == "name":
+            self.connection.execute("UPDATE substances SET name = ?, name_key = ? WHERE id = ?",
+                                    (value.strip(), name_key(value), substance_id))
+        elif column in COLUMNS:
+            self.connection.execute(f"UPDATE substances SET {column} = ? WHERE id = ?", (value, substance_id))
+        else:
+            raise ValueError(f"Unknown column: {column}")
+
+    def delete(self, substance_id):
+        self.connection.execute("DELETE FROM substances WHERE id = ?", (substance_id,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def export_json(self, path=None):
+        """Записывает справочник в JSON, остальные ключи файла сохраняются"""
+        path = path or self.source
+        data = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        data["substances"] = []
+        for name, cas, pdk, pdk_work in self.connection.execute(
+                "SELECT name, cas, pdk, pdk_work FROM substances ORDER BY name_key"):
+            substance = {"name": name, "pdk": pdk, "pdk_work": pdk_work}
+            if cas:
+                substance["cas"] = cas
+            data["substances"].append(substance)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+        if path == self.source:
+            # Свой экспорт не требует повторного импорта
+            with self.connection:
+                self._set_meta("source_stamp", self._source_stamp())
+
+    def close(self):
+        self.connection.close()
+
+
+class SubstanceTableModel(QAbstractTableModel):
+    """Таблица веществ для QTableView.
+
+    Модель хранит только id строк текущего фильтра; строки читаются из базы
+    страницами по PAGE_SIZE при прокрутке (canFetchMore/fetchMore).
+    Правка ячейки сразу пишется в базу, ошибки передаются сигналом error.
+    """
+
+    HEADERS = ("Название", "CAS", "ПДК", "ПДК рабочей зоны")
+    error = pyqtSignal(str)
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self._ids = []
+        self._loaded = 0
+        self._pages = {}
+        self.set_filter("")
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._ids = self.catalog.ids(text)
+        self._loaded = min(PAGE_SIZE, len(self._ids))
+        self._pages.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._ids)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(PAGE_SIZE, len(self._ids) - self._loaded)
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def substance_id(self, row):
+        return self._ids[row]
+
+    def _row(self, row):
+        page = row // PAGE_SIZE
+        if page not in self._pages:
+            ids = self._ids[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+            rows = self.catalog.rows(ids)
+            self._pages[page] = [rows.get(substance_id, ("", None, None, None)) for substance_id in ids]
+        return self._pages[page][row % PAGE_SIZE]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        value = self._row(index.row())[index.column()]
+        if value is None:
+            return ""
+        return value if role == Qt.EditRole or isinstance(value, str) else f"{value:g}"
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        column = COLUMNS[index.column()]
+        text = str(value).strip()
+        if column == "name" and not text:
+            self.error.emit("Название вещества не может быть пустым")
+            return False
+        if column in ("pdk", "pdk_work"):
+            try:
+                text = float(text.replace(",", "."))
+            except ValueError:
+                self.error.emit("ПДК должны быть числовыми значениями")
+                return False
+        try:
+            # Пустой текст (CAS) хранится как NULL; числовое 0 - значение ПДК
+            self.catalog.update(self._ids[index.row()], column, None if text == "" else text)
+        except sqlite3.IntegrityError:
+            self.error.emit(f"Вещество '{text}' уже существует")
+            return False
+        self._pages.pop(index.row() // PAGE_SIZE, None)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def insert_substance(self, substance_id):
+        """Новое вещество показывается первой строкой независимо от фильтра"""
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._ids.insert(0, substance_id)
+        self._loaded += 1
+        self._pages.clear()
+        self.endInsertRows()
+
+    def remove_substance(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self._ids.pop(row)
+        self._loaded -= 1
+        self._pages.clear()
+        self.endRemoveRows()
+
+
+class SubstanceListModel(QAbstractListModel):
+    """Названия веществ для QComboBox, подгружаемые страницами"""
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self._names = []
+        self._total = 0
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self._total = self.catalog.count()
+        self._names = self.catalog.names(0, PAGE_SIZE)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._names)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._names) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        names = self.catalog.names(len(self._names), PAGE_SIZE)
+        if not names:
+            self._total = len(self._names)
+            return
+        self.beginInsertRows(QModelIndex(), len(self._names), len(self._names) + len(names) - 1)
+        self._names.extend(names)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self._names[index.row()]
+        return None
+
+
+class SubstanceCompleter(QCompleter):
+    """Подсказка веществ при вводе: каждый символ - запрос к индексу базы"""
+
+    def __init__(self, catalog, limit=SEARCH_LIMIT, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.limit = limit
+        self.matches = QStringListModel(self)
+        self.setModel(self.matches)
+        # Отбор уже сделан базой, QCompleter только показывает результат
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.setCaseSensitivity(Qt.CaseInsensitive)
+
+    def splitPath(self, path):
+        self.matches.setStringList(self.catalog.search(path, self.limit))
+        return [path]
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from utils.Storage import (LOD_REDUCTIONS, RESULT_PATH, FrameSequence, block_reduce, embed, lod_levels,
+                           params_hash)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# Типы данных блоков: код в индексе -> dtype
+CODES = [np.dtype(t) for t in ("<f8", "<f4", "<f2", "i1", "<i2", "<i4", "<i8")]
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"), ("length", "<u4"), ("code", "u1"), ("key", "<i4"),
+    ("step", "<f8"), ("time", "<f8"), ("min", "<f8"), ("max", "<f8"), ("window", "<i4", (2,)),
+])
+QUANTIZE_MODES = ("scaled", "float32", "float16", "none")
+
+
+def _narrow(values):
+    # Наименьший целый тип, вмещающий значения
+    low, high = (int(values.min()), int(values.max())) if values.size else (0, 0)
+    for code in (3, 4, 5):
+        info = np.iinfo(CODES[code])
+        if info.min <= low and high <= info.max:
+            return code, values.astype(CODES[code])
+    return 6, values.astype(np.int64)
+
+
+class CompressedWriter:
+    """Сжатый результат с произвольным доступом к кадрам.
+
+    Каждый кадр - отдельный блок zlib в <path>.rz, запись индекса фиксированного
+    размера (смещение, длина, время, min/max, шаг квантования) дописывается
+    в <path>.rz.idx после данных, поэтому файл можно читать во время записи.
+    Заголовок <path>.rz.json хранит сетку, хэш параметров и режим сжатия.
+
+    В режиме "scaled" значения округляются до шага 2 * rel_error * max|опорного
+    кадра| (ошибка не больше половины шага, шаг записан для каждого кадра),
+    кадры между опорными хранятся разностью с опорным: любой кадр
+    восстанавливается не более чем из двух блоков. "float32"/"float16" -
+    приведение типа, "none" - без потерь.
+    """
+
+    def __init__(self, path=RESULT_PATH, quantize="scaled", rel_error=1e-4, keyframe=16, level=1,
+                 params=None, channel=None):
+        if quantize not in QUANTIZE_MODES:
+            raise ValueError(f"Unknown quantization: {quantize}")
+        self.path = path
+        self.quantize = quantize
+        self.rel_error = rel_error
+        self.keyframe = keyframe
+        self.level = level
+        self.channel = channel
+        self.params_hash = params_hash(params) if params is not None else None
+        self.shape = None
+        self.domain = None
+        self.steady_time = None
+        self.frames = 0
+        self._offset = 0
+        self._last = None
+        self._key = -1
+        self._key_q = None
+        self._key_scale = 0.0
+        self._step = 0.0
+        self._data = open(path + ".rz", "wb")
+        self._index = open(path + ".rz.idx", "wb")
+
+    def _write_header(self, complete=False):
+        header = {
+            "version": FORMAT_VERSION,
+            "shape": list(self.shape or ()),
+            "domain": self.domain,
+            "quantize": self.quantize,
+            "rel_error": self.rel_error,
+            "keyframe": self.keyframe,
+            "params_hash": self.params_hash,
+            "complete": complete,
+            "steady_time": self.steady_time,
+        }
+        tmp_path = self.path + ".rz.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self.path + ".rz.json")
+
+    def _encode(self, frame):
+        # Для вещественных форматов в поле step пишется граница ошибки округления (удвоенная)
+        if self.quantize == "float32":
+            return 1, -1, float(np.abs(frame).max()) * np.finfo(np.float32).eps, frame.astype(np.float32)
+        if self.quantize == "float16":
+            return 2, -1, float(np.abs(frame).max()) * np.finfo(np.float16).eps, frame.astype(np.float16)
+        if self.quantize == "none":
+            return 0, -1, 0.0, frame
+
+        scale = float(np.abs(frame).max())
+        # Новый опорный кадр: по интервалу или если масштаб поля изменился больше чем вчетверо
+        if (self._key_q is None or self.frames - self._key >= self.keyframe
+                or not self._key_scale / 4 <= scale <= self._key_scale * 4):
+            self._key = self.frames
+            self._key_scale = scale
+            self._step = 2 * self.rel_error * scale
+            self._key_q = np.rint(frame / self._step).astype(np.int64) if self._step else \
+                np.zeros(frame.shape, dtype=np.int64)
+            code, values = _narrow(self._key_q)
+            return code, self._key, self._step, values
+        q = np.rint(frame / self._step).astype(np.int64)
+        code, values = _narrow(q - self._key_q)
+        return code, self._key, self._step, values
+
+    def append(self, frame, time=None, offset=None, domain=None):
+        if self.channel is not None:
+            frame = frame[self.channel]
+        frame = np.ascontiguousarray(frame, dtype=np.float64)
+        if self.shape is None:
+            self.shape = list(frame.shape)
+            self.domain = [int(size) for size in domain] if domain is not None else None
+            self._write_header()
+        elif list(frame.shape) != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from {tuple(self.shape)}")
+
+        code, key, step, values = self._encode(frame)
+        chunk = zlib.compress(values.tobytes(), self.level)
+        self._data.write(chunk)
+        self._data.flush()
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record[0] = (self._offset, len(chunk), code, key, step, np.nan if time is None else time,
+                     frame.min(), frame.max(), offset if offset is not None else (0, 0))
+        self._offset += len(chunk)
+        self._write_record(record)
+
+    def _write_record(self, record):
+        # Запись индекса после данных: читатель не увидит незаписанный блок
+        self._index.write(record.tobytes())
+        self._index.flush()
+        self._last = record
+        self.frames += 1
+
+    def repeat_steady(self, phases, order, times, steady_time=None):
+        """Кадры после установления: фаза phases[order[i]] сжимается при первом
+        появлении, следующие её кадры ссылаются на тот же блок"""
+        if self._last is None:
+            return
+        window = tuple(self._last[0]["window"]) if self.domain else None
+        records = {}
+        for phase, time in zip(order, times):
+            if phase in records:
+                record = records[phase].copy()
+                record["time"] = time
+                self._write_record(record)
+            else:
+                self.append(phases[phase], time, offset=window, domain=self.domain)
+                records[phase] = self._last.copy()
+        self.steady_time = steady_time
+
+    def __len__(self):
+        return self.frames
+
+    def close(self):
+        if self._data.closed:
+            return
+        self._data.close()
+        self._index.close()
+        self._write_header(complete=True)
+        size = os.path.getsize(self.path + ".rz")
+        logger.info(f"Saved {self.frames} compressed frames to {self.path}.rz ({size / 1e6:.2f} MB)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _DecodedFrames(FrameSequence):
+    def __init__(self, store):
+        self.store = store
+
+    @property
+    def shape(self):
+        return (len(self.store),) + self.store.shape
+
+    def _frame(self, it):
+        return self.store.read(it)
+
+
+class _ReducedFrames(FrameSequence):
+    # Уровень детализации считается из восстановленного кадра при чтении
+    def __init__(self, store, factor, reduction):
+        self.store = store
+        self.factor = factor
+        self.reduction = reduction
+
+    @property
+    def shape(self):
+        return (len(self.store),) + tuple(-(-size // self.factor) for size in self.store.shape)
+
+    def _frame(self, it):
+        return self.store.read(it, self.factor, self.reduction)
+
+
+class CompressedStore:
+    """Чтение сжатого результата; тот же интерфейс, что у ResultStore.
+
+    Индекс перечитывается методом refresh(), поэтому кадры, дописанные
+    во время расчёта, становятся доступны без повторного открытия.
+    """
+
+    def __init__(self, path=RESULT_PATH):
+        self.path = path
+        self.data_path = path + ".rz"
+        self._lock = threading.Lock()
+        self._file = open(self.data_path, "rb")
+        self._key_cache = (None, None)
+        self.refresh()
+
+        self.frames = _DecodedFrames(self)
+        # Уровни считаются из кадра, вложенного в полную область, поэтому зависят от её размера
+        self.lod = {factor: {reduction: _ReducedFrames(self, factor, reduction) for reduction in LOD_REDUCTIONS}
+                    for factor in lod_levels(self.shape[-2:])}
+
+    def refresh(self):
+        with open(self.path + ".rz.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._grid = tuple(self.meta["shape"])
+        self.shape = tuple(self.meta["domain"]) if self.meta.get("domain") else self._grid
+        self.steady_time = self.meta.get("steady_time")
+        raw = np.fromfile(self.path + ".rz.idx", dtype=np.uint8)
+        # Незавершённая последняя запись пропускается
+        self.index = raw[:len(raw) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+        self.times = [None if np.isnan(time) else float(time) for time in self.index["time"]]
+        self.minima = self.index["min"].copy()
+        self.maxima = self.index["max"].copy()
+        if self.meta.get("domain"):
+            self.minima = np.minimum(self.minima, 0.0)
+
+    @staticmethod
+    def exists(path=RESULT_PATH):
+        return os.path.isfile(path + ".rz.json") and os.path.isfile(path + ".rz.idx")
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, record):
+        with self._lock:
+            self._file.seek(int(record["offset"]))
+            data = self._file.read(int(record["length"]))
+        values = np.frombuffer(zlib.decompress(data), dtype=CODES[record["code"]])
+        return values.reshape(self._grid)
+
+    def _key_values(self, key):
+        cached_key, values = self._key_cache
+        if cached_key != key:
+            values = self._chunk(self.index[key]).astype(np.int64)
+            self._key_cache = (key, values)
+        return values
+
+    def read(self, it, factor=1, reduction="mean"):
+        record = self.index[it]
+        values = self._chunk(record)
+        if record["key"] < 0:
+            frame = values.astype(np.float64)
+        elif record["key"] == it or self.index[record["key"]]["offset"] == record["offset"]:
+            frame = values * record["step"]
+        else:
+            frame = (self._key_values(int(record["key"])) + values) * record["step"]
+        if self.meta.get("domain"):
+            frame = embed(frame, tuple(record["window"]), self.shape)
+        if factor == 1:
+            return frame
+        return block_reduce(frame, factor, LOD_REDUCTIONS[reduction])
+
+    @property
+    def lod_factors(self):
+        return [1] + sorted(self.lod)
+
+    @property
+    def global_max(self):
+        return float(self.maxima.max()) if len(self.maxima) else 0.0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def max_error(self):
+        """Наибольшая ошибка квантования по кадрам (половина шага)"""
+        return float(self.index["step"].max() / 2) if len(self.index) else 0.0
@@ -1,9 +1,28 @@
+import logging
+from collections import defaultdict
+
 from PyQt5 import QtGui
 from PyQt5.QtWidgets import (QVBoxLayout, QDialog, QLabel, QLineEdit, QDialogButtonBox, QHBoxLayout, QPushButton,
-                             QSpinBox, QMessageBox, QGraphicsSimpleTextItem)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPen, QColor, QFont, QBrush
-from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsEllipseItem
+                             QSpinBox, QMessageBox, QGraphicsItem, QStyleOptionGraphicsItem, QFileDialog, QRubberBand)
+from PyQt5.QtCore import Qt, QLineF, QPointF, QRect, QRectF, QSize
+from PyQt5.QtGui import QPen, QColor, QFont, QBrush, QPainter
+from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene
+
+from utils.Emission import load_sources, save_sources
+
+logger = logging.getLogger(__name__)
+
+# Шаги сетки (м): берётся наименьший, при котором линии не ближе MIN_GRID_PIXELS на экране
+GRID_STEPS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MIN_GRID_PIXELS = 8
+# Подписи ставятся на линиях сетки, разнесённых на экране не меньше чем на столько пикселей
+MIN_LABEL_PIXELS = 50
+# Наибольшее увеличение колесом мыши и наибольший начальный размер карты (пиксели)
+MAX_ZOOM = 8
+MAX_VIEW_SIZE = 800
+# Радиус поиска источника под курсором (пиксели экрана)
+PICK_RADIUS = 10
+SOURCE_FILTER = "Источники (*.csv *.geojson *.json)"
 
 
 class MapSizeDialog(QDialog):
@@ -36,7 +55,173 @@ class MapSizeDialog(QDialog):
         return self.size_input.value(), self.resolution_input.value()
 
 
+class SourceLayer(QGraphicsItem):
+    """Все маркеры источников одним элементом сцены.
+
+    Источники разложены по квадратам BUCKET x BUCKET пикселей, paint рисует
+    только попавшие в перерисовываемую область. Число элементов сцены не
+    зависит от числа источников. Маркеры одного размера на экране при
+    любом масштабе вида (zoom). Те же квадраты служат индексом для поиска
+    ближайшего источника и выделения прямоугольником; массовые изменения
+    (extend, remove_many) перерисовывают слой один раз.
+    """
+
+    BUCKET = 64
+    SAVED_RADIUS = 6
+    TEMP_RADIUS = 4
+    LABEL_WIDTH = 40
+
+    def __init__(self, pixels):
+        super().__init__()
+        self.pixels = pixels
+        self.sources = []
+        self.temp = None
+        self.selected = set()
+        self.zoom = 1.0
+        self._buckets = defaultdict(list)
+        self.font = QFont("Arial", 8)
+        # exposedRect в paint - только перерисовываемая часть
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        margin = (self.SAVED_RADIUS + 2) / self.zoom
+        return QRectF(-margin, -margin, self.pixels + 2 * margin + self.LABEL_WIDTH / self.zoom,
+                      self.pixels + 2 * margin)
+
+    def set_zoom(self, zoom):
+        self.prepareGeometryChange()
+        self.zoom = zoom
+        self.update()
+
+    def _bucket(self, source):
+        x, y = source['pos']
+        return int(x // self.BUCKET), int((self.pixels - y) // self.BUCKET)
+
+    def _marker_rect(self, source):
+        # Область маркера и подписи на сцене (ось Y сцены направлена вверх)
+        x, y = source['pos']
+        r = (self.SAVED_RADIUS + 2) / self.zoom
+        return QRectF(x - r, self.pixels - y - r, 2 * r + self.LABEL_WIDTH / self.zoom, 2 * r)
+
+    def add(self, source):
+        self.sources.append(source)
+        self._buckets[self._bucket(source)].append(source)
+        self.update(self._marker_rect(source))
+
+    def remove(self, source):
+        self.remove_many([source])
+
+    def extend(self, sources):
+        for source in sources:
+            self.sources.append(source)
+            self._buckets[self._bucket(source)].append(source)
+        self.update()
+
+    def remove_many(self, sources):
+        removed = {id(source) for source in sources}
+        self.sources[:] = [source for source in self.sources if id(source) not in removed]
+        for key in {self._bucket(source) for source in sources}:
+            self._buckets[key] = [source for source in self._buckets[key] if id(source) not in removed]
+        self.selected -= removed
+        if len(sources) == 1:
+            self.update(self._marker_rect(sources[0]))
+        else:
+            self.update()
+
+    def scene_pos(self, source):
+        x, y = source['pos']
+        return x, self.pixels - y
+
+    def nearest(self, point, radius):
+        """Ближайший к точке сцены источник не дальше radius или None"""
+        x, y = point.x(), point.y()
+        best, best_distance = None, radius * radius
+        for source in self.in_rect(QRectF(x - radius, y - radius, 2 * radius, 2 * radius), margin=radius):
+            sx, sy = self.scene_pos(source)
+            distance = (sx - x) ** 2 + (sy - y) ** 2
+            if distance <= best_distance:
+                best, best_distance = source, distance
+        return best
+
+    def inside(self, rect):
+        """Источники с центром внутри прямоугольника сцены"""
+        return [source for source in self.in_rect(rect, margin=0) if rect.contains(*self.scene_pos(source))]
+
+    def select(self, sources, toggle=False):
+        for source in sources:
+            if toggle and id(source) in self.selected:
+                self.selected.discard(id(source))
+            else:
+                self.selected.add(id(source))
+        self.update()
+
+    def clear_selection(self):
+        if self.selected:
+            self.selected.clear()
+            self.update()
+
+    def selected_sources(self):
+        return [source for source in self.sources if id(source) in self.selected]
+
+    def set_temp(self, source):
+        if self.temp is not None:
+            self.update(self._marker_rect(self.temp))
+        self.temp = source
+        if source is not None:
+            self.update(self._marker_rect(source))
+
+    def in_rect(self, rect, margin=None):
+        """Источники, маркеры которых могут попасть в прямоугольник сцены"""
+        if margin is None:
+            margin = (self.SAVED_RADIUS + self.LABEL_WIDTH) / self.zoom
+        i0, i1 = int((rect.left() - margin) // self.BUCKET), int((rect.right() + margin) // self.BUCKET)
+        j0, j1 = int((rect.top() - margin) // self.BUCKET), int((rect.bottom() + margin) // self.BUCKET)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield from self._buckets.get((i, j), ())
+
+    def paint(self, painter, option, widget=None):
+        rect = option.exposedRect if isinstance(option, QStyleOptionGraphicsItem) else self.boundingRect()
+        painter.setFont(self.font)
+        r = self.SAVED_RADIUS / self.zoom
+        saved_pen, temp_pen, selected_pen = QPen(Qt.darkGreen, 0), QPen(Qt.red, 0), QPen(Qt.blue, 2)
+        for pen in (saved_pen, temp_pen, selected_pen):
+            pen.setCosmetic(True)
+        saved_brush, selected_brush = QBrush(QColor(0, 255, 0, 200)), QBrush(QColor(0, 120, 255, 200))
+        for source in self.in_rect(rect):
+            x, y = source['pos']
+            selected = id(source) in self.selected
+            painter.setPen(selected_pen if selected else saved_pen)
+            painter.setBrush(selected_brush if selected else saved_brush)
+            painter.drawEllipse(QPointF(x, self.pixels - y), r, r)
+            if source['concentration'] > 0:
+                # Текст переворачивается обратно: вид отражён по оси Y
+                painter.save()
+                painter.translate(x + r + 2 / self.zoom, self.pixels - y)
+                painter.scale(1 / self.zoom, -1 / self.zoom)
+                painter.setPen(Qt.black)
+                painter.drawText(QPointF(0, 4), f"{source['concentration']:.1f}")
+                painter.restore()
+        if self.temp is not None:
+            x, y = self.temp['pos']
+            painter.setPen(temp_pen)
+            painter.setBrush(QBrush(QColor(255, 0, 0, 150)))
+            painter.drawEllipse(QPointF(x, self.pixels - y), self.TEMP_RADIUS / self.zoom, self.TEMP_RADIUS / self.zoom)
+
+
 class MapView(QGraphicsView):
+    """Карта для расстановки источников.
+
+    Сетка и шкала рисуются в drawBackground только в видимой области, шаг
+    сетки подбирается по масштабу; фон кэшируется (CacheBackground).
+    Маркеры источников - один элемент SourceLayer. Ctrl + колесо меняет
+    масштаб, поэтому размер карты не ограничен размером окна.
+
+    Левая кнопка ставит новый источник, Shift + щелчок выделяет ближайший,
+    Ctrl + протягивание выделяет прямоугольником, Delete удаляет выделенные,
+    правая кнопка удаляет источник под курсором (иначе - последний).
+    """
+
     def __init__(self, size_meters=100, resolution=5, parent=None):
         super().__init__(parent)
         self.size_meters = size_meters
@@ -45,55 +230,118 @@ class MapView(QGraphicsView):
 
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
-        self.sources = []
-        self.current_source = None
         self.temp_source = None  # Временный источник перед сохранением
+        self._band_origin = None
+        self._band = QRubberBand(QRubberBand.Rectangle, self.viewport())
 
         # Настройка сцены
         self.scene.setSceneRect(0, 0, self.pixels, self.pixels)
-        self.setFixedSize(self.pixels + 20, self.pixels + 20)
+        size = min(self.pixels + 20, MAX_VIEW_SIZE)
+        self.setMinimumSize(size, size)
+        self.setCacheMode(QGraphicsView.CacheBackground)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setRenderHint(QPainter.Antialiasing)
+
+        self.grid_font = QFont()
+        self.grid_font.setPointSize(8)
+        self.minor_pen = QPen(QColor(200, 200, 200), 0, Qt.DotLine)
+        self.major_pen = QPen(QColor(150, 150, 150), 0, Qt.SolidLine)
+
+        self.layer = SourceLayer(self.pixels)
+        self.scene.addItem(self.layer)
 
         # Инвертируем вид по оси Y, чтобы нули были снизу
         self.scale(1, -1)
         self.translate(0, -self.pixels)
+        self.centerOn(0, 0)
+
+    @property
+    def sources(self):
+        return self.layer.sources
+
+    def zoom(self):
+        return abs(self.transform().m11())
+
+    def grid_step(self):
+        # Шаг сетки в метрах под текущий масштаб
+        pixels_per_meter = self.resolution * self.zoom()
+        for step in GRID_STEPS:
+            if step * pixels_per_meter >= MIN_GRID_PIXELS:
+                return step
+        return GRID_STEPS[-1]
+
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, Qt.white)
+        visible = rect.intersected(self.sceneRect())
+        if visible.isEmpty():
+            return
+        step = self.grid_step()
+        for spacing, pen in ((step, self.minor_pen), (10 * step, self.major_pen)):
+            pixels = spacing * self.resolution
+            lines = []
+            first = int(visible.left() // pixels)
+            for i in range(first, int(visible.right() // pixels) + 1):
+                x = i * pixels
+                lines.append(QLineF(x, visible.top(), x, visible.bottom()))
+            first = int(visible.top() // pixels)
+            for i in range(first, int(visible.bottom() // pixels) + 1):
+                y = i * pixels
+                lines.append(QLineF(visible.left(), y, visible.right(), y))
+            painter.setPen(pen)
+            painter.drawLines(lines)
+        label_step = step if step * self.resolution * self.zoom() >= MIN_LABEL_PIXELS else 10 * step
+        self.draw_scale(painter, visible, label_step)
+
+    def draw_scale(self, painter, visible, spacing):
+        # Подписи вдоль нижнего и левого края карты, постоянного размера на экране
+        pixels = spacing * self.resolution
+        zoom = self.zoom()
+        painter.setFont(self.grid_font)
+        painter.setPen(Qt.black)
+        for i in range(int(visible.left() // pixels), int(visible.right() // pixels) + 1):
+            self._draw_label(painter, i * pixels + 5 / zoom, 0, f"{i * spacing}m", zoom)
+        for i in range(max(1, int(visible.top() // pixels)), int(visible.bottom() // pixels) + 1):
+            self._draw_label(painter, 0, i * pixels + 5 / zoom, f"{i * spacing}m", zoom)
+
+    @staticmethod
+    def _draw_label(painter, x, y, text, zoom):
+        painter.save()
+        painter.translate(x, y)
+        painter.scale(1 / zoom, -1 / zoom)
+        painter.drawText(QPointF(2, -4), text)
+        painter.restore()
+
+    def wheelEvent(self, event):
+        if not event.modifiers() & Qt.ControlModifier:
+            super().wheelEvent(event)
+            return
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        # Уменьшать имеет смысл, пока карта больше окна
+        fit = min(self.viewport().width(), self.viewport().height()) / self.pixels
+        self.set_zoom(min(max(self.zoom() * factor, min(fit, 1.0)), MAX_ZOOM))
 
-        # Рисуем сетку и шкалу
-        self.draw_grid_and_scale()
-
-    def draw_grid_and_scale(self):
-        # Основная сетка (каждый метр)
-        pen = QPen(QColor(200, 200, 200), 1, Qt.DotLine)
-        for i in range(0, self.pixels + 1, self.resolution):
-            self.scene.addLine(0, i, self.pixels, i, pen)
-            self.scene.addLine(i, 0, i, self.pixels, pen)
-
-        # Утолщённые линии (каждые 10 метров)
-        pen = QPen(QColor(150, 150, 150), 1, Qt.SolidLine)
-        for i in range(0, self.pixels + 1, 10 * self.resolution):
-            self.scene.addLine(0, i, self.pixels, i, pen)
-            self.scene.addLine(i, 0, i, self.pixels, pen)
-
-        # Подписи шкалы (0, 10, 20 метров...)
-        font = QFont()
-        font.setPointSize(8)
-        for i in range(0, self.pixels + 1, 10 * self.resolution):
-            meters = i // self.resolution
-            # Горизонтальная шкала (снизу)
-            text = self.scene.addText(f"{meters}m")
-            text.setFont(font)
-            text.setPos(i + 5, 15)
-            text.setTransform(QtGui.QTransform().scale(1, -1))
-            # Вертикальная шкала (слева)
-            if i != 0:
-                text = self.scene.addText(f"{meters}m")
-                text.setFont(font)
-                text.setPos(0, i + 5)
-                # Переворачиваем текст вертикальной шкалы
-
-                text.setTransform(QtGui.QTransform().scale(1, -1))
+    def set_zoom(self, zoom):
+        factor = zoom / self.zoom()
+        self.scale(factor, factor)
+        self.layer.set_zoom(zoom)
+
+    def pick(self, event):
+        return self.layer.nearest(self.mapToScene(event.pos()), PICK_RADIUS / self.zoom())
 
     def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ControlModifier:
+            self._band_origin = event.pos()
+            self._band.setGeometry(QRect(event.pos(), QSize()))
+            self._band.show()
+            return
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ShiftModifier:
+            source = self.pick(event)
+            if source is not None:
+                self.layer.select([source], toggle=True)
+            return
         if event.button() == Qt.LeftButton:
+            self.layer.clear_selection()
             pos = self.mapToScene(event.pos())
             x, y = pos.x(), pos.y()
 
@@ -103,77 +351,73 @@ class MapView(QGraphicsView):
             # Проверяем, что клик внутри карты
             if 0 <= x <= self.pixels and 0 <= y <= self.pixels:
                 # Создаем новый временный источник (красный)
-                self.clear_temp_source()
                 self.temp_source = {
                     'pos': (x, y),
                     'concentration': 0,
                     'frequency': 1,
-                    'item': None,
-                    'text_item': None
                 }
-                self.add_source_to_scene(self.temp_source, is_saved=False)
+                self.layer.set_temp(self.temp_source)
 
         elif event.button() == Qt.RightButton:
-            # Удаляем последний клик
-            if self.temp_source:
+            # Удаляем источник под курсором, иначе последний клик
+            source = self.pick(event)
+            if source is not None:
+                self.layer.remove(source)
+            elif self.temp_source:
                 self.clear_temp_source()
             elif self.sources:
-                last_source = self.sources.pop()
-                self.scene.removeItem(last_source['item'])
-                if last_source['text_item']:
-                    self.scene.removeItem(last_source['text_item'])
+                self.layer.remove(self.sources[-1])
 
         super().mousePressEvent(event)
 
-    def clear_temp_source(self):
-        if self.temp_source:
-            if self.temp_source['item']:
-                self.scene.removeItem(self.temp_source['item'])
-            if self.temp_source['text_item']:
-                self.scene.removeItem(self.temp_source['text_item'])
-            self.temp_source = None
-
-    def add_source_to_scene(self, source, is_saved=False):
-        x, y = source['pos']
-
-        # Удаляем предыдущий маркер, если он есть
-        if source['item']:
-            self.scene.removeItem(source['item'])
-        if source['text_item']:
-            self.scene.removeItem(source['text_item'])
+    def mouseMoveEvent(self, event):
+        if self._band_origin is not None:
+            self._band.setGeometry(QRect(self._band_origin, event.pos()).normalized())
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self._band_origin is not None and event.button() == Qt.LeftButton:
+            self._band.hide()
+            rect = self.mapToScene(QRect(self._band_origin, event.pos()).normalized()).boundingRect()
+            self._band_origin = None
+            self.layer.select(self.layer.inside(rect))
+            return
+        super().mouseReleaseEvent(event)
 
-        # Создаем новый маркер (учитываем инвертированную ось Y)
-        radius = 6 if is_saved else 4  # Сохраненные источники немного больше
-        item = QGraphicsEllipseItem(x - radius, self.pixels - y - radius, radius * 2, radius * 2)
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Delete, Qt.Key_Backspace) and self.layer.selected:
+            self.delete_selected()
+            return
+        super().keyPressEvent(event)
+
+    def delete_selected(self):
+        self.layer.remove_many(self.layer.selected_sources())
+
+    def add_sources(self, configs):
+        """Добавляет точечные источники из записей parameters.json (координаты в метрах)"""
+        sources = [{
+            'pos': (config['x'] * self.resolution, config['y'] * self.resolution),
+            'concentration': config.get('concentration', 0.0),
+            'frequency': config.get('frequency', 1),
+            'schedule': {key: config[key] for key in ('start', 'stop') if key in config},
+        } for config in configs]
+        outside = sum(not (0 <= x <= self.pixels and 0 <= y <= self.pixels)
+                      for x, y in (source['pos'] for source in sources))
+        if outside:
+            logger.warning(f"{outside} imported sources are outside the map")
+        self.layer.extend(sources)
 
-        if is_saved:
-            item.setBrush(QBrush(QColor(0, 255, 0, 200)))  # Зеленый для сохраненных
-            item.setPen(QPen(Qt.darkGreen, 1))
-        else:
-            item.setBrush(QBrush(QColor(255, 0, 0, 150)))  # Красный для временных
-            item.setPen(QPen(Qt.red, 1))
-
-        self.scene.addItem(item)
-        source['item'] = item
-
-        # Добавляем текст с концентрацией для сохраненных источников
-        if is_saved and source['concentration'] > 0:
-            text = QGraphicsSimpleTextItem(f"{source['concentration']:.1f}")
-            text.setFont(QFont("Arial", 8))
-            text.setPos(x + radius + 2, self.pixels - y - radius)
-            text.setBrush(QBrush(Qt.black))
-            # Переворачиваем текст
-            text.setTransform(QtGui.QTransform().scale(1, -1))
-            self.scene.addItem(text)
-            source['text_item'] = text
+    def clear_temp_source(self):
+        self.temp_source = None
+        self.layer.set_temp(None)
 
     def update_source(self, concentration, frequency):
         if self.temp_source:
             self.temp_source['concentration'] = concentration
             self.temp_source['frequency'] = frequency
-            self.sources.append(self.temp_source)
-
-            self.add_source_to_scene(self.temp_source, is_saved=True)
+            self.layer.set_temp(None)
+            self.layer.add(self.temp_source)
             self.temp_source = None
 
 
@@ -217,6 +461,22 @@ class NewConditions(QDialog):
 
         self.layout.addLayout(self.source_params_layout)
 
+        # Линии и площади из импортированного файла в редакторе не показываются, но сохраняются
+        self.other_sources = []
+        self.file_layout = QHBoxLayout()
+        self.import_button = QPushButton("Импорт источников")
+        self.import_button.clicked.connect(self.import_sources)
+        self.export_button = QPushButton("Экспорт источников")
+        self.export_button.clicked.connect(self.export_sources)
+        self.delete_button = QPushButton("Удалить выделенные")
+        self.delete_button.clicked.connect(self.map_view.delete_selected)
+        self.count_label = QLabel()
+        self.file_layout.addWidget(self.import_button)
+        self.file_layout.addWidget(self.export_button)
+        self.file_layout.addWidget(self.delete_button)
+        self.file_layout.addWidget(self.count_label)
+        self.layout.addLayout(self.file_layout)
+
         self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
         self.buttons.accepted.connect(self.accept)
         self.buttons.rejected.connect(self.reject)
@@ -230,6 +490,28 @@ class NewConditions(QDialog):
         except ValueError:
             QMessageBox.warning(self, "Ошибка", "Некорректное значение концентрации")
 
+    def import_sources(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт источников", "", SOURCE_FILTER)
+        if not path:
+            return
+        try:
+            configs = load_sources(path).to_config()
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать источники:\n{e}")
+            return
+        self.map_view.add_sources([config for config in configs if config.get('type', 'point') == 'point'])
+        self.other_sources.extend(config for config in configs if config.get('type', 'point') != 'point')
+        self.count_label.setText(f"Источников: {len(self.map_view.sources) + len(self.other_sources)}")
+
+    def export_sources(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт источников", "sources.csv", SOURCE_FILTER)
+        if not path:
+            return
+        try:
+            save_sources(path, self.get_properties()['sources'])
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить источники:\n{e}")
+
     def get_properties(self):
         sources = []
         for source in self.map_view.sources:
@@ -241,9 +523,10 @@ class NewConditions(QDialog):
                 'x': x_meters,
                 'y': y_meters,
                 'concentration': source['concentration'],
-                'frequency': source['frequency']
+                'frequency': source['frequency'],
+                **source.get('schedule', {})
             })
 
         return {
-            'sources': sources
+            'sources': sources + self.other_sources
         }
\ No newline at end of file
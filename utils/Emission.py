@@ -0,0 +1,400 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.path import Path
+
+logger = logging.getLogger(__name__)
+
+# Растеризованные линии и площади: хэш геометрии и сетки -> (индексы, веса)
+RASTER_CACHE_SIZE = 4096
+_raster_cache = OrderedDict()
+
+
+def _grid_key(model):
+    return float(model.x_size), float(model.y_size), int(model.x_steps), int(model.y_steps)
+
+
+def _geometry_hash(kind, coords, grid):
+    digest = hashlib.sha1(kind.encode())
+    digest.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+    digest.update(repr(grid).encode())
+    return digest.hexdigest()
+
+
+def _cached_raster(kind, coords, grid, rasterize):
+    key = _geometry_hash(kind, coords, grid)
+    raster = _raster_cache.get(key)
+    if raster is None:
+        raster = rasterize(coords, grid)
+        _raster_cache[key] = raster
+        while len(_raster_cache) > RASTER_CACHE_SIZE:
+            _raster_cache.popitem(last=False)
+    else:
+        _raster_cache.move_to_end(key)
+    return raster
+
+
+def _compress(index, weight):
+    # Повторяющиеся ячейки суммируются, дальше индексы уникальны
+    unique, inverse = np.unique(index, return_inverse=True)
+    return unique, np.bincount(inverse.reshape(-1), weights=weight)
+
+
+def _cell_index(x, y, grid):
+    x_size, y_size, nx, ny = grid
+    ix = np.clip(np.floor(np.asarray(x) * nx / x_size), 0, nx - 1).astype(np.intp)
+    iy = np.clip(np.floor(np.asarray(y) * ny / y_size), 0, ny - 1).astype(np.intp)
+    return ix * ny + iy
+
+
+def rasterize_line(points, grid):
+    """Длина ломаной по ячейкам сетки (сумма весов - длина в метрах)"""
+    x_size, y_size, nx, ny = grid
+    step = min(x_size / nx, y_size / ny) / 4
+    xs, ys, lengths = [], [], []
+    for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+        length = np.hypot(x1 - x0, y1 - y0)
+        if length == 0:
+            continue
+        n = max(1, int(np.ceil(length / step)))
+        # Середины n равных частей отрезка
+        t = (np.arange(n) + 0.5) / n
+        xs.append(x0 + (x1 - x0) * t)
+        ys.append(y0 + (y1 - y0) * t)
+        lengths.append(np.full(n, length / n))
+    if not xs:
+        return _cell_index(points[:1, 0], points[:1, 1], grid), np.zeros(1)
+    return _compress(_cell_index(np.concatenate(xs), np.concatenate(ys), grid), np.concatenate(lengths))
+
+
+def rasterize_area(polygon, grid):
+    """Площадь многоугольника по ячейкам сетки (сумма весов - площадь в м2)"""
+    x_size, y_size, nx, ny = grid
+    hx, hy = x_size / nx, y_size / ny
+    if len(polygon) > 1 and np.array_equal(polygon[0], polygon[-1]):
+        polygon = polygon[:-1]
+    x, y = polygon[:, 0], polygon[:, 1]
+    area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+    # Проверяются только центры ячеек в габаритах многоугольника
+    i_min, i_max = np.clip([int(x.min() / hx), int(x.max() / hx) + 1], 0, nx)
+    j_min, j_max = np.clip([int(y.min() / hy), int(y.max() / hy) + 1], 0, ny)
+    ci, cj = np.meshgrid(np.arange(i_min, i_max), np.arange(j_min, j_max), indexing="ij")
+    ci, cj = ci.reshape(-1), cj.reshape(-1)
+    inside = np.zeros(len(ci), dtype=bool)
+    if len(ci) and len(polygon) >= 3:
+        inside = Path(polygon).contains_points(np.column_stack([(ci + 0.5) * hx, (cj + 0.5) * hy]))
+
+    if inside.any():
+        index = ci[inside] * ny + cj[inside]
+    else:
+        # Многоугольник меньше ячейки: вся площадь в ячейку с его центром
+        index = _cell_index(x.mean(keepdims=True), y.mean(keepdims=True), grid)
+    return index.astype(np.intp), np.full(len(index), area / len(index))
+
+
+class EmissionSources:
+    """Источники выбросов в виде компактных массивов индекс/мощность.
+
+    Кроме точечных поддерживаются линейные (мощность на метр) и площадные
+    (мощность на м2) источники: они растеризуются на сетку модели один раз
+    и кэшируются по хэшу геометрии. У каждого источника своё расписание:
+    период в шагах (0 - однократный выброс), время начала и окончания
+    в секундах. Источники с одинаковым расписанием сливаются в группу
+    с уникальными ячейками, поэтому стоимость шага определяется числом
+    расписаний и затронутых ячеек, а не числом источников.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self._groups = []
+        self._global_groups = []
+        self._grid = None
+        self._period = None
+        self._start_step = None
+        self._stop_step = None
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _add(self, kind, coords, strength, period, start, stop):
+        self.sources.append({
+            "type": kind,
+            "coords": np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+            "strength": float(strength),
+            "period": int(period),
+            "start": float(start),
+            "stop": np.inf if stop is None else float(stop),
+        })
+
+    def add_point(self, x, y, strength, period=1, start=0.0, stop=None):
+        self._add("point", [(x, y)], strength, period, start, stop)
+
+    def add_line(self, points, rate, period=1, start=0.0, stop=None):
+        """Линейный источник: ломаная в метрах, rate - выброс на метр длины"""
+        self._add("line", points, rate, period, start, stop)
+
+    def add_area(self, polygon, rate, period=1, start=0.0, stop=None):
+        """Площадной источник: многоугольник в метрах, rate - выброс на м2"""
+        self._add("area", polygon, rate, period, start, stop)
+
+    def add_config(self, source):
+        kind = source.get("type", "point")
+        strength = source.get("concentration", source.get("rate", 0.0))
+        schedule = dict(period=source.get("frequency", 0), start=source.get("start", 0.0), stop=source.get("stop"))
+        if kind == "point":
+            self.add_point(source["x"], source["y"], strength, **schedule)
+        elif kind == "line":
+            self.add_line(source["points"], strength, **schedule)
+        elif kind == "area":
+            self.add_area(source["polygon"], strength, **schedule)
+        else:
+            raise ValueError(f"Unknown source type: {kind}")
+
+    def extend(self, other):
+        self.sources.extend(other.sources)
+
+    @classmethod
+    def from_config(cls, sources):
+        """Источники из parameters.json: x, y, concentration, frequency[, start, stop].
+
+        Для линий и площадей задаются type ("line"/"area") и points/polygon.
+        """
+        emissions = cls()
+        for source in sources:
+            emissions.add_config(source)
+        return emissions
+
+    def to_config(self):
+        """Источники в виде записей parameters.json (обратно к from_config)"""
+        configs = []
+        for source in self.sources:
+            config = {"concentration": source["strength"], "frequency": source["period"]}
+            if source["start"]:
+                config["start"] = source["start"]
+            if np.isfinite(source["stop"]):
+                config["stop"] = source["stop"]
+            if source["type"] == "point":
+                x, y = source["coords"][0]
+                configs.append({"x": float(x), "y": float(y), **config})
+            else:
+                key = "points" if source["type"] == "line" else "polygon"
+                configs.append({"type": source["type"], key: source["coords"].tolist(), **config})
+        return configs
+
+    @property
+    def repeating(self):
+        return any(source["period"] > 0 or source["start"] > 0 for source in self.sources)
+
+    def _raster(self, source, grid):
+        coords = source["coords"]
+        if source["type"] == "line":
+            return _cached_raster("line", coords, grid, rasterize_line)
+        if source["type"] == "area":
+            return _cached_raster("area", coords, grid, rasterize_area)
+        return _cell_index(coords[:, 0], coords[:, 1], grid), np.ones(1)
+
+    def prepare(self, model):
+        grid = _grid_key(model)
+        groups = {}
+        for source in self.sources:
+            start_step = int(np.ceil(source["start"] / model.dt - 1e-9))
+            stop_step = int(np.ceil(source["stop"] / model.dt - 1e-9)) if np.isfinite(source["stop"]) \
+                else np.iinfo(np.int64).max
+            index, weight = self._raster(source, grid)
+            indices, weights = groups.setdefault((source["period"], start_step, stop_step), ([], []))
+            indices.append(index)
+            weights.append(weight * source["strength"])
+
+        schedules = list(groups)
+        self._global_groups = [_compress(np.concatenate(groups[key][0]), np.concatenate(groups[key][1]))
+                               for key in schedules]
+        self._grid = grid
+        self._period = np.array([key[0] for key in schedules], dtype=np.int64)
+        self._start_step = np.array([key[1] for key in schedules], dtype=np.int64)
+        self._stop_step = np.array([key[2] for key in schedules], dtype=np.int64)
+        self.localize((0, 0), tuple(model.field_shape[-2:]))
+        logger.info(f"{len(self.sources)} emission sources in {len(schedules)} schedule groups, "
+                    f"{sum(len(index) for index, _ in self._global_groups)} cells")
+
+    @property
+    def cycle(self):
+        """Период повторения всех выбросов в шагах (НОК периодов)"""
+        periods = self._period[self._period > 0]
+        return int(np.lcm.reduce(periods)) if len(periods) else 1
+
+    @property
+    def last_change(self):
+        """Шаг последнего изменения расписания (начало или окончание выбросов)"""
+        steps = np.concatenate([self._start_step, self._stop_step[self._stop_step < np.iinfo(np.int64).max]])
+        return int(steps.max()) if len(steps) else 0
+
+    def mean_rate(self, size):
+        """Средний выброс за шаг по ячейкам полной сетки для постоянных источников"""
+        rate = np.zeros(size)
+        for g, (index, weight) in enumerate(self._global_groups):
+            # Однократные и ограниченные по времени выбросы в установившийся режим не входят
+            if self._period[g] > 0 and self._stop_step[g] == np.iinfo(np.int64).max:
+                rate[index] += weight / self._period[g]
+        return rate
+
+    def localize(self, offset, shape, step=0):
+        """Переводит группы в индексы окна shape со смещением offset; ячейки вне окна отбрасываются.
+
+        Возвращает долю мощности источников, выбрасывающих с шага step, оставшуюся за окном.
+        """
+        nx, ny = self._grid[2:]
+        if tuple(offset) == (0, 0) and tuple(shape) == (nx, ny):
+            self._groups = self._global_groups
+            return 0.0
+        (ox, oy), (wx, wy) = offset, shape
+        self._groups = []
+        outside = total = 0.0
+        for g, (index, weight) in enumerate(self._global_groups):
+            ix, iy = np.divmod(index, ny)
+            ix, iy = ix - ox, iy - oy
+            inside = (ix >= 0) & (ix < wx) & (iy >= 0) & (iy < wy)
+            self._groups.append((ix[inside] * wy + iy[inside], weight[..., inside]))
+            if self._active(g, step):
+                total += np.abs(weight).sum()
+                outside += np.abs(weight[..., ~inside]).sum()
+        return float(outside / total) if total > 0 else 0.0
+
+    def _active(self, g, step):
+        # Группа ещё выбрасывает на шаге step или позже (однократный выброс - если он не прошёл)
+        if step >= self._stop_step[g]:
+            return False
+        return self._period[g] > 0 or self._start_step[g] >= step
+
+    def centroid(self):
+        """Центр выбросов в индексах ячеек полной сетки (с весом мощности)"""
+        ny = self._grid[3]
+        index = np.concatenate([index for index, _ in self._global_groups])
+        weight = np.abs(np.concatenate([weight for _, weight in self._global_groups]))
+        ix, iy = np.divmod(index, ny)
+        total = weight.sum()
+        if total == 0:
+            return ix.mean(), iy.mean()
+        return ix @ weight / total, iy @ weight / total
+
+    def initial_field(self, model):
+        """Начальное поле: выбросы источников, стартующих в момент 0 (в каждый слой поля)"""
+        c = np.zeros(getattr(model, "field_shape", (model.x_steps, model.y_steps)))
+        flat = c.reshape(c.shape[:-2] + (-1,))
+        for g in np.flatnonzero(self._start_step == 0):
+            index, weight = self._groups[g]
+            flat[..., index] += weight
+        return c
+
+    def inject(self, c, step):
+        k = step - self._start_step
+        due = np.where(self._period > 0,
+                       (k >= 0) & (k % np.maximum(self._period, 1) == 0),
+                       # Однократный выброс в момент 0 уже учтён в начальном поле
+                       (k == 0) & (self._start_step > 0))
+        due &= step < self._stop_step
+        flat = c.reshape(c.shape[:-2] + (-1,))
+        injected = 0.0
+        for g in np.flatnonzero(due):
+            index, weight = self._groups[g]
+            flat[..., index] += weight
+            injected = injected + weight.sum(axis=-1)
+        # Масса выброса по слоям поля
+        return injected
+
+
+def _schedule(properties):
+    schedule = {}
+    for key in ("frequency", "start", "stop"):
+        value = properties.get(key)
+        if value not in (None, ""):
+            schedule[key] = int(float(value)) if key == "frequency" else float(value)
+    return schedule
+
+
+def _parse_points(text):
+    return [[float(v) for v in pair.split()] for pair in text.split(";") if pair.strip()]
+
+
+def _format_points(points):
+    return "; ".join(f"{x:.6g} {y:.6g}" for x, y in points)
+
+
+def save_sources(path, sources):
+    """Сохраняет записи источников (как в parameters.json) в CSV или GeoJSON для load_sources"""
+    if os.path.splitext(path)[1].lower() in (".geojson", ".json"):
+        features = []
+        for source in sources:
+            kind = source.get("type", "point")
+            if kind == "point":
+                geometry = {"type": "Point", "coordinates": [source["x"], source["y"]]}
+            elif kind == "line":
+                geometry = {"type": "LineString", "coordinates": source["points"]}
+            else:
+                geometry = {"type": "Polygon", "coordinates": [source["polygon"]]}
+            properties = {key: source[key] for key in ("concentration", "frequency", "start", "stop") if key in source}
+            features.append({"type": "Feature", "geometry": geometry, "properties": properties})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["type", "x", "y", "points", "concentration", "frequency", "start", "stop"])
+            for source in sources:
+                kind = source.get("type", "point")
+                points = source.get("points", source.get("polygon"))
+                writer.writerow([kind, source.get("x", ""), source.get("y", ""),
+                                 _format_points(points) if points is not None else "",
+                                 source.get("concentration", 0.0), source.get("frequency", ""),
+                                 source.get("start", ""), source.get("stop", "")])
+    logger.info(f"Saved {len(sources)} sources to {path}")
+
+
+def load_sources(path):
+    """Массовый импорт источников из CSV или GeoJSON (координаты в метрах).
+
+    CSV: столбцы type (point/line/area), x, y, points ("x1 y1; x2 y2; ..."
+    для линий и площадей), concentration, frequency, start, stop.
+    GeoJSON: Point, LineString, Polygon и их Multi-варианты, мощность
+    и расписание берутся из properties. У многоугольников учитывается
+    только внешний контур.
+    """
+    emissions = EmissionSources()
+    if os.path.splitext(path)[1].lower() in (".geojson", ".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        features = data["features"] if data.get("type") == "FeatureCollection" else [data]
+        for feature in features:
+            geometry = feature["geometry"]
+            properties = feature.get("properties") or {}
+            source = {"concentration": properties.get("concentration", properties.get("rate", 0.0)),
+                      **_schedule(properties)}
+            kind = geometry["type"]
+            parts = geometry["coordinates"] if kind.startswith("Multi") else [geometry["coordinates"]]
+            for part in parts:
+                if kind.endswith("Point"):
+                    emissions.add_config({**source, "x": part[0], "y": part[1]})
+                elif kind.endswith("LineString"):
+                    emissions.add_config({**source, "type": "line", "points": part})
+                elif kind.endswith("Polygon"):
+                    emissions.add_config({**source, "type": "area", "polygon": part[0]})
+                else:
+                    logger.warning(f"Unsupported geometry {kind} in {path}")
+    else:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                kind = row.get("type") or "point"
+                source = {"type": kind, "concentration": float(row.get("concentration") or row.get("rate") or 0),
+                          **_schedule(row)}
+                if kind == "point":
+                    source.update(x=float(row["x"]), y=float(row["y"]))
+                else:
+                    source["points" if kind == "line" else "polygon"] = _parse_points(row["points"])
+                emissions.add_config(source)
+    logger.info(f"Loaded {len(emissions)} sources from {path}")
+    return emissions
@@ -0,0 +1,163 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+from PyQt5.QtCore import QObject, pyqtSignal, QCoreApplication, QEventLoop, QThread
+
+
+class ProgressChannel(QObject):
+    """Потокобезопасная передача прогресса экспорта в QProgressBar.
+
+    Сигнал из другого потока доставляется через очередь событий Qt,
+    из GUI-потока - напрямую, после чего окно перерисовывается. Ввод
+    пользователя при этом не обрабатывается (откладывается до конца
+    экспорта), поэтому экспорт не может быть запущен повторно изнутри себя.
+    """
+
+    changed = pyqtSignal(int)
+
+    def __init__(self, progress_bar=None):
+        super().__init__()
+        if progress_bar is not None:
+            self.changed.connect(progress_bar.setValue)
+
+    def report(self, done, total):
+        self.changed.emit(int(done / max(total, 1) * 100))
+        app = QCoreApplication.instance()
+        if app is not None and QThread.currentThread() is app.thread():
+            app.processEvents(QEventLoop.ExcludeUserInputEvents)
+
+
+class GifStreamWriter:
+    """Потоковая запись GIF: каждый кадр кодируется и пишется в файл сразу"""
+
+    def __init__(self, path, duration, loop=0):
+        self.path = path
+        self.duration = duration
+        self.loop = loop
+        self.frames = 0
+        self._file = open(path, 'wb')
+
+    def write(self, image, duration=None):
+        if image.mode != 'P':
+            image = image.quantize(dither=Image.Dither.NONE)
+
+        if self.frames == 0:
+            header, _ = GifImagePlugin.getheader(image, info={'loop': self.loop})
+            for block in header:
+                self._file.write(block)
+
+        # У каждого кадра своя палитра
+        for block in GifImagePlugin.getdata(image, include_color_table=True,
+                                            duration=self.duration if duration is None else duration):
+            self._file.write(block)
+        self.frames += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(b';')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_rasterizer = None
+
+
+def _init_worker(rasterizer_factory):
+    global _rasterizer
+    _rasterizer = rasterizer_factory()
+
+
+def _render_chunk(start, frames, total):
+    images = []
+    for offset, data in enumerate(frames):
+        image = _rasterizer.render(data, start + offset, total)
+        images.append(image.quantize(dither=Image.Dither.NONE))
+    return images
+
+
+class GifExporter:
+    """Потоковый параллельный экспорт GIF.
+
+    Кадры добавляются по одному, растеризуются пачками в пуле процессов
+    и в исходном порядке пишутся в GifStreamWriter. В работе одновременно
+    не более двух пачек на процесс, поэтому расход памяти не зависит от
+    длины анимации. total - число кадров для заголовка и прогресса
+    (None, если заранее неизвестно).
+    rasterizer_factory должна быть picklable (например, functools.partial).
+    """
+
+    def __init__(self, path, rasterizer_factory, duration, total=None, progress=None, workers=None,
+                 chunk_size=8):
+        self.total = total
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.added = 0
+        self.done = 0
+        self._chunk = []
+        self._durations = []
+        self._pending = deque()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(rasterizer_factory,))
+        self._writer = GifStreamWriter(path, duration)
+
+    def add(self, frame, duration=None):
+        self._chunk.append(np.asarray(frame))
+        self._durations.append(duration)
+        self.added += 1
+        if len(self._chunk) >= self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        start = self.added - len(self._chunk)
+        future = self._pool.submit(_render_chunk, start, self._chunk, self.total)
+        self._pending.append((future, self._durations))
+        self._chunk, self._durations = [], []
+        if len(self._pending) >= 2 * self.workers:
+            self._drain()
+
+    def _drain(self):
+        future, durations = self._pending.popleft()
+        for image, duration in zip(future.result(), durations):
+            self._writer.write(image, duration)
+            self.done += 1
+        if self.progress is not None:
+            self.progress.report(self.done, self.total or self.added)
+
+    def close(self):
+        try:
+            if self._chunk:
+                self._submit()
+            while self._pending:
+                self._drain()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def export_gif(path, rasterizer_factory, frames, duration, progress=None, workers=None, chunk_size=8,
+               durations=None):
+    """Параллельный экспорт готовых кадров в GIF.
+
+    durations - длительности кадров (мс), если срезы сохранены неравномерно.
+    """
+    total = len(frames)
+    with GifExporter(path, rasterizer_factory, duration, total=total, progress=progress,
+                     workers=workers, chunk_size=chunk_size) as exporter:
+        for it in range(total):
+            exporter.add(frames[it], durations[it] if durations else None)
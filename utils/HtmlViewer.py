@@ -0,0 +1,308 @@
+import base64
+import json
+import zlib
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.colors import to_rgb
+
+# Кадры квантуются в uint16 относительно минимума и максимума кадра
+# (ошибка не больше (max - min) / 131070), сжимаются zlib и один раз
+# встраиваются в страницу. Цвета, зоны ПДК и проигрывание считает JS.
+QUANT_LEVELS = 65535
+
+TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>Карта загрязнений</title>
+<style>
+body { font-family: "DejaVu Sans", Arial, sans-serif; margin: 16px; }
+#title { text-align: center; white-space: pre-line; margin-bottom: 8px; }
+#wrap { display: flex; align-items: flex-start; gap: 16px; }
+#view { border: 1px solid #000; }
+#legend div { display: flex; align-items: center; margin-bottom: 6px; font-size: 13px; }
+#legend span.box { width: 20px; height: 20px; border: 1px solid #000; margin-right: 8px; }
+#controls { margin-top: 8px; display: flex; align-items: center; gap: 6px; }
+#slider { width: 400px; }
+</style>
+</head>
+<body>
+<div id="title"></div>
+<div id="wrap">
+  <canvas id="view"></canvas>
+  <div id="legend"></div>
+</div>
+<div id="controls">
+  <button id="first">&#9198;</button>
+  <button id="prev">&#9664;&#9664;</button>
+  <button id="play">&#9654;</button>
+  <button id="next">&#9654;&#9654;</button>
+  <button id="last">&#9197;</button>
+  <input id="slider" type="range" min="0" value="0">
+  <label><input id="loop" type="checkbox"> Повтор</label>
+</div>
+<script>
+const META = __META__;
+const DATA = "__DATA__";
+
+async function inflate(text) {
+  const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return new Uint16Array(await new Response(stream).arrayBuffer());
+}
+
+function hexToRgb(hex) {
+  return [1, 3, 5].map(i => parseInt(hex.substr(i, 2), 16));
+}
+
+(async function () {
+  const q = await inflate(DATA);
+  const nx = META.nx, ny = META.ny, total = META.frames;
+  const cells = nx * ny;
+
+  const view = document.getElementById("view");
+  const scale = META.display / Math.max(nx, ny);
+  view.width = Math.round(nx * scale);
+  view.height = Math.round(ny * scale);
+  const ctx = view.getContext("2d");
+  ctx.imageSmoothingEnabled = META.zoning;
+
+  const grid = document.createElement("canvas");
+  grid.width = nx;
+  grid.height = ny;
+  const gctx = grid.getContext("2d");
+  const image = gctx.createImageData(nx, ny);
+  const values = new Float64Array(cells);
+
+  const legend = document.getElementById("legend");
+  let palette = null, lut = null;
+  if (META.mode === "mpc") {
+    palette = META.colors.map(hexToRgb);
+    for (let i = META.colors.length - 1; i >= 0; i--) {
+      legend.insertAdjacentHTML("beforeend",
+        `<div><span class="box" style="background:${META.colors[i]}"></span>${META.labels[i]}</div>`);
+    }
+    legend.insertAdjacentHTML("beforeend",
+      `<div><span class="box" style="background:#606060;border-style:dashed;border-color:#fff"></span>Изолиния ПДК</div>`);
+  } else {
+    lut = META.lut;
+    const stops = lut.map((c, i) => `rgb(${c[0]},${c[1]},${c[2]}) ${(i / (lut.length - 1) * 100).toFixed(2)}%`);
+    legend.insertAdjacentHTML("beforeend",
+      `<div style="flex-direction:column;align-items:flex-start">Концентрация
+       <span id="vmax"></span>
+       <span style="width:20px;height:${view.height - 60}px;border:1px solid #000;
+             background:linear-gradient(to top, ${stops.join(",")})"></span>0</div>`);
+  }
+
+  function decode(frame) {
+    const lo = META.min[frame], step = (META.max[frame] - lo) / __LEVELS__;
+    const offset = frame * cells;
+    for (let i = 0; i < cells; i++) values[i] = lo + q[offset + i] * step;
+  }
+
+  function colorize(frame) {
+    const px = image.data;
+    if (META.mode === "mpc") {
+      const levels = META.levels;
+      for (let i = 0, p = 0; i < cells; i++, p += 4) {
+        let zone = 0;
+        while (zone < levels.length && values[i] >= levels[zone]) zone++;
+        const c = palette[zone];
+        px[p] = c[0]; px[p + 1] = c[1]; px[p + 2] = c[2]; px[p + 3] = 255;
+      }
+    } else {
+      const vmax = META.update_conc ? META.max[frame] : META.vmax;
+      const n = lut.length, k = vmax > 0 ? n / vmax : 0;
+      for (let i = 0, p = 0; i < cells; i++, p += 4) {
+        const c = lut[Math.min(n - 1, Math.max(0, Math.floor(values[i] * k)))];
+        px[p] = c[0]; px[p + 1] = c[1]; px[p + 2] = c[2]; px[p + 3] = 255;
+      }
+      document.getElementById("vmax").textContent = vmax.toPrecision(3);
+    }
+    gctx.putImageData(image, 0, 0);
+  }
+
+  function isoline() {
+    // Граница ячеек, где концентрация переходит через ПДК
+    const mpc = META.mpc;
+    ctx.save();
+    ctx.strokeStyle = "#fff";
+    ctx.lineWidth = 2;
+    ctx.setLineDash([6, 4]);
+    ctx.beginPath();
+    for (let r = 0; r < ny; r++) {
+      for (let c = 0; c < nx; c++) {
+        const above = values[r * nx + c] >= mpc;
+        if (c + 1 < nx && above !== (values[r * nx + c + 1] >= mpc)) {
+          ctx.moveTo((c + 1) * scale, r * scale);
+          ctx.lineTo((c + 1) * scale, (r + 1) * scale);
+        }
+        if (r + 1 < ny && above !== (values[(r + 1) * nx + c] >= mpc)) {
+          ctx.moveTo(c * scale, (r + 1) * scale);
+          ctx.lineTo((c + 1) * scale, (r + 1) * scale);
+        }
+      }
+    }
+    ctx.stroke();
+    ctx.restore();
+  }
+
+  const slider = document.getElementById("slider");
+  const title = document.getElementById("title");
+  const loop = document.getElementById("loop");
+  const play = document.getElementById("play");
+  slider.max = total - 1;
+  loop.checked = META.repeat;
+
+  let current = 0, timer = null;
+
+  function show(frame) {
+    current = frame;
+    decode(frame);
+    colorize(frame);
+    ctx.clearRect(0, 0, view.width, view.height);
+    ctx.drawImage(grid, 0, 0, view.width, view.height);
+    if (META.mode === "mpc") isoline();
+    slider.value = frame;
+    title.textContent = `Карта загрязнений (шаг ${frame + 1}/${total})` +
+      (META.mode === "mpc" ? `\\nПДК = ${META.mpc}` : "");
+  }
+
+  function stop() {
+    clearTimeout(timer);
+    timer = null;
+    play.innerHTML = "&#9654;";
+  }
+
+  // Кадр показывается своё время: срезы могут быть сохранены неравномерно
+  function schedule() {
+    timer = setTimeout(tick, META.durations ? META.durations[current] : META.interval);
+  }
+
+  function tick() {
+    if (current + 1 < total) show(current + 1);
+    else if (loop.checked) show(0);
+    else { stop(); return; }
+    schedule();
+  }
+
+  play.onclick = () => {
+    if (timer) { stop(); return; }
+    schedule();
+    play.innerHTML = "&#9208;";
+  };
+  document.getElementById("first").onclick = () => show(0);
+  document.getElementById("last").onclick = () => show(total - 1);
+  document.getElementById("prev").onclick = () => show(Math.max(0, current - 1));
+  document.getElementById("next").onclick = () => show(Math.min(total - 1, current + 1));
+  slider.oninput = () => show(parseInt(slider.value));
+
+  show(0);
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def _color_hex(color):
+    return '#' + ''.join(f'{int(round(channel * 255)):02x}' for channel in to_rgb(color))
+
+
+class HtmlEncoder:
+    """Потоковая сборка HTML-просмотрщика.
+
+    Кадры квантуются и сжимаются по мере добавления, страница пишется
+    при закрытии. Если задан mpc, кадры раскрашиваются по зонам zones,
+    иначе - палитрой cmap с верхней границей vmax (или максимумом кадра
+    при update_conc; без vmax - максимумом всех кадров).
+    """
+
+    def __init__(self, path, x_size, y_size, interval, repeat=True, zoning=False,
+                 mpc=None, zones=None, vmax=None, update_conc=False, cmap='hot', display=600):
+        self.path = path
+        self.meta = {
+            'x_size': x_size,
+            'y_size': y_size,
+            'interval': interval,
+            'repeat': bool(repeat),
+            'zoning': bool(zoning),
+            'display': display,
+        }
+        self.mpc = mpc
+        self.zones = zones
+        self.vmax = vmax
+        self.update_conc = update_conc
+        self.cmap = cmap
+        self.shape = None
+        self.minima = []
+        self.maxima = []
+        self.durations = []
+        self._compressor = zlib.compressobj(6)
+        self._chunks = []
+
+    def __len__(self):
+        return len(self.minima)
+
+    def add(self, frame, duration=None):
+        # Первая строка в браузере - верхняя, а кадры хранятся с origin='lower'
+        data = np.asarray(frame, dtype=np.float64)[::-1]
+        self.shape = data.shape
+        lo, hi = float(data.min()), float(data.max())
+        span = hi - lo
+        if span > 0:
+            quantized = np.rint((data - lo) * (QUANT_LEVELS / span)).astype('<u2')
+        else:
+            quantized = np.zeros(data.shape, dtype='<u2')
+        self._chunks.append(self._compressor.compress(quantized.tobytes()))
+        self.minima.append(lo)
+        self.maxima.append(hi)
+        self.durations.append(duration)
+
+    def close(self, durations=None):
+        if self.shape is None:
+            raise ValueError(f"No frames to save to {self.path}")
+        self._chunks.append(self._compressor.flush())
+        ny, nx = self.shape
+        durations = durations or self.durations
+        meta = dict(self.meta, nx=int(nx), ny=int(ny), frames=len(self), min=self.minima, max=self.maxima,
+                    durations=None if all(d is None for d in durations)
+                    else [self.meta['interval'] if d is None else d for d in durations])
+        if self.mpc is not None:
+            meta.update({
+                'mode': 'mpc',
+                'mpc': self.mpc,
+                'levels': [level * self.mpc for level in self.zones['levels'][1:-1]],
+                'colors': [_color_hex(color) for color in self.zones['colors']],
+                'labels': self.zones['labels'],
+            })
+        else:
+            lut = colormaps[self.cmap](np.arange(colormaps[self.cmap].N), bytes=True)[:, :3]
+            meta.update({
+                'mode': 'heat',
+                'vmax': float(self.vmax if self.vmax is not None else max(self.maxima)),
+                'update_conc': bool(self.update_conc),
+                'lut': lut.tolist(),
+            })
+
+        html = (TEMPLATE
+                .replace('__LEVELS__', str(QUANT_LEVELS))
+                .replace('__META__', json.dumps(meta, ensure_ascii=False))
+                .replace('__DATA__', base64.b64encode(b''.join(self._chunks)).decode('ascii')))
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(html)
+
+
+def export_html(path, frames, x_size, y_size, interval, repeat=True, zoning=False,
+                mpc=None, zones=None, vmax=None, update_conc=False, cmap='hot',
+                progress=None, display=600, durations=None):
+    """Сохраняет готовые кадры в самодостаточный HTML-просмотрщик"""
+    encoder = HtmlEncoder(path, x_size, y_size, interval, repeat=repeat, zoning=zoning, mpc=mpc, zones=zones,
+                          vmax=vmax, update_conc=update_conc, cmap=cmap, display=display)
+    total = len(frames)
+    for it in range(total):
+        encoder.add(frames[it])
+        if progress is not None:
+            progress.report(it + 1, total)
+    encoder.close(durations)
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Рёбра ячейки: 0 - нижнее, 1 - правое, 2 - верхнее, 3 - левое.
+# Номер случая: бит 0 - левый нижний угол выше уровня, 1 - правый нижний,
+# 2 - правый верхний, 3 - левый верхний.
+CASES = {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)],
+    6: [(0, 2)], 7: [(3, 2)], 8: [(2, 3)], 9: [(0, 2)],
+    11: [(1, 2)], 12: [(1, 3)], 13: [(0, 1)], 14: [(3, 0)],
+}
+# Седловые случаи разрешаются по среднему значению в центре ячейки
+SADDLES = {
+    5: ([(0, 1), (2, 3)], [(3, 0), (1, 2)]),
+    10: ([(3, 0), (1, 2)], [(0, 1), (2, 3)]),
+}
+
+
+def _interpolate(v0, v1, level):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (level - v0) / (v1 - v0)
+    return np.where(np.isfinite(t), np.clip(t, 0, 1), 0.5)
+
+
+def _edge_points(edge, corners, frame, rows, cols, level):
+    a, b, c, d = (corner[frame, rows, cols] for corner in corners)
+    if edge == 0:
+        return cols + _interpolate(a, b, level), rows.astype(np.float64)
+    if edge == 1:
+        return cols + 1.0, rows + _interpolate(b, c, level)
+    if edge == 2:
+        return cols + _interpolate(d, c, level), rows + 1.0
+    return cols.astype(np.float64), rows + _interpolate(a, d, level)
+
+
+def marching_squares(frames, level):
+    """Изолинии уровня level для стопки кадров (frames, rows, cols).
+
+    Возвращает отрезки (n, 2, 2) в индексах сетки (x = столбец, y = строка)
+    и номер кадра каждого отрезка. Все кадры обрабатываются одним проходом.
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    above = frames >= level
+    # Углы ячеек: левый нижний, правый нижний, правый верхний, левый верхний
+    corners = (frames[:, :-1, :-1], frames[:, :-1, 1:], frames[:, 1:, 1:], frames[:, 1:, :-1])
+    cases = (above[:, :-1, :-1].astype(np.uint8) | above[:, :-1, 1:] << 1
+             | above[:, 1:, 1:] << 2 | above[:, 1:, :-1] << 3)
+
+    segments = []
+    frame_ids = []
+
+    def add(pairs, frame, rows, cols):
+        for e0, e1 in pairs:
+            x0, y0 = _edge_points(e0, corners, frame, rows, cols, level)
+            x1, y1 = _edge_points(e1, corners, frame, rows, cols, level)
+            segments.append(np.stack([np.stack([x0, y0], axis=-1), np.stack([x1, y1], axis=-1)], axis=1))
+            frame_ids.append(frame)
+
+    for case, pairs in CASES.items():
+        add(pairs, *np.nonzero(cases == case))
+
+    for case, (joined, split) in SADDLES.items():
+        frame, rows, cols = np.nonzero(cases == case)
+        center = sum(corner[frame, rows, cols] for corner in corners) / 4 >= level
+        add(joined, frame[center], rows[center], cols[center])
+        add(split, frame[~center], rows[~center], cols[~center])
+
+    if not segments:
+        return np.empty((0, 2, 2)), np.empty(0, dtype=np.intp)
+    return np.concatenate(segments), np.concatenate(frame_ids)
+
+
+def frame_isolines(data, level, x_size, y_size):
+    """Изолинии одного кадра в координатах области (метры)"""
+    segments, _ = marching_squares(np.asarray(data)[None], level)
+    return _to_extent(segments, np.shape(data), x_size, y_size)
+
+
+def _to_extent(segments, shape, x_size, y_size):
+    rows, cols = shape
+    # Узлы сетки равномерно покрывают extent=[0, x_size, 0, y_size], как у contour
+    scale = np.array([x_size / max(cols - 1, 1), y_size / max(rows - 1, 1)])
+    return (segments * scale).astype(np.float32)
+
+
+class IsolineCache:
+    """Изолинии ПДК для всех кадров результата.
+
+    Считаются пачками в фоновом потоке и сохраняются рядом с результатом
+    (<path>.isolines_<уровень>.npz). Пока расчёт не закончен, кадр
+    обрабатывается на лету.
+    """
+
+    BATCH = 32
+
+    def __init__(self, store, level, x_size, y_size, transpose=True):
+        self.store = store
+        self.level = level
+        self.x_size = x_size
+        self.y_size = y_size
+        self.transpose = transpose
+        self.path = f"{store.path}.isolines_{level:g}.npz"
+        self.segments = None
+        self.offsets = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._stamp = self._source_stamp()
+        if not self._load():
+            self._thread = threading.Thread(target=self._compute, daemon=True)
+            self._thread.start()
+
+    def _source_stamp(self):
+        data_path = self.store.data_path
+        mtime = os.path.getmtime(data_path) if os.path.isfile(data_path) else 0
+        return np.array([len(self.store), mtime, self.x_size, self.y_size, self.transpose], dtype=np.float64)
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            cached = np.load(self.path)
+            if not np.array_equal(cached['stamp'], self._stamp):
+                return False
+            self.segments, self.offsets = cached['segments'], cached['offsets']
+            return True
+        except Exception as e:
+            logger.warning(f"Isoline cache {self.path} is unreadable: {e}")
+            return False
+
+    def _compute(self):
+        total = len(self.store)
+        parts = []
+        counts = np.zeros(total, dtype=np.int64)
+        shape = None
+        for start in range(0, total, self.BATCH):
+            if self._stop.is_set():
+                return
+            frames = np.asarray(self.store.frames[start:start + self.BATCH])
+            if self.transpose:
+                frames = frames.transpose(0, 2, 1)
+            shape = frames.shape[1:]
+            segments, frame_ids = marching_squares(frames, self.level)
+            order = np.argsort(frame_ids, kind='stable')
+            parts.append(segments[order])
+            counts[start:start + len(frames)] = np.bincount(frame_ids, minlength=len(frames))
+
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        segments = _to_extent(np.concatenate(parts), shape, self.x_size, self.y_size) if parts \
+            else np.empty((0, 2, 2), dtype=np.float32)
+        try:
+            np.savez(self.path, segments=segments, offsets=offsets, stamp=self._stamp)
+        except OSError as e:
+            logger.warning(f"Could not save isoline cache: {e}")
+        self.offsets = offsets
+        self.segments = segments
+        logger.info(f"Isolines for {total} frames are ready")
+
+    def close(self):
+        """Прерывает фоновый расчёт после текущей пачки кадров"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def ready(self):
+        return self.segments is not None and self.offsets is not None
+
+    def frame(self, it, data):
+        if self.ready:
+            return self.segments[self.offsets[it]:self.offsets[it + 1]]
+        return frame_isolines(data, self.level, self.x_size, self.y_size)
@@ -0,0 +1,494 @@
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from utils.Compression import QUANTIZE_MODES, CompressedWriter
+from utils.Emission import EmissionSources, load_sources
+from utils.Model import BOUNDARY_CONDITIONS, STEADY_CHECK, STEADY_TOL, Model
+from utils.Receptors import RECEPTORS_PATH
+from utils.Statistics import SUMMARY_PATH, ExposureAccumulator
+from utils.Storage import RESULT_PATH, ResultWriter, params_hash, species_path
+
+logger = logging.getLogger(__name__)
+
+JOBS_ROOT = "jobs"
+DEFAULT_PORT = 8765
+# Период записи прогресса расчёта и событий в потоке /events (с)
+PROGRESS_INTERVAL = 1.0
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Поля файла проекта main.py и имена параметров расчёта
+PROJECT_FIELDS = {"x_size": "x_size", "y_size": "y_size", "x_step": "x_step", "y_step": "y_step",
+                  "dx": "Dx", "dy": "Dy", "wind_u": "u", "wind_v": "v", "t": "t", "t_step": "t_step"}
+FINAL_STATES = ("done", "failed", "cancelled")
+# Ожидание завершения процесса расчёта после отмены (с)
+STOP_TIMEOUT = 10
+# Служебные файлы каталога заявки, не входящие в результат
+SERVICE_FILES = ("job.json", "job.json.tmp", "progress.json", "progress.json.tmp")
+
+
+def job_params(spec):
+    """Параметры расчёта из заявки.
+
+    spec: {"project": поля файла проекта main.py, "conditions": содержимое
+    parameters.json (иначе читается project["initial_conditions"]),
+    "result_format": None или режим CompressedWriter, "limits": [ПДК, ПДК
+    рабочей зоны] или такие пары по веществам, "priority": целое}.
+    Файл источников встраивается в параметры, поэтому хэш зависит от самих
+    источников, а не от имени файла.
+    """
+    project = spec["project"]
+    conditions = spec.get("conditions")
+    if conditions is None:
+        with open(project.get("initial_conditions", "parameters.json"), "r", encoding="utf-8") as f:
+            conditions = json.load(f)
+    params = {name: float(project[key]) for key, name in PROJECT_FIELDS.items()}
+    params["freq"] = int(project["save_name"])
+    sources = list(conditions.get("sources", []))
+    if conditions.get("sources_file"):
+        sources += load_sources(conditions["sources_file"]).to_config()
+    params.update(sources=sources, species=conditions.get("species", []), window=conditions.get("window"),
+                  snapshots=conditions.get("snapshots") or {}, receptors=conditions.get("receptors", []),
+                  boundary=project.get("boundary", "Dirihle"), limits=spec.get("limits"),
+                  result_format=spec.get("result_format"))
+    if params["boundary"] not in BOUNDARY_CONDITIONS:
+        raise ValueError(f"Unknown boundary conditions: {params['boundary']}")
+    if params["result_format"] is not None and params["result_format"] not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown result format: {params['result_format']}")
+    return params
+
+
+def create_model(params, emissions, **kwargs):
+    # Те же аргументы, что в App.create_model (в том числе целая скорость ветра)
+    snapshots = params["snapshots"]
+    return Model(None, params["x_size"], params["y_size"], int(params["x_size"]), int(params["y_size"]),
+                 int(params["t"]), params["Dx"], params["Dy"], params["x_step"], params["y_step"], params["t_step"],
+                 int(params["u"]), int(params["v"]), params["freq"], emissions=emissions,
+                 species=params["species"], conditions=params["boundary"],
+                 snapshot_tol=snapshots.get("tol", 0), snapshot_norm=snapshots.get("norm", "inf"),
+                 snapshot_max=snapshots.get("max_interval"), **kwargs)
+
+
+class JobProgress:
+    """Наблюдатель Model: модельное время в progress.json не чаще раза в interval с"""
+
+    def __init__(self, path, interval=PROGRESS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.total_time = 0.0
+        self._time = 0.0
+        self._written = 0.0
+
+    def start(self, model):
+        self.total_time = model.time_steps * model.dt
+        self._write(0.0)
+
+    def update(self, c, time_, dt):
+        self._time = time_
+        if time.monotonic() - self._written >= self.interval:
+            self._write(time_)
+
+    def finish(self, model):
+        self._write(self._time if model.cancelled else self.total_time)
+
+    def _write(self, time_):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"time": time_, "total_time": self.total_time}, f)
+        os.replace(tmp_path, self.path)
+        self._written = time.monotonic()
+
+
+def run_job(directory):
+    """Расчёт одной заявки в её каталоге (выполняется в процессе исполнителя)"""
+    with open(os.path.join(directory, "job.json"), "r", encoding="utf-8") as f:
+        params = json.load(f)["params"]
+    emissions = EmissionSources.from_config(params["sources"])
+    path = os.path.join(directory, RESULT_PATH)
+
+    def writer(path, channel=None):
+        if params["result_format"] is None:
+            return ResultWriter(path, channel=channel, params=params)
+        return CompressedWriter(path, quantize=params["result_format"], channel=channel, params=params)
+
+    if params["species"]:
+        writers = [writer(species_path(i, path), channel=i) for i in range(len(params["species"]))]
+        limits = params["limits"] or [[None, None]] * len(params["species"])
+        exposure = ExposureAccumulator([pdk for pdk, _ in limits], [pdk_work for _, pdk_work in limits])
+    else:
+        writers = [writer(path)]
+        exposure = ExposureAccumulator(*(params["limits"] or (None, None)))
+    progress = JobProgress(os.path.join(directory, "progress.json"))
+    receptors = None
+    with ExitStack() as stack:
+        for item in writers:
+            stack.enter_context(item)
+        model = create_model(params, emissions, writers=writers, observers=[exposure, progress],
+                             window=params["window"], steady_check=STEADY_CHECK if emissions.repeating else 0,
+                             steady_tol=STEADY_TOL)
+        if params["receptors"]:
+            receptors = model.add_receptors([(r["x"], r["y"]) for r in params["receptors"]],
+                                            [r.get("name", f"R{i + 1}") for i, r in enumerate(params["receptors"])])
+        model.iterate()
+    exposure.save(os.path.join(directory, SUMMARY_PATH))
+    if receptors is not None:
+        receptors.to_csv(os.path.join(directory, RECEPTORS_PATH))
+
+
+class JobQueue:
+    """Очередь расчётов с приоритетами, без повторов и с ограниченным пулом.
+
+    id заявки - хэш параметров: повторная заявка с теми же параметрами
+    получает уже существующую (очередную, идущую или готовую), только
+    с повышенным приоритетом, если он больше. Больший приоритет
+    выполняется раньше, при равном - в порядке поступления.
+
+    Каждая заявка - каталог <root>/<id> с job.json (параметры и состояние),
+    результатами и логом, поэтому после перезапуска готовые результаты
+    доступны, а прерванные расчёты ставятся в очередь заново. Расчёт идёт
+    в отдельном процессе, одновременно не больше workers расчётов.
+    """
+
+    def __init__(self, root=JOBS_ROOT, workers=1):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self.jobs = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._processes = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._load()
+        self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def directory(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _load(self):
+        for job_id in sorted(os.listdir(self.root)):
+            try:
+                with open(os.path.join(self.directory(job_id), "job.json"), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self.jobs[job_id] = job
+            if job["state"] not in FINAL_STATES:
+                job["state"] = "queued"
+                self._push(job)
+        logger.info(f"Loaded {len(self.jobs)} jobs from {self.root}")
+
+    def _save(self, job):
+        path = os.path.join(self.directory(job["id"]), "job.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (-job["priority"], next(self._order), job["id"]))
+
+    def submit(self, spec):
+        """(заявка, создана ли новая)"""
+        params = job_params(spec)
+        priority = int(spec.get("priority", 0))
+        job_id = params_hash(params)[:16]
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is not None and job["state"] not in ("failed", "cancelled"):
+                if job["state"] == "queued" and priority > job["priority"]:
+                    # Старая запись в куче станет неактуальной и будет пропущена
+                    job["priority"] = priority
+                    self._push(job)
+                    self._save(job)
+                    self._condition.notify()
+                return job, False
+            # Неудачная или отменённая заявка перезапускается с чистым каталогом,
+            # но только после завершения её процесса
+            if job_id in self._processes:
+                raise ValueError(f"Job {job_id} is still stopping")
+            shutil.rmtree(self.directory(job_id), ignore_errors=True)
+            os.makedirs(self.directory(job_id))
+            job = {"id": job_id, "params": params, "priority": priority, "state": "queued",
+                   "submitted": time.time(), "started": None, "finished": None, "error": None}
+            self.jobs[job_id] = job
+            self._save(job)
+            self._push(job)
+            self._condition.notify()
+        logger.info(f"Job {job_id} queued with priority {priority}")
+        return job, True
+
+    def _next(self):
+        with self._condition:
+            while not self._closed:
+                while self._heap:
+                    priority, _, job_id = heapq.heappop(self._heap)
+                    job = self.jobs[job_id]
+                    if job["state"] == "queued" and -priority == job["priority"]:
+                        job["state"] = "running"
+                        job["started"] = time.time()
+                        self._save(job)
+                        return job
+                self._condition.wait()
+        return None
+
+    def _work(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            directory = self.directory(job["id"])
+            logger.info(f"Job {job['id']} started")
+            with open(os.path.join(directory, "job.err"), "wb") as errors:
+                process = subprocess.Popen([sys.executable, "-m", "utils.JobServer", "--run", directory],
+                                           cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, stderr=errors)
+                with self._condition:
+                    self._processes[job["id"]] = process
+                    # Отмена могла прийти до запуска процесса
+                    if job["state"] == "cancelled":
+                        process.terminate()
+                code = process.wait()
+            with self._condition:
+                self._processes.pop(job["id"], None)
+                job["finished"] = time.time()
+                if self._closed and job["state"] == "running":
+                    # Расчёт прерван остановкой сервера: после перезапуска он выполнится заново
+                    job["state"] = "queued"
+                elif job["state"] != "cancelled":
+                    job["state"] = "done" if code == 0 else "failed"
+                    if code != 0:
+                        job["error"] = self._last_error(directory) or f"Exit code {code}"
+                self._save(job)
+            logger.info(f"Job {job['id']} {job['state']} in {job['finished'] - job['started']:.1f} s")
+
+    @staticmethod
+    def _last_error(directory):
+        try:
+            with open(os.path.join(directory, "job.err"), "r", encoding="utf-8", errors="replace") as f:
+                lines = [line.strip() for line in f if line.strip()]
+        except OSError:
+            return None
+        return lines[-1] if lines else None
+
+    def cancel(self, job_id):
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is None or job["state"] in FINAL_STATES:
+                return job
+            job["state"] = "cancelled"
+            job["finished"] = time.time()
+            process = self._processes.get(job_id)
+            if process is not None:
+                process.terminate()
+            self._save(job)
+        if process is not None:
+            try:
+                process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        logger.info(f"Job {job_id} cancelled")
+        return job
+
+    def status(self, job_id):
+        """Состояние заявки без параметров: прогресс, место в очереди и файлы результата"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {key: value for key, value in job.items() if key != "params"}
+            if job["state"] == "queued":
+                status["position"] = sum(
+                    other["state"] == "queued" and (-other["priority"], other["submitted"]) <
+                    (-job["priority"], job["submitted"]) for other in self.jobs.values())
+        directory = self.directory(job_id)
+        try:
+            with open(os.path.join(directory, "progress.json"), "r", encoding="utf-8") as f:
+                status["progress"] = json.load(f)
+        except (OSError, ValueError):
+            status["progress"] = None
+        status["files"] = self.files(job_id)
+        return status
+
+    def files(self, job_id):
+        directory = self.directory(job_id)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return []
+        return [name for name in names if name not in SERVICE_FILES]
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            processes = list(self._processes.values())
+            for process in processes:
+                process.terminate()
+            self._condition.notify_all()
+        for process in processes:
+            process.wait()
+        for thread in self._threads:
+            thread.join(STOP_TIMEOUT)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON интерфейс JobQueue.
+
+    POST /jobs - новая заявка; GET /jobs - список; GET /jobs/<id> -
+    состояние; GET /jobs/<id>/events - поток строк JSON с состоянием до
+    завершения; GET /jobs/<id>/files/<имя> - файл результата (можно читать
+    во время расчёта); DELETE /jobs/<id> - отмена.
+    """
+
+    server_version = "JobServer/1.0"
+
+    @property
+    def queue(self):
+        return self.server.queue
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+    def _parts(self):
+        return [unquote(part) for part in urlparse(self.path).path.split("/") if part]
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+
+    def do_GET(self):
+        parts = self._parts()
+        if parts == ["jobs"]:
+            self._send_json(HTTPStatus.OK, [self.queue.status(job_id) for job_id in list(self.queue.jobs)])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            status = self.queue.status(parts[1])
+            if status is None:
+                return self._not_found()
+            self._send_json(HTTPStatus.OK, status)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            self._events(parts[1])
+        elif len(parts) == 4 and parts[0] == "jobs" and parts[2] == "files":
+            self._file(parts[1], parts[3])
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        if self._parts() != ["jobs"]:
+            return self._not_found()
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            job, created = self.queue.submit(spec)
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            return self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"{type(e).__name__}: {e}"})
+        self._send_json(HTTPStatus.CREATED if created else HTTPStatus.OK,
+                        {**self.queue.status(job["id"]), "duplicate": not created})
+
+    def do_DELETE(self):
+        parts = self._parts()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._not_found()
+        if self.queue.cancel(parts[1]) is None:
+            return self._not_found()
+        self._send_json(HTTPStatus.OK, self.queue.status(parts[1]))
+
+    def _events(self, job_id):
+        status = self.queue.status(job_id)
+        if status is None:
+            return self._not_found()
+        # HTTP/1.0: поток без длины, конец - закрытие соединения
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        last = None
+        try:
+            while True:
+                line = json.dumps(status, ensure_ascii=False)
+                if line != last:
+                    self.wfile.write(line.encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                    last = line
+                if status["state"] in FINAL_STATES:
+                    return
+                time.sleep(PROGRESS_INTERVAL)
+                status = self.queue.status(job_id)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _file(self, job_id, name):
+        if job_id not in self.queue.jobs or name not in self.queue.files(job_id):
+            return self._not_found()
+        with open(os.path.join(self.queue.directory(job_id), name), "rb") as f:
+            # Файл может расти во время расчёта: отдаётся размер на момент запроса
+            size = os.fstat(f.fileno()).st_size
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            try:
+                while size > 0:
+                    chunk = f.read(min(size, 1 << 20))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    size -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, root=JOBS_ROOT, workers=1):
+    queue = JobQueue(root, workers)
+    server = ThreadingHTTPServer((host, port), JobHandler)
+    server.daemon_threads = True
+    server.queue = queue
+    logger.info(f"Job server on http://{host}:{server.server_port} with {workers} workers")
+    # SIGTERM завершает сервер так же, как Ctrl+C: расчёты останавливаются и вернутся в очередь
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Повторный сигнал не должен прервать остановку расчётов
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        server.server_close()
+        queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Очередь расчётов модели с доступом по HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--root", default=JOBS_ROOT, help="каталог заявок и результатов")
+    parser.add_argument("--workers", type=int, default=1, help="число одновременных расчётов")
+    parser.add_argument("--run", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    if args.run:
+        logging.basicConfig(filename=os.path.join(args.run, "job.log"), level=logging.INFO, format=log_format)
+        run_job(args.run)
+        return
+    logging.basicConfig(level=logging.INFO, format=log_format)
+    serve(args.host, args.port, args.root, max(1, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import logging
+import threading
+from time import monotonic
+
+import numpy as np
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QDialog, QHBoxLayout, QLabel, QPushButton, QVBoxLayout
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.collections import LineCollection
+from matplotlib.colors import BoundaryNorm, ListedColormap
+from matplotlib.figure import Figure
+
+from utils.Isolines import frame_isolines
+from utils.Rendering import MPC_ZONES
+
+logger = logging.getLogger(__name__)
+
+# Кадр публикуется не чаще, окно опрашивает буфер с этим периодом (мс)
+PUBLISH_INTERVAL = 0.1
+REFRESH_INTERVAL = 100
+
+
+class LiveFrame:
+    """Наблюдатель Model: последний кадр расчёта для просмотра.
+
+    Поле копируется в общий буфер на всю область не чаще, чем раз в
+    interval секунд, поэтому расчёт почти не замедляется. Окно читает
+    буфер из GUI-потока через latest(); version растёт с каждым кадром.
+    """
+
+    def __init__(self, interval=PUBLISH_INTERVAL, channel=None):
+        self.interval = interval
+        self.channel = channel
+        self.version = 0
+        self.time = 0.0
+        self.total_time = 0.0
+        self._model = None
+        self._buffer = None
+        self._published = 0.0
+        self._last_time = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, model):
+        self._model = model
+        self.total_time = model.time_steps * model.dt
+        self._buffer = np.zeros(model.domain_shape[-2:])
+        self._published = 0.0
+        self._publish(model.c, 0.0)
+
+    def update(self, c, time, dt):
+        self._last_time = time
+        if monotonic() - self._published >= self.interval:
+            self._publish(c, time)
+
+    def steady(self, phases, times, dt):
+        self._publish(phases[(len(times) - 1) % len(phases)], times[-1])
+
+    def finish(self, model):
+        self._publish(model.c, self._last_time if model.cancelled else self.total_time)
+
+    def _publish(self, c, time):
+        if self.channel is not None:
+            c = c[self.channel]
+        with self._lock:
+            # В режиме подвижного окна вне окна концентрация нулевая
+            if self._model.window:
+                self._buffer.fill(0.0)
+            self._buffer[self._model.window_region()] = c
+            self.time = time
+            self.version += 1
+        self._published = monotonic()
+
+    def latest(self):
+        """(version, время, копия кадра [x, y])"""
+        with self._lock:
+            return self.version, self.time, None if self._buffer is None else self._buffer.copy()
+
+
+class SolverThread(QThread):
+    """Выполняет расчёт вне GUI-потока"""
+
+    failed = pyqtSignal(str)
+
+    def __init__(self, run, parent=None):
+        super().__init__(parent)
+        self._run = run
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            logger.error(f"{e}")
+            self.failed.emit(str(e))
+
+
+class LiveViewDialog(QDialog):
+    """Карта концентрации, обновляемая во время расчёта, с кнопкой отмены.
+
+    С ПДК кадр раскрашивается по зонам и показывает изолинию ПДК, без
+    ПДК - палитрой hot с растущей верхней границей шкалы.
+    """
+
+    def __init__(self, model, frame, run, x_size, y_size, mpc=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Просмотр расчёта")
+        self.resize(800, 700)
+        self.model = model
+        self.frame = frame
+        self.x_size = x_size
+        self.y_size = y_size
+        self.mpc = mpc
+        self.completed = False
+        self._version = -1
+        self._vmax = 0.0
+
+        self.figure = Figure(figsize=(8, 6))
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.status = QLabel("Запуск расчёта...")
+        self.cancel_button = QPushButton("Остановить")
+        self.cancel_button.clicked.connect(self.cancel)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.canvas)
+        controls = QHBoxLayout()
+        controls.addWidget(self.status)
+        controls.addStretch()
+        controls.addWidget(self.cancel_button)
+        layout.addLayout(controls)
+
+        self._setup_plot()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+        self.solver = SolverThread(run, self)
+        self.solver.failed.connect(self._failed)
+        self.solver.finished.connect(self._finished)
+        self._error = None
+        self.timer.start()
+        self.solver.start()
+
+    def _setup_plot(self):
+        nx, ny = self.model.domain_shape[-2:]
+        empty = np.zeros((ny, nx))
+        extent = [0, self.x_size, 0, self.y_size]
+        if self.mpc is not None:
+            levels = [level * self.mpc for level in MPC_ZONES['levels']]
+            self.im = self.ax.imshow(empty, extent=extent, origin='lower',
+                                     cmap=ListedColormap(MPC_ZONES['colors']),
+                                     norm=BoundaryNorm(levels, len(MPC_ZONES['colors'])), interpolation='nearest')
+            self.figure.colorbar(self.im, ax=self.ax, boundaries=levels, spacing='proportional',
+                                 label=f'Концентрация (ПДК = {self.mpc})')
+            self.mpc_line = LineCollection([], colors='white', linewidths=2, linestyles='dashed')
+            self.ax.add_collection(self.mpc_line)
+        else:
+            self.im = self.ax.imshow(empty, extent=extent, origin='lower', cmap='hot', vmin=0, vmax=1,
+                                     interpolation='nearest')
+            self.figure.colorbar(self.im, ax=self.ax, label='Концентрация')
+            self.mpc_line = None
+        self.ax.set_xlabel('X координата, м')
+        self.ax.set_ylabel('Y координата, м')
+
+    def refresh(self):
+        version, time, data = self.frame.latest()
+        if data is None or version == self._version:
+            return
+        self._version = version
+        data = data.T
+        self.im.set_data(data)
+        if self.mpc_line is not None:
+            self.mpc_line.set_segments(frame_isolines(data, self.mpc, self.x_size, self.y_size))
+        else:
+            # Шкала только растёт, чтобы цвета кадров оставались сравнимыми
+            self._vmax = max(self._vmax, float(data.max()))
+            self.im.set_clim(0, self._vmax or 1)
+        self.status.setText(f"t = {time:.5g} из {self.frame.total_time:.5g} с, "
+                            f"максимум {float(data.max()):.5g}")
+        self.canvas.draw_idle()
+
+    def cancel(self):
+        if self.solver.isRunning():
+            self.cancel_button.setEnabled(False)
+            self.status.setText("Остановка...")
+            self.model.cancel()
+        else:
+            self.accept()
+
+    def _failed(self, message):
+        self._error = message
+
+    def _finished(self):
+        self.timer.stop()
+        self.refresh()
+        self.completed = self._error is None
+        if self._error is not None:
+            self.status.setText(f"Ошибка: {self._error}")
+        elif self.model.cancelled:
+            self.status.setText(f"Расчёт остановлен на t = {self.frame.time:.5g} с")
+        else:
+            self.status.setText("Расчёт завершён")
+        self.cancel_button.setText("Закрыть")
+        self.cancel_button.setEnabled(True)
+
+    def closeEvent(self, event):
+        # Окно не закрывается, пока поток расчёта не завершится
+        if self.solver.isRunning():
+            self.model.cancel()
+            self.solver.wait()
+        super().closeEvent(event)
+
+    def reject(self):
+        if self.solver.isRunning():
+            self.model.cancel()
+            self.solver.wait()
+        super().reject()
@@ -1,30 +1,347 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QTextEdit, QMessageBox
-from PyQt5.QtCore import QFile, QTextStream, QIODevice
+import logging
+import mmap
+import os
+import re
+from logging.handlers import RotatingFileHandler
 
+import numpy as np
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFontDatabase
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableView, QComboBox, QLineEdit, QCheckBox, QLabel,
+                             QAbstractItemView, QHeaderView)
+
+LOG_PATH = "app.log"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%d-%b-%y %H:%M:%S'
+# Размер файла до ротации и число старых файлов app.log.1 ... app.log.N
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+# Файл просматривается блоками такого размера; период проверки новых строк (мс)
+SCAN_CHUNK = 4 * 1024 * 1024
+FOLLOW_INTERVAL = 500
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+LEVEL_COLORS = {b" - WARNING - ": QColor(160, 110, 0), b" - ERROR - ": QColor(200, 0, 0),
+                b" - CRITICAL - ": QColor(200, 0, 0)}
+# Строка записи содержит " - LEVEL - " из LOG_FORMAT; строки без него (traceback) относятся
+# к предыдущей записи. Поиск подстроки быстрее разбора заголовка регулярным выражением
+MARKERS = {level: re.compile(re.escape(f" - {level} - ".encode())) for level in LEVELS}
+
+
+def setup_logging(path=LOG_PATH, level=logging.INFO):
+    """Лог приложения с ротацией по размеру"""
+    handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    logging.basicConfig(handlers=[handler], level=level, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+
+def log_files(path=LOG_PATH):
+    """Текущий лог и существующие старые файлы ротации"""
+    return [path] + [f"{path}.{i}" for i in range(1, LOG_BACKUPS + 1) if os.path.isfile(f"{path}.{i}")]
+
+
+def _positions(pattern, data):
+    return np.fromiter((match.start() for match in pattern.finditer(data)), dtype=np.int64)
+
+
+class LogFilter:
+    """Отбор записей по минимальному уровню и подстроке имени логгера"""
+
+    def __init__(self, level=None, name=""):
+        self.level = LEVELS.get(level, 0)
+        self.name = name.strip().encode('utf-8')
+        self.name_pattern = re.compile(re.escape(self.name)) if self.name else None
+
+    @property
+    def active(self):
+        return bool(self.level or self.name)
+
+    def select(self, data, starts):
+        """Номера строк-заголовков блока и маска отобранных среди них"""
+        positions = [_positions(pattern, data) for pattern in MARKERS.values()]
+        levels = np.concatenate([np.full(len(found), number) for found, number in zip(positions, LEVELS.values())])
+        positions = np.concatenate(positions)
+        order = np.argsort(positions, kind='stable')
+        positions, levels = positions[order], levels[order]
+        # Уровень записи - первый маркер в строке
+        headers, first = np.unique(np.searchsorted(starts, positions, side='right') - 1, return_index=True)
+        markers = positions[first]
+        matched = levels[first] >= self.level
+        if self.name_pattern is not None and len(headers):
+            # Имя логгера стоит в строке до маркера уровня
+            found = _positions(self.name_pattern, data)
+            lines = np.searchsorted(starts, found, side='right') - 1
+            index = np.minimum(np.searchsorted(headers, lines), len(headers) - 1)
+            valid = (headers[index] == lines) & (found < markers[index])
+            has_name = np.zeros(len(headers), dtype=bool)
+            has_name[index[valid]] = True
+            matched &= has_name
+        return headers, matched
+
+
+class LogScanner(QThread):
+    """Ищет начала строк файла и строки, прошедшие фильтр, вне GUI-потока.
+
+    Файл читается через mmap блоками SCAN_CHUNK, каждый блок сразу
+    передаётся сигналом chunk: (начала строк, номера отобранных строк или
+    None без фильтра, смещение конца блока). Незавершённая последняя строка
+    не учитывается - её дочитает следующий запуск с этого смещения.
+    """
+
+    chunk = pyqtSignal(object, object, int)
+
+    def __init__(self, path, offset, first_line, log_filter, carry=False, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.offset = offset
+        self.first_line = first_line
+        self.filter = log_filter
+        # Отобрана ли запись, продолжение которой начинает блок
+        self.carry = carry
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size <= self.offset:
+                    return
+                with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                    self._scan(mm, size)
+        except (OSError, ValueError) as e:
+            logging.getLogger(__name__).error(f"Cannot read log {self.path}: {e}")
+
+    def _scan(self, mm, size):
+        pos, line = self.offset, self.first_line
+        while pos < size and not self._stopped:
+            newline = mm.rfind(b"\n", pos, min(pos + SCAN_CHUNK, size))
+            if newline < 0:
+                newline = mm.find(b"\n", pos + SCAN_CHUNK, size)
+                if newline < 0:
+                    break
+            data = mm[pos:newline + 1]
+            breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            starts = np.concatenate(([0], breaks[:-1] + 1))
+            rows = self._filter(data, starts) + line if self.filter.active else None
+            self.chunk.emit((starts + pos).astype(np.int64), rows, newline + 1)
+            line += len(starts)
+            pos = newline + 1
+
+    def _filter(self, data, starts):
+        header_lines, matched = self.filter.select(data, starts)
+        if not len(header_lines):
+            return np.arange(len(starts)) if self.carry else np.empty(0, dtype=np.int64)
+        # Каждая строка относится к ближайшему заголовку не ниже неё
+        owner = np.searchsorted(header_lines, np.arange(len(starts)), side='right') - 1
+        keep = np.where(owner >= 0, matched[np.maximum(owner, 0)], self.carry)
+        self.carry = bool(matched[-1])
+        return np.flatnonzero(keep)
+
+
+class LogModel(QAbstractListModel):
+    """Строки лога для просмотра в виде списка.
+
+    Хранятся только смещения начал строк и номера отобранных строк; текст
+    строки берётся из mmap файла при отрисовке, поэтому память не зависит
+    от размера лога.
+    """
 
-class LogViewerDialog(QDialog):
     def __init__(self, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.end = 0
+        self._file = None
+        self._map = None
+        self._starts = np.empty(0, dtype=np.int64)
+        self._rows = None
+
+    def open(self, path, filtered):
+        self.beginResetModel()
+        self.close()
+        self.path = path
+        self.end = 0
+        self._starts = np.empty(0, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int64) if filtered else None
+        self.endResetModel()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = self._file = None
+
+    @property
+    def lines(self):
+        return len(self._starts)
+
+    def append(self, starts, rows, end):
+        if end > (len(self._map) if self._map is not None else 0):
+            self._remap(end)
+        first = self.rowCount()
+        count = len(starts) if rows is None else len(rows)
+        if count:
+            self.beginInsertRows(QModelIndex(), first, first + count - 1)
+        self._starts = np.concatenate((self._starts, starts))
+        if rows is not None and self._rows is not None:
+            self._rows = np.concatenate((self._rows, rows))
+        self.end = end
+        if count:
+            self.endInsertRows()
+
+    def _remap(self, size):
+        self.close()
+        self._file = open(self.path, 'rb')
+        # Отображается весь текущий файл, чтобы не пересоздавать mmap на каждый блок
+        size = max(size, os.fstat(self._file.fileno()).st_size)
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._starts) if self._rows is None else len(self._rows)
+
+    def _line(self, row):
+        line = row if self._rows is None else int(self._rows[row])
+        end = int(self._starts[line + 1]) if line + 1 < len(self._starts) else self.end
+        return self._map[int(self._starts[line]):end].rstrip(b"\r\n")
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self._line(index.row()).decode('utf-8', errors='replace')
+        if role == Qt.ForegroundRole:
+            line = self._line(index.row())[:80]
+            for marker, color in LEVEL_COLORS.items():
+                if marker in line:
+                    return color
+        return None
+
+
+class LogViewerDialog(QDialog):
+    """Просмотр лога: виртуальный список строк, фильтр и слежение за файлом.
+
+    Открытие не зависит от размера файла: строки появляются по мере
+    просмотра файла в фоновом потоке. Новые строки дочитываются по
+    таймеру; после ротации файл открывается заново.
+    """
+
+    def __init__(self, parent=None, path=LOG_PATH):
         super().__init__(parent)
         self.setWindowTitle("Просмотр логов")
         self.resize(800, 600)
+        self.path = path
+        self.scanner = None
+        self._stat = None
 
         self.setup_ui()
+        self.reload()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(FOLLOW_INTERVAL)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start()
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
 
-        self.text_edit = QTextEdit()
-        self.text_edit.setReadOnly(True)
-        layout.addWidget(self.text_edit)
-
-        self.load_default_log()
-
-    def load_default_log(self):
-        log_file = QFile("app.log")
-        if log_file.exists():
-            if log_file.open(QIODevice.ReadOnly | QIODevice.Text):
-                stream = QTextStream(log_file)
-                self.text_edit.setPlainText(stream.readAll())
-                log_file.close()
-            else:
-                QMessageBox.warning(self, "Ошибка", "Не удалось открыть файл app.log")
+        controls = QHBoxLayout()
+        self.file_select = QComboBox()
+        self.file_select.addItems(log_files(self.path))
+        self.file_select.currentTextChanged.connect(self.reload)
+        self.level_select = QComboBox()
+        self.level_select.addItem("Все уровни", None)
+        for level in LEVELS:
+            self.level_select.addItem(f"{level} и выше", level)
+        self.level_select.currentIndexChanged.connect(self.reload)
+        self.logger_input = QLineEdit()
+        self.logger_input.setPlaceholderText("Логгер, например utils.Model")
+        self.logger_input.editingFinished.connect(self.reload)
+        self.follow_check = QCheckBox("Следить")
+        self.follow_check.setChecked(True)
+        for widget in (self.file_select, self.level_select, self.logger_input, self.follow_check):
+            controls.addWidget(widget)
+        layout.addLayout(controls)
+
+        self.model = LogModel(self)
+        # Таблица из одного столбца, а не QListView: при фиксированной высоте строк она не хранит
+        # положение каждой строки, и добавление миллионов строк не пересчитывает раскладку
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.view.setShowGrid(False)
+        self.view.setWordWrap(False)
+        self.view.horizontalHeader().hide()
+        self.view.horizontalHeader().setStretchLastSection(True)
+        self.view.verticalHeader().hide()
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 2)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        layout.addWidget(self.view)
+
+        self.status = QLabel()
+        layout.addWidget(self.status)
+
+    def reload(self):
+        self._stop_scanner()
+        path = self.file_select.currentText() or self.path
+        self.filter = LogFilter(self.level_select.currentData(), self.logger_input.text())
+        self.model.open(path, self.filter.active)
+        self._stat = None
+        self.poll()
+
+    def poll(self):
+        if self.scanner is not None and self.scanner.isRunning():
+            return
+        try:
+            stat = os.stat(self.model.path)
+        except OSError:
+            self.status.setText(f"Файл {self.model.path} не найден")
+            return
+        # Файл заменён при ротации или усечён - читаем заново
+        if self._stat is not None and (stat.st_ino != self._stat.st_ino or stat.st_size < self.model.end):
+            self._stat = None
+            self.model.open(self.model.path, self.filter.active)
+            self.scanner = None
+        if self._stat is None:
+            self._stat = stat
+        if stat.st_size <= self.model.end:
+            return
+        carry = False
+        if self.scanner is not None:
+            carry = self.scanner.carry
+            self.scanner.deleteLater()
+        self.scanner = LogScanner(self.model.path, self.model.end, self.model.lines, self.filter, carry, self)
+        self.scanner.chunk.connect(self._append)
+        self.scanner.finished.connect(self._update_status)
+        self.status.setText("Чтение...")
+        self.scanner.start()
+
+    def _append(self, starts, rows, end):
+        if self.sender() is not self.scanner:
+            return
+        self.model.append(starts, rows, end)
+        if self.follow_check.isChecked():
+            self.view.scrollToBottom()
+
+    def _update_status(self):
+        if self.filter.active:
+            self.status.setText(f"Строк: {self.model.rowCount()} из {self.model.lines}")
+        else:
+            self.status.setText(f"Строк: {self.model.lines}")
+
+    def _stop_scanner(self):
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner.wait()
+            self.scanner = None
+
+    def done(self, result):
+        self.timer.stop()
+        self._stop_scanner()
+        self.model.close()
+        super().done(result)
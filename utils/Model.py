@@ -1,9 +1,27 @@
 import numpy as np
+import threading
 import time
 import logging
 
+from utils.Receptors import Receptors
+
 logger = logging.getLogger(__name__)
 
+# Граничные условия: Dirihle - нулевая концентрация на краях, Neumann - нулевой градиент,
+# Periodic - периодические, Outflow - свободный вынос по ветру (на входе чистый воздух)
+BOUNDARY_CONDITIONS = ("Dirihle", "Neumann", "Periodic", "Outflow")
+# Установившийся режим с периодом выбросов до этого числа шагов продолжается по фазам
+MAX_STEADY_CYCLE = 64
+# Нормы изменения поля для адаптивного сохранения срезов
+SNAPSHOT_NORMS = ("inf", "l2")
+# Проверка установления поля при постоянных выбросах: шаг проверки и допуск
+STEADY_CHECK = 100
+STEADY_TOL = 1e-6
+# Сколько проверок подряд изменение поля должно убывать
+STEADY_SHRINKING = 3
+# Облако для подвижного окна - ячейки с концентрацией выше этой доли максимума
+PLUME_LEVEL = 1e-3
+
 
 class Model:
     def __init__(self, c_start,
@@ -15,7 +33,9 @@ class Model:
                  slices_freq=1,
                  repeat_freq=-1,
                  repeat_start_conditions=False, check_stable=True, check_cfl=True,
-                 conditions="Dirihle"):
+                 conditions="Dirihle", writers=None, observers=None, emissions=None, species=None,
+                 window=None, window_check=10, steady_check=0, steady_tol=1e-6,
+                 snapshot_tol=0, snapshot_norm="inf", snapshot_max=None):
         self.X = np.linspace(0, int(x_size), int(x_steps))
         self.Y = np.linspace(0, int(y_size), int(y_steps))
         self.x_size = x_size
@@ -51,28 +71,122 @@ class Model:
                     if self.cfl <= 1:
                         logger.info("Succes")
                         break
+        # Несколько веществ с общим переносом; у каждого свой коэффициент выброса
+        # и скорость распада/осаждения (1/с). Перенос линеен, поэтому вещества
+        # с одинаковым распадом отличаются только множителем: решается одно поле
+        # (распады, x, y) на каждую скорость распада, вещества получаются умножением
+        self.species = list(species) if species else []
+        self.species_names = [s.get("name", f"S{i + 1}") for i, s in enumerate(self.species)]
+        self.emission_scale = np.array([s.get("emission", 1.0) for s in self.species], dtype=np.float64)
+        decay = np.array([s.get("decay", 0.0) for s in self.species], dtype=np.float64)
+        self.decay_rates, self.species_group = np.unique(decay, return_inverse=True)
+        self.decay_factor = np.exp(-self.decay_rates * self.dt)[:, None, None] if decay.any() else None
+        # Подвижное окно: решается сетка window (ячеек), которая сдвигается по области
+        # вслед за центром масс облака; смещение окна в ячейках - offset
+        self.window = (min(int(window[0]), x_steps), min(int(window[1]), y_steps)) if window else None
+        self.window_check = window_check
+        self.offset = (0, 0)
+        if self.window and emissions is None:
+            raise ValueError("Moving window requires emission sources")
+        self.field_shape = ((len(self.decay_rates),) if self.species else ()) + (self.window or (x_steps, y_steps))
+        if self.species and c_start is not None and np.ndim(c_start) == 2:
+            self.c = self.c_start = np.repeat(np.asarray(c_start)[None], len(self.decay_rates), axis=0)
+
+        # Разреженные источники со своим расписанием заменяют плотное поле c_start
+        self.emissions = emissions
+        if emissions is not None:
+            emissions.prepare(self)
+            if self.window:
+                self.offset = self._window_offset(*emissions.centroid())
+                self._sources_outside = 0.0
+                self._check_sources(emissions.localize(self.offset, self.window))
+            if c_start is None:
+                self.c = self.c_start = emissions.initial_field(self)
+            self.repeat_start_conditions = emissions.repeating
+        # base - решаемое поле, c - поле по веществам для наблюдателей и срезов
+        self.base = self.c
+        self.c = self._expand(self.base)
+        self.domain_shape = self.c.shape[:-2] + (x_steps, y_steps)
+        self.offsets = []
+        # Масса, ушедшая из окна через его края и при сдвигах, и вся выброшенная масса
+        self.escaped_mass = 0.0
+        self.emitted_mass = float(np.sum(self.base))
+        self._window_mass = self.base.sum(axis=(-2, -1)) if self.window else None
+
         self.max_conc = np.max(self.c)
         self.slices_freq = slices_freq
         self.time_steps = int(self.t / self.dt)
         self.x = np.linspace(0, x_size, x_steps)
         self.y = np.linspace(0, y_size, y_steps)
-        self.X, self.Y = np.meshgrid(self.x, self.y)
+        # Индексация [x, y], как у поля c; в режиме окна - только ячейки окна
+        grid_x, grid_y = self.base.shape[-2:]
+        self.X, self.Y = np.meshgrid(self.x[:grid_x], self.y[:grid_y], indexing="ij")
 
+        # Поле ветра на всю область хранится целиком и нарезается по окну
+        self._u_full = self._v_full = None
         if isinstance(u, int) or isinstance(u, float):
             self.u = u + 0 * self.X
         else:
-            self.u = u
+            self.u = self._u_full = np.asarray(u)
         if isinstance(v, int) or isinstance(v, float):
             self.v = v + 0 * self.Y
         else:
-            self.v = v
-        logger.info(f"Wind X={self.u}")
-        logger.info(f"Wind Y={self.v}")
+            self.v = self._v_full = np.asarray(v)
+        self._slice_wind()
+        # В лог пишется сводка по полю ветра, а не сам массив
+        logger.info(f"Wind X: min={np.min(self.u):.4g}, mean={np.mean(self.u):.4g}, max={np.max(self.u):.4g}")
+        logger.info(f"Wind Y: min={np.min(self.v):.4g}, mean={np.mean(self.v):.4g}, max={np.max(self.v):.4g}")
         self.dynamic_wind_u = False
         self.dynamic_wind_v = False
+        if conditions not in BOUNDARY_CONDITIONS:
+            raise ValueError(f"Unknown boundary conditions: {conditions}")
         self.conditions = conditions
+        # Поле с фиктивными ячейками по краям для условий, отличных от Dirihle
+        self._padded = None
+        if conditions != "Dirihle":
+            self._padded = np.zeros(self.base.shape[:-2] + (grid_x + 2, grid_y + 2))
+        self._outflow_masks()
         self.check_stable = check_stable
         self.c_list = []
+        # Приёмники срезов (например, ResultWriter); без них срезы копятся в c_list
+        self.writers = list(writers) if writers else []
+        # Объекты с методами start/update/finish, получающие поле на каждом шаге
+        self.observers = list(observers) if observers else []
+        self.saved_slices = 0
+        self.slice_times = []
+        # Адаптивные срезы: шаг-кандидат (кратный slices_freq) сохраняется, если поле
+        # изменилось относительно последнего среза больше snapshot_tol по норме
+        # snapshot_norm или прошло snapshot_max шагов; snapshot_tol=0 - каждые slices_freq
+        if snapshot_norm not in SNAPSHOT_NORMS:
+            raise ValueError(f"Unknown snapshot norm: {snapshot_norm}")
+        self.snapshot_tol = snapshot_tol
+        self.snapshot_norm = snapshot_norm
+        self.snapshot_max = snapshot_max or max(1, int(round(1 / self.dt)))
+        self._last_slice = None
+        self._last_slice_step = None
+        # Проверка установления: каждые steady_check шагов (кратно периоду выбросов)
+        # сравнивается поле; когда оценка изменения до конца расчёта меньше steady_tol (см. _converged),
+        # расчёт останавливается, оставшиеся срезы и статистика дополняются установившимся полем
+        self.steady_tol = steady_tol
+        self.steady_time = None
+        self.steady_step = None
+        self._steady_reference = None
+        self._steady_change = None
+        self._steady_shrinking = 0
+        self._steady_phases = None
+        self._steady_after = 0
+        if emissions is not None:
+            cycle = emissions.cycle
+            self._steady_after = emissions.last_change
+        elif self.repeat_start_conditions:
+            cycle = self.repeat_freq if self.repeat_freq > 0 else max(1, int(round(1 / self.dt)))
+        else:
+            cycle = 1
+        self.steady_check = -(-steady_check // cycle) * cycle if steady_check else 0
+        self._steady_cycle = cycle if cycle <= MAX_STEADY_CYCLE else 1
+        # Остановка расчёта из другого потока (например, из окна просмотра)
+        self.cancelled = False
+        self._cancel = threading.Event()
         self.Q = None
         self.im = None
         self.crit_t_u = None
@@ -84,26 +198,307 @@ class Model:
         self.u_key_iter = 0
         self.v_key_iter = 0
 
+    def grid_index(self, x, y):
+        # Ячейка i занимает [i * h, (i + 1) * h), h = x_size / x_steps, как на карте.
+        # Возвращаются дробные индексы относительно центров ячеек
+        return (np.asarray(x, dtype=np.float64) * self.x_steps / self.x_size - 0.5,
+                np.asarray(y, dtype=np.float64) * self.y_steps / self.y_size - 0.5)
+
+    def add_receptors(self, coords, names=None):
+        """Добавляет рецепторы (координаты в метрах), ряды пишутся на каждом шаге"""
+        receptors = Receptors(coords, names)
+        self.observers.append(receptors)
+        return receptors
+
+    def _expand(self, base):
+        if not self.species:
+            return base
+        return base[self.species_group] * self.emission_scale[:, None, None]
+
+    def window_region(self):
+        """Срез полной области, занятый окном (вся область без окна)"""
+        if not self.window:
+            return (Ellipsis,)
+        (ox, oy), (wx, wy) = self.offset, self.window
+        return Ellipsis, slice(ox, ox + wx), slice(oy, oy + wy)
+
+    def _slice_wind(self):
+        if self.window and self._u_full is not None:
+            self.u = self._u_full[self.window_region()]
+        if self.window and self._v_full is not None:
+            self.v = self._v_full[self.window_region()]
+
+    def _outflow_masks(self):
+        if self.conditions != "Outflow":
+            return
+        # 0 - граница входящая (фиктивная ячейка пустая), 1 - выходящая (нулевой градиент)
+        self._keep_left = (self.u[0, :] <= 0).astype(np.float64)
+        self._keep_right = (self.u[-1, :] >= 0).astype(np.float64)
+        self._keep_bottom = (self.v[:, 0] <= 0).astype(np.float64)
+        self._keep_top = (self.v[:, -1] >= 0).astype(np.float64)
+
+    def _window_offset(self, cx, cy):
+        # Окно с центром в (cx, cy), не выходящее за область
+        wx, wy = self.window
+        return (int(np.clip(round(cx - wx / 2), 0, self.x_steps - wx)),
+                int(np.clip(round(cy - wy / 2), 0, self.y_steps - wy)))
+
+    def _window_margin(self):
+        # Запас у края окна: не меньше 1/8 окна и пути ветра между проверками
+        travel = (np.max(np.abs(self.u)) * self.dt / self.dx, np.max(np.abs(self.v)) * self.dt / self.dy)
+        return tuple(int(min(max(size // 8, np.ceil(speed * self.window_check) + 1), size // 4))
+                     for size, speed in zip(self.window, travel))
+
+    def _follow_plume(self, t):
+        """Сдвигает окно, когда облако подходит к его краю ближе чем на запас.
+
+        Облако, помещающееся в окно с запасом, ставится в центр окна, иначе
+        в центр окна ставится максимум концентрации: хвосты, срезанные краем,
+        не смещают окно против ветра, как центр масс.
+        """
+        wx, wy = self.window
+        field = np.abs(self.base).reshape(-1, wx, wy).max(axis=0)
+        peak = field.max()
+        if peak <= 0:
+            return
+        plume = field >= peak * PLUME_LEVEL
+        xs = np.flatnonzero(plume.any(axis=1))
+        ys = np.flatnonzero(plume.any(axis=0))
+        mx, my = self._window_margin()
+        if xs[0] >= mx and xs[-1] < wx - mx and ys[0] >= my and ys[-1] < wy - my:
+            return
+        px, py = np.unravel_index(np.argmax(field), field.shape)
+        cx = (xs[0] + xs[-1]) / 2 if xs[-1] - xs[0] < wx - 2 * mx else px
+        cy = (ys[0] + ys[-1]) / 2 if ys[-1] - ys[0] < wy - 2 * my else py
+        offset = self._window_offset(self.offset[0] + cx + 0.5, self.offset[1] + cy + 0.5)
+        if offset != self.offset:
+            self._move_window(offset, t)
+
+    def _check_sources(self, outside):
+        if outside > 0 and outside != self._sources_outside:
+            logger.warning(f"{outside:.1%} of active emission is outside the moving window and dropped")
+        self._sources_outside = outside
+
+    def _move_window(self, offset, step=0):
+        (wx, wy), (sx, sy) = self.window, (offset[0] - self.offset[0], offset[1] - self.offset[1])
+        # Данные сдвигаются копированием, ячейки, вошедшие в окно, пустые
+        moved = np.zeros_like(self.base)
+        if abs(sx) < wx and abs(sy) < wy:
+            moved[..., max(-sx, 0):wx - max(sx, 0), max(-sy, 0):wy - max(sy, 0)] = \
+                self.base[..., max(sx, 0):wx - max(-sx, 0), max(sy, 0):wy - max(-sy, 0)]
+        self.base = moved
+        self.offset = offset
+        mass = moved.sum(axis=(-2, -1))
+        self.escaped_mass += float(np.sum(self._window_mass - mass))
+        self._window_mass = mass
+        self._slice_wind()
+        self._outflow_masks()
+        self._check_sources(self.emissions.localize(offset, self.window, step))
+        for observer in self.observers:
+            if hasattr(observer, "shift"):
+                observer.shift(self)
+        logger.debug(f"Window moved to {offset}")
+
+    def cancel(self):
+        """Просит остановить iterate после текущего шага; уже сохранённые срезы остаются"""
+        self._cancel.set()
+
+    def _converged(self, t):
+        """Установление: изменение поля убывает STEADY_SHRINKING проверок подряд,
+        а изменение до конца расчёта меньше steady_tol от поля.
+
+        Изменение до конца оценивается сверху: изменение за шаг, продолженное
+        на оставшиеся шаги. Поэтому медленный рост поля, малый за steady_check
+        шагов, но заметный за весь расчёт, установлением не считается.
+        """
+        reference, self._steady_reference = self._steady_reference, self.base.copy()
+        previous, self._steady_change = self._steady_change, None
+        if reference is None or reference.shape != self.base.shape:
+            self._steady_shrinking = 0
+            return False
+        change = self._steady_change = np.max(np.abs(self.base - reference))
+        scale = np.max(np.abs(self.base))
+        if scale <= 0 or previous is None:
+            return False
+        if change == 0:
+            return True
+        self._steady_shrinking = self._steady_shrinking + 1 if change < previous else 0
+        if self._steady_shrinking < STEADY_SHRINKING:
+            return False
+        return change * (self.time_steps - 1 - t) / self.steady_check <= self.steady_tol * scale
+
+    def _field_change(self, c, reference):
+        if self.snapshot_norm == "inf":
+            scale = max(np.max(np.abs(c)), np.max(np.abs(reference)))
+            return np.max(np.abs(c - reference)) / scale if scale > 0 else 0.0
+        scale = max(np.linalg.norm(c), np.linalg.norm(reference))
+        return np.linalg.norm(c - reference) / scale if scale > 0 else 0.0
+
+    def _slice_due(self, t):
+        # slices_freq=0 отключает сохранение срезов
+        if not self.slices_freq or int(t % self.slices_freq) != 0:
+            return False
+        if not self.snapshot_tol or self._last_slice is None:
+            return True
+        # Последний шаг сохраняется всегда, чтобы анимация доходила до конца расчёта
+        if t - self._last_slice_step >= self.snapshot_max or t == self.time_steps - 1:
+            return True
+        # После сдвига окна поля несравнимы
+        if self.window and self.offsets and self.offsets[-1] != self.offset:
+            return True
+        return self._field_change(self.c, self._last_slice) > self.snapshot_tol
+
+    def _save_slice(self, t, cur_time):
+        if self.writers:
+            for writer in self.writers:
+                if self.window:
+                    writer.append(self.c, cur_time, offset=self.offset, domain=self.domain_shape[-2:])
+                else:
+                    writer.append(self.c, cur_time)
+        else:
+            self.c_list.append(self.c.copy())
+        self.offsets.append(self.offset)
+        self.slice_times.append(cur_time)
+        self.saved_slices += 1
+        if self.snapshot_tol:
+            self._last_slice = self.c if self.writers else self.c_list[-1]
+            self._last_slice_step = t
+
+    def _fill_steady(self, last):
+        """Оставшиеся шаги после установления: поле не пересчитывается, а повторяется.
+
+        При периодических выбросах повторяются поля последнего периода (фазы):
+        шаг last + 1 + i берёт фазу i % len(phases).
+        """
+        steps = np.arange(last + 1, self.time_steps)
+        if not len(steps):
+            return
+        phases = self._steady_phases or [self.c]
+        # Поле на последнем запрошенном шаге
+        self.c = phases[(len(steps) - 1) % len(phases)]
+        for observer in self.observers:
+            if hasattr(observer, "steady"):
+                observer.steady(phases, (steps + 1) * self.dt, self.dt)
+            else:
+                for i, step in enumerate(steps):
+                    observer.update(phases[i % len(phases)], (step + 1) * self.dt, self.dt)
+
+        saved = self._steady_slices(steps, phases)
+        order = ((saved - last - 1) % len(phases)).tolist()
+        times = (saved * self.dt).tolist()
+        for writer in self.writers:
+            if hasattr(writer, "repeat_steady"):
+                writer.repeat_steady(phases, order, times, self.steady_time)
+            else:
+                for phase, time in zip(order, times):
+                    writer.append(phases[phase], time)
+        if not self.writers:
+            # Фазы - одни и те же массивы: дополнительной памяти под кадры не требуется
+            self.c_list.extend(phases[phase] for phase in order)
+        self.offsets.extend([self.offset] * len(times))
+        self.slice_times.extend(times)
+        self.saved_slices += len(times)
+
+    def _steady_slices(self, steps, phases):
+        """Шаги из steps, на которых полный расчёт сохранил бы срез (см. _slice_due)"""
+        if not self.slices_freq:
+            return steps[:0]
+        due = steps[steps % self.slices_freq == 0]
+        if not self.snapshot_tol:
+            return due
+        saved = []
+        changes = {}
+        last_step, last = self._last_slice_step, None
+        for step in due.tolist():
+            phase = (step - steps[0]) % len(phases)
+            if last_step is None or step - last_step >= self.snapshot_max or step == self.time_steps - 1:
+                keep = True
+            else:
+                # Изменение между фазами считается один раз для каждой пары
+                if (last, phase) not in changes:
+                    reference = self._last_slice if last is None else phases[last]
+                    changes[last, phase] = self._field_change(phases[phase], reference)
+                keep = changes[last, phase] > self.snapshot_tol
+            if keep:
+                saved.append(step)
+                last_step, last = step, phase
+        return np.array(saved, dtype=steps.dtype)
+
+    def _fill_ghosts(self, c):
+        p = self._padded
+        p[..., 1:-1, 1:-1] = c
+        if self.conditions == "Periodic":
+            p[..., 0, 1:-1] = c[..., -1, :]
+            p[..., -1, 1:-1] = c[..., 0, :]
+            p[..., 1:-1, 0] = c[..., :, -1]
+            p[..., 1:-1, -1] = c[..., :, 0]
+            return p
+        p[..., 0, 1:-1] = c[..., 0, :]
+        p[..., -1, 1:-1] = c[..., -1, :]
+        p[..., 1:-1, 0] = c[..., :, 0]
+        p[..., 1:-1, -1] = c[..., :, -1]
+        if self.conditions == "Outflow":
+            p[..., 0, 1:-1] *= self._keep_left
+            p[..., -1, 1:-1] *= self._keep_right
+            p[..., 1:-1, 0] *= self._keep_bottom
+            p[..., 1:-1, -1] *= self._keep_top
+        return p
+
+    def _step(self, c):
+        """Один шаг явной схемы; край считается тем же ядром по фиктивным ячейкам"""
+        p = self._fill_ghosts(c)
+        centre = p[..., 1:-1, 1:-1]
+        c_new = self.Dx * (p[..., :-2, 1:-1] - 2 * centre + p[..., 2:, 1:-1]) / self.dx ** 2
+        c_new += self.Dy * (p[..., 1:-1, :-2] - 2 * centre + p[..., 1:-1, 2:]) / self.dy ** 2
+        c_new -= (centre - p[..., :-2, 1:-1]) * self.u / self.dx
+        c_new -= (centre - p[..., 1:-1, :-2]) * self.v / self.dy
+        c_new *= self.dt
+        c_new += c
+        return c_new
+
     def iterate(self):
         start_time = time.time()
         next_time = 1
+        for observer in self.observers:
+            observer.start(self)
         for t in range(self.time_steps):
+            if self._cancel.is_set():
+                self.cancelled = True
+                logger.info(f"Modelling cancelled at {t * self.dt:.5g} s")
+                break
             cur_time = t * self.dt
-            c_new = self.c.copy()
-            c_new[1:-1, 1:-1] = self.Dx * (self.c[:-2, 1:-1] - 2 * self.c[1:-1, 1:-1] + self.c[2:, 1:-1]) / self.dx ** 2
-            c_new[1:-1, 1:-1] += self.Dy * (
-                    self.c[1:-1, :-2] - 2 * self.c[1:-1, 1:-1] + self.c[1:-1, 2:]) / self.dy ** 2
-            c_new[1:-1, 1:-1] -= ((self.c[1:-1, 1:-1] - self.c[:-2, 1:-1]) * self.u[1:-1, 1:-1] / self.dx)
-            c_new[1:-1, 1:-1] -= ((self.c[1:-1, 1:-1] - self.c[1:-1, :-2]) * self.v[1:-1, 1:-1] / self.dy)
-            c_new[1:-1, 1:-1] *= self.dt
-            c_new[1:-1, 1:-1] += self.c[1:-1, 1:-1]
-
+            c = self.base
             if self.conditions == "Dirihle":
-                c_new[0, :] = 0  # Левая граница
-                c_new[-1, :] = 0  # Правая граница
-                c_new[:, 0] = 0  # Нижняя граница
-                c_new[:, -1] = 0  # Верхняя граница
-            if self.repeat_start_conditions:
+                # Многоточие: то же ядро работает и для поля (распады, x, y)
+                c_new = c.copy()
+                c_new[..., 1:-1, 1:-1] = self.Dx * (c[..., :-2, 1:-1] - 2 * c[..., 1:-1, 1:-1] + c[..., 2:, 1:-1]) / self.dx ** 2
+                c_new[..., 1:-1, 1:-1] += self.Dy * (
+                        c[..., 1:-1, :-2] - 2 * c[..., 1:-1, 1:-1] + c[..., 1:-1, 2:]) / self.dy ** 2
+                c_new[..., 1:-1, 1:-1] -= ((c[..., 1:-1, 1:-1] - c[..., :-2, 1:-1]) * self.u[1:-1, 1:-1] / self.dx)
+                c_new[..., 1:-1, 1:-1] -= ((c[..., 1:-1, 1:-1] - c[..., 1:-1, :-2]) * self.v[1:-1, 1:-1] / self.dy)
+                c_new[..., 1:-1, 1:-1] *= self.dt
+                c_new[..., 1:-1, 1:-1] += c[..., 1:-1, 1:-1]
+
+                c_new[..., 0, :] = 0  # Левая граница
+                c_new[..., -1, :] = 0  # Правая граница
+                c_new[..., :, 0] = 0  # Нижняя граница
+                c_new[..., :, -1] = 0  # Верхняя граница
+            else:
+                c_new = self._step(c)
+            if self.window:
+                # Убыль массы за шаг - вынос через края окна
+                mass = c_new.sum(axis=(-2, -1))
+                self.escaped_mass += float(np.sum(self._window_mass - mass))
+            if self.decay_factor is not None:
+                c_new *= self.decay_factor
+                if self.window:
+                    mass = mass * self.decay_factor[:, 0, 0]
+            if self.emissions is not None:
+                injected = self.emissions.inject(c_new, t)
+                self.emitted_mass += float(np.sum(injected))
+                if self.window:
+                    self._window_mass = mass + injected
+            elif self.repeat_start_conditions:
                 if self.repeat_freq == -1:
                     if cur_time >= next_time:
                         c_new += self.c_start
@@ -112,17 +507,48 @@ class Model:
                     if t % self.repeat_freq == 0:
                         c_new += self.c_start
 
-            self.c = c_new
+            self.base = c_new
+            if self.window and t % self.window_check == 0:
+                self._follow_plume(t + 1)
+            self.c = self._expand(self.base)
             if np.max(self.c) > self.max_conc and not self.repeat_start_conditions and self.check_stable:
                 logger.warning("The solution differs.")
-                logger.info(np.max(self.c))
-                logger.info("iter=", t)
+                logger.info(f"Max concentration {np.max(self.c):.5g} at iter={t}")
                 raise Exception("Решение расходится")
-            if int(t % self.slices_freq) == 0:
-                self.c_list.append(self.c.copy())
+            for observer in self.observers:
+                observer.update(self.c, cur_time + self.dt, self.dt)
+            if self._slice_due(t):
+                self._save_slice(t, cur_time)
+            if self._steady_phases is not None:
+                # После установления считается ещё один период выбросов для фаз
+                self._steady_phases.append(self.c)
+                if len(self._steady_phases) == self._steady_cycle:
+                    self.steady_step = t
+                    break
+            elif self.steady_check and (t + 1) % self.steady_check == 0 and self._steady_after <= t < self.time_steps - 1:
+                if self._converged(t):
+                    self.steady_time = cur_time + self.dt
+                    logger.info(f"Steady state reached at {self.steady_time:.5g} s")
+                    self._steady_phases = []
+                    if self._steady_cycle == 1:
+                        self.steady_step = t
+                        break
+
+        # Отменённый расчёт не дополняется: фазы периода могли быть не досчитаны
+        if self.steady_step is not None and not self.cancelled:
+            self._fill_steady(self.steady_step)
+        for observer in self.observers:
+            observer.finish(self)
 
         end_time = time.time()
         logger.info(f"Time spend {end_time - start_time:.5f} seconds.")
+        if self.cancelled:
+            computed = t
+        else:
+            computed = self.time_steps if self.steady_step is None else self.steady_step + 1
         logger.info(f"Modelled {self.dt * self.time_steps} seconds")
-        logger.info(f"Calculated {self.time_steps * self.x_steps * self.y_steps} elements")
-        logger.info(f"Calculated {len(self.c_list)} layers")
+        logger.info(f"Calculated {computed * self.x_steps * self.y_steps} elements")
+        logger.info(f"Calculated {self.saved_slices} layers")
+        if self.window and self.emitted_mass > 0:
+            logger.info(f"Mass left the moving window: {self.escaped_mass:.5g} "
+                        f"({self.escaped_mass / self.emitted_mass:.1%} of emitted)")
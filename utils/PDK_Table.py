@@ -1,56 +1,50 @@
-import json
-from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QTableWidget, QTableWidgetItem,
-                             QPushButton, QMessageBox, QHeaderView, QHBoxLayout)
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QTableView, QPushButton, QMessageBox, QHeaderView, QHBoxLayout,
+                             QLineEdit, QAbstractItemView)
+
+from utils.Catalog import SubstanceTableModel
 
 
 class SubstancesDialog(QDialog):
-    def __init__(self, json_file, parent=None):
+    """Редактирование справочника ПДК.
+
+    Таблица читает базу по мере прокрутки, фильтр ищет по названию и CAS.
+    Изменения пишутся в базу сразу, но фиксируются (и сохраняются в
+    substances.json) только по OK; Отмена их откатывает.
+    """
+
+    def __init__(self, catalog, parent=None):
         super().__init__(parent)
-        self.json_file = json_file
+        self.catalog = catalog
         self.setWindowTitle("Редактирование ПДК веществ")
         self.setModal(True)
-        self.resize(600, 400)
-
-        # Загрузка данных из JSON
-        self.load_data()
+        self.resize(700, 500)
 
         # Создание интерфейса
         self.init_ui()
 
-    def load_data(self):
-        try:
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                self.data = json.load(f)
-            if "substances" not in self.data:
-                self.data["substances"] = []
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {str(e)}")
-            self.data = {"substances": []}
-
-    def save_data(self):
-        try:
-            with open(self.json_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
-            return True
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
-            return False
-
     def init_ui(self):
         layout = QVBoxLayout()
 
-        # Создание таблицы
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["Название", "ПДК", "ПДК рабочей зоны"])
+        # Поиск
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Поиск по названию или CAS")
+        self.filter_input.setClearButtonEnabled(True)
 
-        # Заполнение таблицы данными
-        self.update_table()
+        # Создание таблицы
+        self.model = SubstanceTableModel(self.catalog, self)
+        self.model.error.connect(lambda message: QMessageBox.warning(self, "Ошибка", message))
+        self.filter_input.textChanged.connect(self.model.set_filter)
+        self.table = QTableView()
+        self.table.setModel(self.model)
 
         # Настройка таблицы
         self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.table.verticalHeader().setVisible(False)
-        self.table.setEditTriggers(QTableWidget.AllEditTriggers)
+        # Все строки одной высоты: вид не измеряет каждую строку
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.AllEditTriggers)
 
         # Кнопки управления
         btn_layout = QHBoxLayout()
@@ -70,6 +64,7 @@ class SubstancesDialog(QDialog):
         btn_cancel.clicked.connect(self.reject)
 
         # Добавление элементов в layout
+        layout.addWidget(self.filter_input)
         layout.addWidget(self.table)
         layout.addLayout(btn_layout)
         layout.addWidget(btn_ok)
@@ -77,37 +72,18 @@ class SubstancesDialog(QDialog):
 
         self.setLayout(layout)
 
-    def update_table(self):
-        substances = self.data.get("substances", [])
-        self.table.setRowCount(len(substances))
-
-        for row, substance in enumerate(substances):
-            name_item = QTableWidgetItem(substance["name"])
-            pdk_item = QTableWidgetItem(str(substance["pdk"]))
-            pdk_work_item = QTableWidgetItem(str(substance["pdk_work"]))
-
-            self.table.setItem(row, 0, name_item)
-            self.table.setItem(row, 1, pdk_item)
-            self.table.setItem(row, 2, pdk_work_item)
-
     def add_row(self):
-        row_count = self.table.rowCount()
-        self.table.insertRow(row_count)
-
-        # Добавляем пустые ячейки
-        name_item = QTableWidgetItem("Новое вещество")
-        pdk_item = QTableWidgetItem("0")
-        pdk_work_item = QTableWidgetItem("0")
-
-        self.table.setItem(row_count, 0, name_item)
-        self.table.setItem(row_count, 1, pdk_item)
-        self.table.setItem(row_count, 2, pdk_work_item)
+        substance_id = self.catalog.add(self.catalog.unique_name("Новое вещество"))
+        self.model.insert_substance(substance_id)
 
         # Перемещаем фокус на новую строку
-        self.table.setCurrentCell(row_count, 0)
+        index = self.model.index(0, 0)
+        self.table.setCurrentIndex(index)
+        self.table.scrollTo(index)
+        self.table.edit(index)
 
     def delete_row(self):
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
         if current_row == -1:
             QMessageBox.warning(self, "Ошибка", "Выберите строку для удаления")
             return
@@ -118,46 +94,18 @@ class SubstancesDialog(QDialog):
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
-            self.table.removeRow(current_row)
+            self.catalog.delete(self.model.substance_id(current_row))
+            self.model.remove_substance(current_row)
 
     def on_ok(self):
-        # Очищаем текущие данные
-        self.data["substances"] = []
-
-        # Собираем данные из таблицы
-        for row in range(self.table.rowCount()):
-            name_item = self.table.item(row, 0)
-            pdk_item = self.table.item(row, 1)
-            pdk_work_item = self.table.item(row, 2)
-
-            if not name_item or not pdk_item or not pdk_work_item:
-                continue
-
-            name = name_item.text().strip()
-            if not name:
-                QMessageBox.warning(self, "Ошибка", f"Название вещества в строке {row + 1} не может быть пустым")
-                return
-
-            try:
-                pdk = float(pdk_item.text())
-                pdk_work = float(pdk_work_item.text())
-            except ValueError:
-                QMessageBox.warning(self, "Ошибка", f"ПДК в строке {row + 1} должны быть числовыми значениями")
-                return
-
-            # Проверяем на дубликаты названий
-            for substance in self.data["substances"]:
-                if substance["name"].lower() == name.lower():
-                    QMessageBox.warning(self, "Ошибка", f"Вещество '{name}' уже существует")
-                    return
-
-            # Добавляем новое вещество
-            self.data["substances"].append({
-                "name": name,
-                "pdk": pdk,
-                "pdk_work": pdk_work
-            })
-
-        # Сохраняем в файл
-        if self.save_data():
-            self.accept()
+        try:
+            self.catalog.commit()
+            self.catalog.export_json()
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
+            return
+        self.accept()
+
+    def reject(self):
+        self.catalog.rollback()
+        super().reject()
@@ -0,0 +1,148 @@
+import logging
+import queue
+import threading
+from functools import partial
+
+import numpy as np
+
+from utils.Export import GifExporter
+from utils.HtmlViewer import HtmlEncoder
+from utils.Rendering import MPC_ZONES, MPCRasterizer, HeatRasterizer
+from utils.Storage import embed
+
+logger = logging.getLogger(__name__)
+
+# Срезов в очереди между расчётом и отрисовкой; при заполнении расчёт ждёт
+QUEUE_SIZE = 32
+
+
+class RenderPipeline:
+    """Отрисовка анимации одновременно с расчётом.
+
+    Подключается к Model как приёмник срезов (writers): срезы через
+    ограниченную очередь передаются потоку-потребителю, который отдаёт их
+    экспортёру (GifExporter растеризует в пуле процессов, HtmlEncoder
+    сжимает). Расчёт ждёт только при заполнении очереди, поэтому общее
+    время близко к большему из времени расчёта и отрисовки.
+
+    Длительность кадра считается по времени до следующего среза:
+    time_step (с) показывается за interval (мс).
+    """
+
+    def __init__(self, exporter, interval=None, time_step=None, channel=None, queue_size=QUEUE_SIZE):
+        self.exporter = exporter
+        self.interval = interval
+        self.time_step = time_step
+        self.channel = channel
+        self.frames = 0
+        self._last = None
+        self._offset = self._domain = None
+        self._error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._consume, name="render-pipeline", daemon=True)
+        self._thread.start()
+
+    def append(self, frame, time=None, offset=None, domain=None):
+        if self.channel is not None:
+            frame = frame[self.channel]
+        self._offset, self._domain = offset, domain
+        if domain is not None:
+            frame = embed(frame, offset, domain)
+        # Поле [x, y] рисуется транспонированным, как у FrameCache; копия -
+        # поле модели может измениться до отрисовки
+        frame = np.ascontiguousarray(frame.T)
+        self._last = frame
+        self._put((frame, time))
+
+    def repeat_steady(self, phases, order, times, steady_time=None):
+        if self._last is None:
+            return
+        frames = {}
+        for phase, time in zip(order, times):
+            if phase not in frames:
+                self.append(phases[phase], time, self._offset, self._domain)
+                frames[phase] = self._last
+            else:
+                self._put((frames[phase], time))
+
+    def _put(self, item):
+        while True:
+            self._check()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"Rendering failed: {self._error}") from self._error
+
+    def _duration(self, time, next_time):
+        if self.time_step and time is not None and next_time is not None and next_time > time:
+            return max(1, int(round((next_time - time) / self.time_step * self.interval)))
+        return None
+
+    def _consume(self):
+        # Кадр отдаётся экспортёру, когда известно время следующего
+        pending = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if pending is not None:
+                    self.exporter.add(pending[0], self._duration(pending[1], item[1]))
+                    self.frames += 1
+                pending = item
+            if pending is not None:
+                self.exporter.add(pending[0], None)
+                self.frames += 1
+        except Exception as e:
+            logger.error(f"Rendering failed: {e}")
+            self._error = e
+        finally:
+            # Экспортёр закрывается и после ошибки, иначе остаются открытые файл и пул процессов;
+            # ошибка закрытия не заменяет первую ошибку
+            try:
+                self.exporter.close()
+            except Exception as e:
+                if self._error is None:
+                    logger.error(f"Rendering failed: {e}")
+                    self._error = e
+
+    def close(self):
+        if not self._thread.is_alive():
+            self._check()
+            return
+        self._put(None)
+        self._thread.join()
+        self._check()
+        logger.info(f"Rendered {self.frames} frames during the run")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def animation_exporter(output_file, x_size, y_size, interval, repeat=True, zoning=False,
+                       mpc=None, update_conc=False, total=None, progress=None):
+    """Экспортёр GIF/HTML с оформлением MPCAnimation/DefaultAnimation.
+
+    Возвращает None, если кадры нельзя рисовать по мере расчёта: для GIF
+    с общей шкалой концентрации нужен максимум всех кадров.
+    """
+    if output_file.lower().endswith('.html'):
+        return HtmlEncoder(output_file, x_size, y_size, interval, repeat=repeat, zoning=zoning,
+                           mpc=mpc, zones=MPC_ZONES if mpc is not None else None, update_conc=update_conc)
+    if not output_file.lower().endswith('.gif'):
+        raise ValueError("Unsupported file format. Please use .gif or .html")
+    if mpc is not None:
+        factory = partial(MPCRasterizer, x_size, y_size, mpc, MPC_ZONES, zoning=zoning)
+    elif update_conc:
+        factory = partial(HeatRasterizer, x_size, y_size, None, update_conc=True, zoning=zoning)
+    else:
+        return None
+    return GifExporter(output_file, factory, interval, total=total, progress=progress)
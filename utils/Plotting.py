@@ -1,21 +1,74 @@
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import numpy as np
 from PyQt5.QtWidgets import QMessageBox
 from matplotlib import pyplot as plt
-from matplotlib.animation import PillowWriter, FuncAnimation
+from matplotlib.animation import FuncAnimation
 from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
 from matplotlib.colors import BoundaryNorm, ListedColormap
-from matplotlib.figure import Figure
 from matplotlib.ticker import FixedLocator
 
+from utils.Export import ProgressChannel, export_gif
+from utils.HtmlViewer import export_html
+from utils.Isolines import IsolineCache, frame_isolines
+from utils.Rendering import MPC_ZONES, MPCRasterizer, HeatRasterizer
+from utils.Storage import RESULT_PATH, FrameCache, frame_durations, open_result
+
+
+class LevelOfDetail:
+    """Выбор уровня пирамиды результата под размер осей в пикселях.
+
+    На экран выводится уровень, у которого на пиксель приходится не меньше
+    одной ячейки; при увеличении масштаба выбирается более подробный.
+    """
+
+    def __init__(self, store, ax, x_size, y_size, reduction):
+        self.store = store
+        self.ax = ax
+        self.x_size = x_size
+        self.y_size = y_size
+        self.reduction = reduction
+        self.factor = 1
+        self._caches = {}
+
+    def frames(self):
+        if self.factor not in self._caches:
+            self._caches[self.factor] = FrameCache(self.store, factor=self.factor, reduction=self.reduction)
+        return self._caches[self.factor]
+
+    def close(self):
+        for cache in self._caches.values():
+            cache.close()
+        self._caches.clear()
+
+    def extent(self):
+        if self.factor == 1:
+            return [0, self.x_size, 0, self.y_size]
+        # Грубая копия покрывает дополненную до кратного размера сетку
+        nx, ny = self.store.shape[-2:]
+        mx, my = self.store.lod[self.factor][self.reduction].shape[-2:]
+        return [0, self.x_size * mx * self.factor / nx, 0, self.y_size * my * self.factor / ny]
+
+    def choose(self):
+        bbox = self.ax.get_window_extent()
+        if bbox.width <= 0 or bbox.height <= 0:
+            return False
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        nx, ny = self.store.shape[-2:]
+        cells_per_pixel = max(abs(x1 - x0) / self.x_size * nx / bbox.width,
+                              abs(y1 - y0) / self.y_size * ny / bbox.height)
+        factor = max(f for f in self.store.lod_factors if f <= max(cells_per_pixel, 1))
+        changed = factor != self.factor
+        self.factor = factor
+        return changed
+
 
 class MPCAnimation:
     def __init__(self, anim_int, repeat, x_size, y_size, mpc,
-                 output_file=None, progress_bar=None, zoning=False):
+                 output_file=None, progress_bar=None, zoning=False, result_path=RESULT_PATH):
         backend = 'Agg' if output_file is not None else 'Qt5Agg'
-        print(backend)
         plt.switch_backend(backend)
         plt.close('all')
 
@@ -32,8 +85,11 @@ class MPCAnimation:
         self.progress_bar = progress_bar
         self.zoning = zoning
 
-        self.c_list = np.load("model.npz")['res'].transpose(0, 2, 1)
+        self.store = open_result(result_path)
+        self.c_list = FrameCache(self.store)
         self.total_frames = len(self.c_list)
+        # Кадр показывается пропорционально времени до следующего среза
+        self.durations = frame_durations(self.store.times, anim_int)
 
         self._setup_zones()
 
@@ -41,23 +97,18 @@ class MPCAnimation:
         self.im = None
         self.cbar = None
         self.mpc_line = None
+        self.isolines = None
         self.title = None
+        self.lod = None
+        self.view_frames = self.c_list
+        self.current_it = 0
 
         if progress_bar and output_file is not None:
             progress_bar.setRange(0, 100)
             progress_bar.setValue(0)
 
     def _setup_zones(self):
-        self.zones = {
-            'levels': [0, 0.5, 1.0, 2.0, 5.0],  # В долях от MPC
-            'colors': ['#4CAF50', '#FFEB3B', '#FF9800', '#F44336'],
-            'labels': [
-                'Ниже 0.5 MPC (безопасно)',
-                '0.5-1 MPC (допустимо)',
-                '1-2 MPC (опасно)',
-                'Выше 2 MPC (критично)'
-            ]
-        }
+        self.zones = MPC_ZONES
 
     def _get_scaled_levels(self):
         return [level * self.mpc for level in self.zones['levels']]
@@ -75,24 +126,18 @@ class MPCAnimation:
         self.ax.set_ylabel('Y координата, м')
 
     def update_frame(self, it):
-        current_data = self.c_list[it]
+        self.current_it = it
+        current_data = self.view_frames[it]
 
         if self.zoning:
             self.im.set_array(current_data)
         else:
             self.im.set_data(current_data)
 
-        if hasattr(self, 'mpc_line'):
-            self.mpc_line.remove()
-        self.mpc_line = self.ax.contour(
-            current_data,
-            levels=[self.mpc],
-            colors=['white'],
-            linewidths=2,
-            linestyles='dashed',
-            extent=[0, self.x_size, 0, self.y_size])
+        self.mpc_line.set_segments(self._isolines(it, current_data))
 
         self.title.set_text(f'Карта загрязнений (шаг {it + 1}/{self.total_frames})\nПДК = {self.mpc}')
+        self._set_duration(it)
 
         if self.progress_bar and self.output_file is not None:
             progress = int((it + 1) / self.total_frames * 100)
@@ -100,6 +145,14 @@ class MPCAnimation:
 
         return [self.im, self.mpc_line, self.title]
 
+    def _set_duration(self, it):
+        if self.ani is not None and self.ani.event_source is not None:
+            self.ani.event_source.interval = self.durations[it]
+
+    def _isolines(self, it, data):
+        if self.isolines is not None:
+            return self.isolines.frame(it, data)
+        return frame_isolines(data, self.mpc, self.x_size, self.y_size)
 
     def draw_or_save(self):
         self._setup_axes()
@@ -110,20 +163,32 @@ class MPCAnimation:
 
         interpolation = 'bilinear' if self.zoning else 'nearest'
 
+        # Для просмотра берётся уровень пирамиды по размеру осей;
+        # свёртка максимумом не даёт превышениям ПДК исчезнуть
+        extent = [0, self.x_size, 0, self.y_size]
+        if self.output_file is None:
+            self.lod = LevelOfDetail(self.store, self.ax, self.x_size, self.y_size, 'max')
+            self.lod.choose()
+            self.view_frames = self.lod.frames()
+            extent = self.lod.extent()
+
         self.im = self.ax.imshow(
-            self.c_list[0],
-            extent=[0, self.x_size, 0, self.y_size],
+            self.view_frames[0],
+            extent=extent,
             origin='lower',
             cmap=cmap,
             norm=norm,
             interpolation=interpolation)
+        self.ax.set_xlim(0, self.x_size)
+        self.ax.set_ylim(0, self.y_size)
 
+        # Заголовок внутри осей: при блиттинге обновляется только их область
         self.title = self.ax.text(
-            0.5, 1.05,  # Позиция (x=0.5 - центр, y=1.05 - чуть выше осей)
+            0.5, 0.98,
             f'Карта загрязнений\nПДК = {self.mpc}',
             transform=self.ax.transAxes,
             ha='center',
-            va='bottom',
+            va='top',
             bbox={'facecolor': 'white', 'alpha': 0.7, 'pad': 5}
         )
 
@@ -142,13 +207,16 @@ class MPCAnimation:
         self.cbar.set_ticks(tick_positions)
         self.cbar.set_ticklabels(self.zones['labels'])
 
-        self.mpc_line = self.ax.contour(
-            self.c_list[0],
-            levels=[self.mpc],
-            colors=['white'],
+        # Изолинии всех кадров считаются в фоне и кэшируются рядом с результатом
+        if self.output_file is None:
+            self.isolines = IsolineCache(self.store, self.mpc, self.x_size, self.y_size)
+
+        self.mpc_line = LineCollection(
+            self._isolines(0, self.view_frames[0]),
+            colors='white',
             linewidths=2,
-            linestyles='dashed',
-            extent=[0, self.x_size, 0, self.y_size])
+            linestyles='dashed')
+        self.ax.add_collection(self.mpc_line)
 
         # Создание анимации
         self.ani = FuncAnimation(
@@ -156,16 +224,30 @@ class MPCAnimation:
             self.update_frame,
             frames=self.total_frames,
             interval=self.anim_int,
-            blit=False,
+            blit=True,
             repeat=self.repeat)
 
         if self.output_file is not None:
             self._save_animation()
         else:
+            self._connect_lod()
             plt.tight_layout()
             plt.draw()
             plt.show(block=False)
             self.fig._ani = self.ani
+            self.fig.canvas.mpl_connect('close_event', lambda event: self.close())
+
+    def _connect_lod(self):
+        self.ax.callbacks.connect('xlim_changed', self._refine_lod)
+        self.ax.callbacks.connect('ylim_changed', self._refine_lod)
+        self.fig.canvas.mpl_connect('resize_event', self._refine_lod)
+
+    def _refine_lod(self, *args):
+        if self.lod.choose():
+            self.view_frames = self.lod.frames()
+            self.im.set_data(self.view_frames[self.current_it])
+            self.im.set_extent(self.lod.extent())
+            self.fig.canvas.draw_idle()
 
     def _save_animation(self):
         try:
@@ -183,135 +265,32 @@ class MPCAnimation:
             self.show_error(f"Ошибка при сохранении: {str(e)}")
         finally:
             plt.close(self.fig)
+            self.close()
 
     def _save_gif(self):
-        # Determine number of workers (leave one core free for main thread)
-        num_workers = max(1, multiprocessing.cpu_count() - 1)
-
-        # Create frame rendering function that doesn't leak figures
-        def render_frame(frame_num):
-            # Create figure without using pyplot to avoid warnings
-            fig = Figure(figsize=(10, 8))
-            canvas = FigureCanvasAgg(fig)
-            ax = fig.add_subplot(111)
-
-            # Get current frame data
-            current_data = self.c_list[frame_num]
-
-            # Recreate the visualization
-            scaled_levels = self._get_scaled_levels()
-            norm = BoundaryNorm(scaled_levels, len(self.zones['colors']))
-            cmap = ListedColormap(self.zones['colors'])
-
-            interpolation = 'bilinear' if self.zoning else 'nearest'
-            im = ax.imshow(
-                current_data,
-                extent=[0, self.x_size, 0, self.y_size],
-                origin='lower',
-                cmap=cmap,
-                norm=norm,
-                interpolation=interpolation)
-
-            # Add contours
-            mpc_line = ax.contour(
-                current_data,
-                levels=[self.mpc],
-                colors=['white'],
-                linewidths=2,
-                linestyles='dashed',
-                extent=[0, self.x_size, 0, self.y_size])
-
-            # Add title
-            ax.set_title(f'Карта загрязнений (шаг {frame_num + 1}/{self.total_frames})\nПДК = {self.mpc}')
-
-            # Draw the figure
-            canvas.draw()
-
-            # Get the image data
-            buf = canvas.buffer_rgba()
-            width, height = canvas.get_width_height()
-            img_array = np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 4)
-
-            # Explicit cleanup
-            fig.clear()
-            plt.close(fig)
-            del fig, canvas, ax
-
-            return img_array
-
+        rasterizer_factory = partial(MPCRasterizer, self.x_size, self.y_size, self.mpc, self.zones,
+                                     zoning=self.zoning)
         try:
-            # Process frames in batches to avoid memory issues
-            batch_size = min(20, self.total_frames)
-            frames = []
-
-            for i in range(0, self.total_frames, batch_size):
-                with ThreadPoolExecutor(max_workers=num_workers) as executor:
-                    frames.extend(executor.map(render_frame, range(i, min(i + batch_size, self.total_frames))))
-
-                if self.progress_bar:
-                    progress = int((i + batch_size) / self.total_frames * 100)
-                    self.progress_bar.setValue(min(progress, 100))
-
-            # Save the frames
-            writer = PillowWriter(fps=1000 / self.anim_int)
-            with writer.saving(self.fig, self.output_file, dpi=100):
-                for i, frame in enumerate(frames):
-                    writer.grab_frame()
-                    if self.progress_bar:
-                        progress = int((i + 1) / self.total_frames * 100)
-                        self.progress_bar.setValue(progress)
-
+            export_gif(self.output_file, rasterizer_factory, self.c_list, self.anim_int,
+                       progress=ProgressChannel(self.progress_bar), durations=self.durations)
         except Exception as e:
             self.show_error(f"Ошибка при сохранении: {str(e)}")
         finally:
             plt.close('all')
 
-    def _render_frame(self, frame_num):
-        """Render a single frame and return the image data"""
-        # Create a new figure and canvas for this frame
-        fig, ax = plt.subplots(figsize=(10, 8))
-        canvas = FigureCanvasAgg(fig)
-
-        # Copy the content from our main figure
-        self.update_frame(frame_num)
-
-        # Draw the new figure with the same content
-        ax.clear()
-        ax.imshow(self.im.get_array(),
-                  extent=[0, self.x_size, 0, self.y_size],
-                  origin='lower',
-                  cmap=self.im.get_cmap(),
-                  norm=self.im.norm,
-                  interpolation=self.im.get_interpolation())
-
-        # Add contours if they exist
-        if hasattr(self, 'mpc_line'):
-            ax.contour(self.im.get_array(),
-                       levels=[self.mpc],
-                       colors=['white'],
-                       linewidths=2,
-                       linestyles='dashed',
-                       extent=[0, self.x_size, 0, self.y_size])
-
-        # Add title
-        ax.set_title(f'Карта загрязнений (шаг {frame_num + 1}/{self.total_frames})\nПДК = {self.mpc}')
-
-        # Draw the figure
-        fig.canvas.draw()
-
-        # Get the image data as numpy array
-        buf = fig.canvas.buffer_rgba()
-        width, height = fig.canvas.get_width_height()
-        img_array = np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 4)
-
-        # Close the temporary figure to free memory
-        plt.close(fig)
-
-        return img_array
     def _save_html(self):
-        html = self.ani.to_jshtml()
-        with open(self.output_file, 'w') as f:
-            f.write(html)
+        export_html(self.output_file, self.c_list, self.x_size, self.y_size, self.anim_int,
+                    repeat=self.repeat, zoning=self.zoning, mpc=self.mpc, zones=self.zones,
+                    progress=ProgressChannel(self.progress_bar), durations=self.durations)
+
+    def close(self):
+        """Останавливает фоновое чтение кадров и закрывает результат"""
+        self.c_list.close()
+        if self.lod is not None:
+            self.lod.close()
+        if self.isolines is not None:
+            self.isolines.close()
+        self.store.close()
 
     def show_error(self, message):
         msg = QMessageBox()
@@ -332,7 +311,7 @@ class MPCAnimation:
 
 class DefaultAnimation:
     def __init__(self, anim_int, repeat, x_size, y_size, output_file=None,
-                 progress_bar=None, zoning=False, update_conc=False):
+                 progress_bar=None, zoning=False, update_conc=False, result_path=RESULT_PATH):
         if output_file is not None:
             plt.switch_backend('Agg')
         else:
@@ -353,22 +332,31 @@ class DefaultAnimation:
         self.zoning = zoning
         self.update_conc = update_conc
 
-        self.c_list = np.load("model.npz")['res'].transpose(0, 2, 1)
+        self.store = open_result(result_path)
+        self.c_list = FrameCache(self.store)
         self.total_frames = len(self.c_list)
-        self.current_vmax = np.max(self.c_list) if not update_conc else np.max(self.c_list[0])
+        self.durations = frame_durations(self.store.times, anim_int)
+        # Пределы шкалы берутся из метаданных, без прохода по всем кадрам
+        self.current_vmax = self.store.global_max if not update_conc else float(self.store.maxima[0])
         self.ani = None
         self.im = None
+        self.lod = None
+        self.view_frames = self.c_list
+        self.current_it = 0
 
         if progress_bar and output_file is not None:
             progress_bar.setRange(0, 100)
             progress_bar.setValue(0)
 
     def update_frame(self, it):
+        self.current_it = it
         if self.update_conc:
-            self.current_vmax = np.max(self.c_list[it])
+            self.current_vmax = float(self.store.maxima[it])
             self.im.set_clim(vmin=0, vmax=self.current_vmax)
 
-        self.im.set_array(self.c_list[it])
+        self.im.set_array(self.view_frames[it])
+        if self.ani is not None and self.ani.event_source is not None:
+            self.ani.event_source.interval = self.durations[it]
 
         if self.progress_bar and self.output_file is not None:
             progress = int((it + 1) / self.total_frames * 100)
@@ -379,14 +367,23 @@ class DefaultAnimation:
     def draw_or_save(self):
         interpolation = 'bilinear' if self.zoning else 'nearest'
 
+        extent = [0, self.x_size, 0, self.y_size]
+        if self.output_file is None:
+            self.lod = LevelOfDetail(self.store, self.ax, self.x_size, self.y_size, 'mean')
+            self.lod.choose()
+            self.view_frames = self.lod.frames()
+            extent = self.lod.extent()
+
         self.im = self.ax.imshow(
-            self.c_list[0],
-            extent=[0, self.x_size, 0, self.y_size],
+            self.view_frames[0],
+            extent=extent,
             origin='lower',
             cmap='hot',
             vmin=0,
             vmax=self.current_vmax,
             interpolation=interpolation)
+        self.ax.set_xlim(0, self.x_size)
+        self.ax.set_ylim(0, self.y_size)
 
         self.fig.colorbar(self.im, ax=self.ax, label='Концентрация')
 
@@ -402,40 +399,54 @@ class DefaultAnimation:
         if self.output_file is not None:
             self._save_animation()
         else:
+            self._connect_lod()
             plt.draw()
             plt.show(block=False)
             self.fig._ani = self.ani
+            self.fig.canvas.mpl_connect('close_event', lambda event: self.close())
 
-    def _save_animation(self):
-        if self.output_file.lower().endswith('.gif'):
-            self._save_gif()
-        elif self.output_file.lower().endswith('.html'):
-            self._save_html()
-        else:
-            raise ValueError("Unsupported file format. Please use .gif or .html")
-        plt.close(self.fig)
-
-    def _save_gif(self):
-        writer = PillowWriter(fps=1000 / self.anim_int)
-        if self.progress_bar:
-            writer.frame_count = 0
-            original_grab_frame = writer.grab_frame
+    def _connect_lod(self):
+        self.ax.callbacks.connect('xlim_changed', self._refine_lod)
+        self.ax.callbacks.connect('ylim_changed', self._refine_lod)
+        self.fig.canvas.mpl_connect('resize_event', self._refine_lod)
 
-            def grab_frame_with_progress(**kwargs):
-                result = original_grab_frame(**kwargs)
-                writer.frame_count += 1
-                progress = int(writer.frame_count / self.total_frames * 100)
-                self.progress_bar.setValue(progress)
-                return result
+    def _refine_lod(self, *args):
+        if self.lod.choose():
+            self.view_frames = self.lod.frames()
+            self.im.set_data(self.view_frames[self.current_it])
+            self.im.set_extent(self.lod.extent())
+            self.fig.canvas.draw_idle()
 
-            writer.grab_frame = grab_frame_with_progress
+    def _save_animation(self):
+        try:
+            if self.output_file.lower().endswith('.gif'):
+                self._save_gif()
+            elif self.output_file.lower().endswith('.html'):
+                self._save_html()
+            else:
+                raise ValueError("Unsupported file format. Please use .gif or .html")
+        finally:
+            plt.close(self.fig)
+            self.close()
 
-        self.ani.save(self.output_file, writer=writer, dpi=100)
+    def _save_gif(self):
+        rasterizer_factory = partial(HeatRasterizer, self.x_size, self.y_size, self.current_vmax,
+                                     update_conc=self.update_conc, zoning=self.zoning)
+        export_gif(self.output_file, rasterizer_factory, self.c_list, self.anim_int,
+                   progress=ProgressChannel(self.progress_bar), durations=self.durations)
 
     def _save_html(self):
-        html = self.ani.to_jshtml()
-        with open(self.output_file, 'w') as f:
-            f.write(html)
+        export_html(self.output_file, self.c_list, self.x_size, self.y_size, self.anim_int,
+                    repeat=self.repeat, zoning=self.zoning, vmax=self.current_vmax,
+                    update_conc=self.update_conc, progress=ProgressChannel(self.progress_bar),
+                    durations=self.durations)
+
+    def close(self):
+        """Останавливает фоновое чтение кадров и закрывает результат"""
+        self.c_list.close()
+        if self.lod is not None:
+            self.lod.close()
+        self.store.close()
 
     def show_error(self, message):
         QMessageBox.critical(None, "Ошибка", message)
@@ -0,0 +1,109 @@
+import csv
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RECEPTORS_PATH = "model.receptors.csv"
+
+
+class Receptors:
+    """Временные ряды концентрации в точках-рецепторах.
+
+    Индексы соседних ячеек и билинейные веса считаются один раз при старте
+    расчёта; на каждом шаге все рецепторы читаются одной операцией
+    индексирования в заранее выделенный массив (шаги, рецепторы).
+    """
+
+    def __init__(self, coords, names=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.names = list(names) if names is not None else [f"R{i + 1}" for i in range(len(self.coords))]
+        self.values = None
+        self.times = None
+        self.species = []
+        self.steps = 0
+        self._index = None
+        self._weights = None
+        self._cells_x = None
+        self._cells_y = None
+        self._cell_weights = None
+
+    def __len__(self):
+        return len(self.coords)
+
+    def start(self, model):
+        nx, ny = model.x_steps, model.y_steps
+        fx, fy = model.grid_index(self.coords[:, 0], self.coords[:, 1])
+        outside = (fx < -0.5) | (fx > nx - 0.5) | (fy < -0.5) | (fy > ny - 0.5)
+        for name in np.asarray(self.names)[outside]:
+            logger.warning(f"Receptor {name} is outside the domain, using the nearest cell")
+
+        fx = np.clip(fx, 0, nx - 1)
+        fy = np.clip(fy, 0, ny - 1)
+        i0 = np.floor(fx).astype(np.intp)
+        j0 = np.floor(fy).astype(np.intp)
+        i1 = np.minimum(i0 + 1, nx - 1)
+        j1 = np.minimum(j0 + 1, ny - 1)
+        wx = fx - i0
+        wy = fy - j0
+
+        self._cells_x = np.stack([i0, i1, i0, i1], axis=1)
+        self._cells_y = np.stack([j0, j0, j1, j1], axis=1)
+        self._cell_weights = np.stack([(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy], axis=1)
+        self.shift(model)
+        # Для поля (вещества, x, y) ряды хранятся как (шаги, вещества, рецепторы)
+        self.species = list(getattr(model, "species_names", []))
+        self.values = np.zeros((model.time_steps,) + model.c.shape[:-2] + (len(self),))
+        self.times = np.zeros(model.time_steps)
+        self.steps = 0
+
+    def shift(self, model):
+        # Индексы в поле модели; при подвижном окне рецепторы вне окна дают ноль
+        (ox, oy), (wx, wy) = getattr(model, "offset", (0, 0)), model.c.shape[-2:]
+        cells_x, cells_y = self._cells_x - ox, self._cells_y - oy
+        inside = (cells_x >= 0) & (cells_x < wx) & (cells_y >= 0) & (cells_y < wy)
+        self._index = np.where(inside, cells_x * wy + cells_y, 0)
+        self._weights = np.where(inside, self._cell_weights, 0.0)
+
+    def update(self, c, time, dt):
+        self.values[self.steps] = (c.reshape(c.shape[:-2] + (-1,))[..., self._index] * self._weights).sum(axis=-1)
+        self.times[self.steps] = time
+        self.steps += 1
+
+    def steady(self, phases, times, dt):
+        # Шаг i установившегося режима берёт фазу i % len(phases)
+        stop = self.steps + len(times)
+        for phase, c in enumerate(phases):
+            values = (c.reshape(c.shape[:-2] + (-1,))[..., self._index] * self._weights).sum(axis=-1)
+            self.values[self.steps + phase:stop:len(phases)] = values
+        self.times[self.steps:self.steps + len(times)] = times
+        self.steps += len(times)
+
+    def finish(self, model):
+        self.values = self.values[:self.steps]
+        self.times = self.times[:self.steps]
+
+    def to_csv(self, path=RECEPTORS_PATH):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            columns = [f"{name} ({species})" for species in self.species for name in self.names] \
+                if self.species else self.names
+            writer.writerow(["time"] + columns)
+            for time, row in zip(self.times, self.values):
+                writer.writerow([f"{time:.6g}"] + [f"{value:.6g}" for value in row.reshape(-1)])
+        logger.info(f"Saved {len(self)} receptor series to {path}")
+
+    def save_npy(self, path):
+        """Сохраняет массив (шаги[, вещества], рецепторы); время шага i равно (i + 1) * dt"""
+        np.save(path, self.values)
+
+
+def load_receptors(path):
+    """Читает рецепторы из CSV со столбцами name, x, y (метры)"""
+    names, coords = [], []
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            names.append(row.get("name") or f"R{len(names) + 1}")
+            coords.append((float(row["x"]), float(row["y"])))
+    return Receptors(coords, names)
@@ -0,0 +1,291 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from matplotlib import colormaps, font_manager
+from matplotlib.colors import to_rgb
+
+
+# Зоны карты ПДК: границы в долях ПДК, цвета и подписи легенды
+MPC_ZONES = {
+    'levels': [0, 0.5, 1.0, 2.0, 5.0],
+    'colors': ['#4CAF50', '#FFEB3B', '#FF9800', '#F44336'],
+    'labels': [
+        'Ниже 0.5 MPC (безопасно)',
+        '0.5-1 MPC (допустимо)',
+        '1-2 MPC (опасно)',
+        'Выше 2 MPC (критично)'
+    ]
+}
+
+
+def load_font(size):
+    # DejaVu Sans поставляется с matplotlib и содержит кириллицу
+    path = font_manager.findfont(font_manager.FontProperties(family='DejaVu Sans'))
+    return ImageFont.truetype(path, size)
+
+
+def color_to_rgb(color):
+    return tuple(int(round(channel * 255)) for channel in to_rgb(color))
+
+
+class FrameRasterizer(ABC):
+    """Растеризатор кадров без matplotlib.
+
+    Подложка (рамка, оси, подписи, легенда) рисуется один раз, карта
+    концентраций на каждом кадре переводится в RGB векторно через numpy.
+    """
+
+    PAD = 12
+    TITLE_HEIGHT = 52
+    AXIS_LEFT = 64
+    AXIS_BOTTOM = 48
+    LEGEND_WIDTH = 0
+    MAX_TICKS = 10
+
+    def __init__(self, x_size, y_size, zoning=False, map_size=600):
+        self.x_size = x_size
+        self.y_size = y_size
+        self.zoning = zoning
+
+        # Размер карты в пикселях с сохранением пропорций области
+        if x_size >= y_size:
+            self.map_w = int(map_size)
+            self.map_h = max(1, int(round(map_size * y_size / x_size)))
+        else:
+            self.map_h = int(map_size)
+            self.map_w = max(1, int(round(map_size * x_size / y_size)))
+
+        self.map_x = self.PAD + self.AXIS_LEFT
+        self.map_y = self.PAD + self.TITLE_HEIGHT
+        self.width = self.map_x + self.map_w + self.PAD + self.LEGEND_WIDTH
+        self.height = self.map_y + self.map_h + self.AXIS_BOTTOM
+
+        self.font = load_font(14)
+        self.small_font = load_font(11)
+
+        self._grid_shape = None
+        self._rows = None
+        self._cols = None
+        self._background = None
+
+    def title(self, it, total):
+        # При отрисовке во время расчёта число кадров может быть заранее неизвестно
+        return f'Карта загрязнений (шаг {it + 1}/{total})' if total else f'Карта загрязнений (шаг {it + 1})'
+
+    @abstractmethod
+    def colorize(self, values):
+        """RGB-массив (uint8) карты по пересэмплированным значениям"""
+
+    def draw_legend(self, draw, image):
+        pass
+
+    def annotate(self, draw, data):
+        pass
+
+    def render(self, data, it, total):
+        """Возвращает кадр it как RGB-изображение Pillow"""
+        if self._background is None:
+            self._background = self._build_background()
+
+        frame = self._background.copy()
+        frame[self.map_y:self.map_y + self.map_h, self.map_x:self.map_x + self.map_w] = \
+            self.colorize(self.resample(data))
+
+        image = Image.fromarray(frame)
+        draw = ImageDraw.Draw(image)
+        self.annotate(draw, data)
+        draw.multiline_text(
+            (self.map_x + self.map_w / 2, self.PAD + self.TITLE_HEIGHT / 2),
+            self.title(it, total),
+            font=self.font,
+            fill='black',
+            anchor='mm',
+            align='center')
+        return image
+
+    def resample(self, data):
+        # origin='lower': нулевая строка данных - нижняя строка карты
+        data = np.asarray(data)[::-1]
+        if data.shape != self._grid_shape:
+            self._prepare_sampling(data.shape)
+
+        if self.zoning:
+            r0, r1, wr = self._rows
+            c0, c1, wc = self._cols
+            rows = data[r0] * (1 - wr)[:, None] + data[r1] * wr[:, None]
+            return rows[:, c0] * (1 - wc) + rows[:, c1] * wc
+        return data[np.ix_(self._rows, self._cols)]
+
+    def _prepare_sampling(self, shape):
+        n_rows, n_cols = shape
+        if self.zoning:
+            self._rows = self._bilinear_axis(n_rows, self.map_h)
+            self._cols = self._bilinear_axis(n_cols, self.map_w)
+        else:
+            self._rows = self._nearest_axis(n_rows, self.map_h)
+            self._cols = self._nearest_axis(n_cols, self.map_w)
+        self._grid_shape = shape
+
+    @staticmethod
+    def _nearest_axis(n, size):
+        pos = (np.arange(size) + 0.5) * n / size
+        return np.minimum(pos, n - 1).astype(np.intp)
+
+    @staticmethod
+    def _bilinear_axis(n, size):
+        pos = np.clip((np.arange(size) + 0.5) * n / size - 0.5, 0, n - 1)
+        i0 = np.floor(pos).astype(np.intp)
+        i1 = np.minimum(i0 + 1, n - 1)
+        return i0, i1, pos - i0
+
+    def _build_background(self):
+        image = Image.new('RGB', (self.width, self.height), 'white')
+        draw = ImageDraw.Draw(image)
+        self._draw_axes(draw, image)
+        self.draw_legend(draw, image)
+        return np.array(image)
+
+    def _draw_axes(self, draw, image):
+        left, top = self.map_x, self.map_y
+        right, bottom = left + self.map_w, top + self.map_h
+        draw.rectangle([left - 1, top - 1, right, bottom], outline='black')
+
+        for value in np.linspace(0, self.x_size, max(2, int(min(self.MAX_TICKS, self.x_size)))):
+            x = left + value / self.x_size * self.map_w
+            draw.line([x, bottom, x, bottom + 5], fill='black')
+            draw.text((x, bottom + 7), f'{value:.4g}', font=self.small_font, fill='black', anchor='mt')
+
+        for value in np.linspace(0, self.y_size, max(2, int(min(self.MAX_TICKS, self.y_size)))):
+            y = bottom - value / self.y_size * self.map_h
+            draw.line([left - 5, y, left, y], fill='black')
+            draw.text((left - 7, y), f'{value:.4g}', font=self.small_font, fill='black', anchor='rm')
+
+        draw.text((left + self.map_w / 2, bottom + 26), 'X координата, м',
+                  font=self.small_font, fill='black', anchor='mt')
+
+        # Подпись оси Y рисуется отдельно и поворачивается
+        label = 'Y координата, м'
+        box = draw.textbbox((0, 0), label, font=self.small_font)
+        label_image = Image.new('RGB', (box[2] - box[0] + 2, box[3] - box[1] + 4), 'white')
+        ImageDraw.Draw(label_image).text((-box[0] + 1, -box[1] + 2), label, font=self.small_font, fill='black')
+        label_image = label_image.rotate(90, expand=True)
+        image.paste(label_image, (self.PAD, int(top + self.map_h / 2 - label_image.height / 2)))
+
+
+class MPCRasterizer(FrameRasterizer):
+    """Кадры с зонами ПДК: палитра BoundaryNorm/ListedColormap и изолиния ПДК"""
+
+    LEGEND_WIDTH = 260
+    DASH = 6
+
+    def __init__(self, x_size, y_size, mpc, zones, zoning=False, map_size=600):
+        super().__init__(x_size, y_size, zoning=zoning, map_size=map_size)
+        self.mpc = mpc
+        self.zones = zones
+        self.levels = [level * mpc for level in zones['levels']]
+
+        # Внутренние границы зон: значения ниже/выше крайних уровней
+        # попадают в крайние цвета, как у BoundaryNorm с ListedColormap
+        self._inner_levels = np.asarray(self.levels[1:-1])
+        self._palette = np.array([color_to_rgb(color) for color in zones['colors']], dtype=np.uint8)
+
+        rows = np.arange(self.map_h)[:, None]
+        cols = np.arange(self.map_w)[None, :]
+        self._dash = ((rows + cols) // self.DASH) % 2 == 0
+
+    def title(self, it, total):
+        return f'{super().title(it, total)}\nПДК = {self.mpc}'
+
+    def colorize(self, values):
+        rgb = np.take(self._palette, np.digitize(values, self._inner_levels), axis=0)
+        rgb[self.isoline_mask(values)] = 255
+        return rgb
+
+    def isoline_mask(self, values):
+        above = values >= self.mpc
+        edge = np.zeros_like(above)
+        edge[:, 1:] |= above[:, 1:] != above[:, :-1]
+        edge[1:, :] |= above[1:, :] != above[:-1, :]
+        # Линия толщиной 2 пикселя, штриховая
+        thick = edge.copy()
+        thick[:, :-1] |= edge[:, 1:]
+        thick[:-1, :] |= edge[1:, :]
+        return thick & self._dash
+
+    def draw_legend(self, draw, image):
+        left = self.map_x + self.map_w + 24
+        top = self.map_y
+        draw.text((left, top), f'Концентрация (ПДК = {self.mpc})', font=self.small_font, fill='black')
+
+        box = 22
+        y = top + 24
+        # Верхняя зона сверху, как на цветовой шкале
+        for color, label in reversed(list(zip(self.zones['colors'], self.zones['labels']))):
+            draw.rectangle([left, y, left + box, y + box], fill=color, outline='black')
+            draw.text((left + box + 8, y + box / 2), label, font=self.small_font, fill='black', anchor='lm')
+            y += box + 8
+
+        draw.rectangle([left, y, left + box, y + box], fill='#606060', outline='black')
+        for x in range(left + 2, left + box - 2, self.DASH):
+            draw.line([x, y + box / 2, min(x + self.DASH // 2, left + box - 2), y + box / 2], fill='white', width=2)
+        draw.text((left + box + 8, y + box / 2), 'Изолиния ПДК', font=self.small_font, fill='black', anchor='lm')
+
+
+class HeatRasterizer(FrameRasterizer):
+    """Кадры в палитре hot с цветовой шкалой, как у DefaultAnimation.
+
+    При update_conc верхняя граница шкалы берётся из максимума каждого
+    кадра, иначе используется общая vmax.
+    """
+
+    LEGEND_WIDTH = 110
+    BAR_WIDTH = 20
+    TICKS = 6
+
+    def __init__(self, x_size, y_size, vmax, update_conc=False, zoning=False, map_size=600, cmap='hot'):
+        super().__init__(x_size, y_size, zoning=zoning, map_size=map_size)
+        self.vmax = vmax
+        self.update_conc = update_conc
+        self._vmax = vmax
+        self._lut = colormaps[cmap](np.arange(colormaps[cmap].N), bytes=True)[:, :3]
+
+    def render(self, data, it, total):
+        if self.update_conc:
+            self._vmax = float(np.max(data))
+        return super().render(data, it, total)
+
+    def colorize(self, values):
+        # То же правило, что у Normalize(0, vmax) + Colormap: индекс int(x * N),
+        # значения вне диапазона получают крайние цвета
+        n = len(self._lut)
+        if self._vmax > 0:
+            index = np.clip(values * (n / self._vmax), 0, n - 1).astype(np.intp)
+        else:
+            index = np.zeros(values.shape, dtype=np.intp)
+        return np.take(self._lut, index, axis=0)
+
+    def draw_legend(self, draw, image):
+        left = self.map_x + self.map_w + 24
+        top = self.map_y
+        fraction = 1 - (np.arange(self.map_h) + 0.5) / self.map_h
+        index = np.minimum(fraction * len(self._lut), len(self._lut) - 1).astype(np.intp)
+        bar = np.repeat(np.take(self._lut, index, axis=0)[:, None, :], self.BAR_WIDTH, axis=1)
+        image.paste(Image.fromarray(np.ascontiguousarray(bar)), (left, top))
+        draw.rectangle([left - 1, top - 1, left + self.BAR_WIDTH, top + self.map_h], outline='black')
+        draw.text((left + self.BAR_WIDTH / 2, top - 6), 'Концентрация', font=self.small_font, fill='black',
+                  anchor='mb')
+
+        if not self.update_conc:
+            self._draw_ticks(draw)
+
+    def annotate(self, draw, data):
+        if self.update_conc:
+            self._draw_ticks(draw)
+
+    def _draw_ticks(self, draw):
+        left = self.map_x + self.map_w + 24 + self.BAR_WIDTH
+        for value in np.linspace(0, self._vmax, self.TICKS):
+            y = self.map_y + self.map_h - (value / self._vmax * self.map_h if self._vmax > 0 else 0)
+            draw.line([left, y, left + 4, y], fill='black')
+            draw.text((left + 7, y), f'{value:.3g}', font=self.small_font, fill='black', anchor='lm')
@@ -0,0 +1,152 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PATH = "model.summary.npz"
+
+
+def _threshold(value):
+    # Для нескольких веществ порог - массив (вещества, 1, 1); без ПДК превышений нет
+    if isinstance(value, (list, tuple, np.ndarray)):
+        values = np.array([v if v else np.inf for v in value], dtype=np.float64)
+        return values.reshape(-1, 1, 1) if np.isfinite(values).any() else None
+    return value or None
+
+
+def _threshold_value(threshold):
+    if threshold is None:
+        return np.float64(0.0)
+    if isinstance(threshold, np.ndarray):
+        return np.where(np.isfinite(threshold), threshold, 0.0).reshape(-1)
+    return np.float64(threshold)
+
+
+class ExposureAccumulator:
+    """Показатели воздействия, накапливаемые на каждом шаге Model.iterate.
+
+    Для каждой ячейки: максимум концентрации, доза (интеграл концентрации
+    по времени), время выше ПДК и ПДК рабочей зоны. Для каждого шага:
+    площадь превышения обоих ПДК. Все поля обновляются на месте, поэтому
+    расчёт можно вести без сохранения срезов. Для поля (вещества, x, y)
+    ПДК задаются списками по веществам, площади считаются для каждого.
+    """
+
+    def __init__(self, mpc=None, mpc_work=None):
+        self.mpc = _threshold(mpc)
+        self.mpc_work = _threshold(mpc_work)
+        self.species = []
+        self.max = None
+        self.dose = None
+        self.time_above = None
+        self.time_above_work = None
+        self.times = None
+        self.area_above = None
+        self.area_above_work = None
+        self.cell_area = 1.0
+        self.steps = 0
+        self._scratch = None
+        self._mask = None
+        self._region = (Ellipsis,)
+
+    def start(self, model):
+        # В режиме подвижного окна карты ведутся на всю область, обновляется часть под окном
+        shape = getattr(model, "domain_shape", model.c.shape)
+        self.cell_area = model.dx * model.dy
+        self.species = list(getattr(model, "species_names", []))
+        series = (model.time_steps,) + shape[:-2]
+        self.shift(model)
+        self.max = np.zeros(shape)
+        self.max[self._region] = model.c
+        self.dose = np.zeros(shape)
+        self.time_above = np.zeros(shape)
+        self.time_above_work = np.zeros(shape)
+        self.times = np.zeros(model.time_steps)
+        self.area_above = np.zeros(series)
+        self.area_above_work = np.zeros(series)
+        self.steps = 0
+        self._scratch = np.empty(model.c.shape)
+        self._mask = np.empty(model.c.shape, dtype=bool)
+
+    def shift(self, model):
+        self._region = model.window_region() if getattr(model, "window", None) else (Ellipsis,)
+
+    def update(self, c, time, dt):
+        step = self.steps
+        region = self._region
+        field_max = self.max[region]
+        np.maximum(field_max, c, out=field_max)
+        np.multiply(c, dt, out=self._scratch)
+        self.dose[region] += self._scratch
+        self.times[step] = time
+
+        if self.mpc is not None:
+            time_above = self.time_above[region]
+            np.greater(c, self.mpc, out=self._mask)
+            np.add(time_above, dt, out=time_above, where=self._mask)
+            self.area_above[step] = np.count_nonzero(self._mask, axis=(-2, -1)) * self.cell_area
+        if self.mpc_work is not None:
+            time_above = self.time_above_work[region]
+            np.greater(c, self.mpc_work, out=self._mask)
+            np.add(time_above, dt, out=time_above, where=self._mask)
+            self.area_above_work[step] = np.count_nonzero(self._mask, axis=(-2, -1)) * self.cell_area
+        self.steps += 1
+
+    def steady(self, phases, times, dt):
+        """Оставшиеся шаги установившегося режима учитываются без пошагового прохода.
+
+        phases - поля одного периода выбросов, шаг i берёт фазу i % len(phases).
+        """
+        step, count, period = self.steps, len(times), len(phases)
+        region = self._region
+        self.times[step:step + count] = times
+        for phase, c in enumerate(phases):
+            repeats = len(range(phase, count, period))
+            duration = dt * repeats
+            np.maximum(self.max[region], c, out=self.max[region])
+            np.multiply(c, duration, out=self._scratch)
+            self.dose[region] += self._scratch
+            for threshold, time_above, area in ((self.mpc, self.time_above, self.area_above),
+                                                (self.mpc_work, self.time_above_work, self.area_above_work)):
+                if threshold is None:
+                    continue
+                time_above = time_above[region]
+                np.greater(c, threshold, out=self._mask)
+                np.add(time_above, duration, out=time_above, where=self._mask)
+                area[step + phase:step + count:period] = np.count_nonzero(self._mask, axis=(-2, -1)) * self.cell_area
+        self.steps += count
+
+    def finish(self, model):
+        # Расчёт мог закончиться раньше запланированного числа шагов
+        self.times = self.times[:self.steps]
+        self.area_above = self.area_above[:self.steps]
+        self.area_above_work = self.area_above_work[:self.steps]
+        logger.info(f"Max concentration {self.max.max():.5g}, "
+                    f"max time above MPC {self.time_above.max():.5g} s, "
+                    f"max area above MPC {self.area_above.max(initial=0):.5g} m2")
+
+    def summary(self):
+        summary = {
+            "max": self.max,
+            "dose": self.dose,
+            "time_above": self.time_above,
+            "time_above_work": self.time_above_work,
+            "times": self.times,
+            "area_above": self.area_above,
+            "area_above_work": self.area_above_work,
+            "mpc": _threshold_value(self.mpc),
+            "mpc_work": _threshold_value(self.mpc_work),
+        }
+        if self.species:
+            summary["species"] = np.array(self.species)
+        return summary
+
+    def save(self, path=SUMMARY_PATH):
+        np.savez_compressed(path, **self.summary())
+        logger.info(f"Saved exposure summary to {path}")
+
+
+def load_summary(path=SUMMARY_PATH):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import coo_matrix, identity
+from scipy.sparse.linalg import LinearOperator, bicgstab, spilu, splu
+
+logger = logging.getLogger(__name__)
+
+# Разложения матриц (LU или ILU) по хэшу оператора
+FACTOR_CACHE_SIZE = 8
+_factor_cache = OrderedDict()
+
+
+def transport_matrix(model):
+    """Матрица B одного шага явной схемы Model: c_new = B c (до распада и выбросов).
+
+    Граничные условия те же, что в Model.iterate: для Dirihle строки краёв
+    нулевые, для остальных соседи за краем берутся из фиктивных ячеек.
+    """
+    nx, ny = model.base.shape[-2:]
+    u = np.broadcast_to(model.u, (nx, ny))
+    v = np.broadcast_to(model.v, (nx, ny))
+    dt, hx, hy = model.dt, model.Dx / model.dx ** 2, model.Dy / model.dy ** 2
+    i, j = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    index = i * ny + j
+
+    # (сдвиг по x, сдвиг по y, коэффициент)
+    stencil = [
+        (0, 0, 1 + dt * (-2 * hx - 2 * hy - u / model.dx - v / model.dy)),
+        (-1, 0, dt * (hx + u / model.dx)),
+        (1, 0, dt * hx + 0 * u),
+        (0, -1, dt * (hy + v / model.dy)),
+        (0, 1, dt * hy + 0 * v),
+    ]
+    if model.conditions == "Dirihle":
+        rows_mask = (i > 0) & (i < nx - 1) & (j > 0) & (j < ny - 1)
+    else:
+        rows_mask = np.ones((nx, ny), dtype=bool)
+
+    rows, cols, values = [], [], []
+    for di, dj, coefficient in stencil:
+        ni, nj = i + di, j + dj
+        keep = rows_mask.copy()
+        if model.conditions == "Periodic":
+            ni, nj = ni % nx, nj % ny
+        elif model.conditions != "Dirihle":
+            if model.conditions == "Outflow":
+                # На входящей границе фиктивная ячейка пустая: вклад соседа отбрасывается
+                if di < 0:
+                    keep[0, :] &= model._keep_left.astype(bool)
+                if di > 0:
+                    keep[-1, :] &= model._keep_right.astype(bool)
+                if dj < 0:
+                    keep[:, 0] &= model._keep_bottom.astype(bool)
+                if dj > 0:
+                    keep[:, -1] &= model._keep_top.astype(bool)
+            # Иначе фиктивная ячейка равна краевой
+            ni, nj = np.clip(ni, 0, nx - 1), np.clip(nj, 0, ny - 1)
+        rows.append(index[keep])
+        cols.append((ni * ny + nj)[keep])
+        values.append(np.broadcast_to(coefficient, (nx, ny))[keep])
+
+    n = nx * ny
+    return coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)).tocsr()
+
+
+def _operator_key(model, decay_factor, method):
+    digest = hashlib.sha1(repr((model.base.shape[-2:], model.Dx, model.Dy, model.dx, model.dy, model.dt,
+                                model.conditions, float(decay_factor), method)).encode())
+    digest.update(np.ascontiguousarray(model.u, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(model.v, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _factorize(model, decay_factor, method):
+    key = _operator_key(model, decay_factor, method)
+    factor = _factor_cache.get(key)
+    if factor is not None:
+        _factor_cache.move_to_end(key)
+        return factor
+
+    start = time.time()
+    nx, ny = model.base.shape[-2:]
+    matrix = (identity(nx * ny, format="csc")
+              - decay_factor * transport_matrix(model)).tocsc()
+    try:
+        if method == "lu":
+            factor = (matrix, splu(matrix))
+        else:
+            # Естественный порядок совпадает с порядком схемы против потока, ILU при нём почти точен
+            ilu = spilu(matrix, drop_tol=1e-4, permc_spec="NATURAL")
+            factor = (matrix, LinearOperator(matrix.shape, ilu.solve))
+    except RuntimeError as e:
+        # Например, Periodic без распада: масса не уходит из области
+        raise ValueError(f"Steady state does not exist for {model.conditions} boundaries: {e}") from e
+    logger.info(f"Factorized {matrix.shape[0]}x{matrix.shape[0]} steady operator ({method}) "
+                f"in {time.time() - start:.3f} s")
+    _factor_cache[key] = factor
+    while len(_factor_cache) > FACTOR_CACHE_SIZE:
+        _factor_cache.popitem(last=False)
+    return factor
+
+
+def mean_source(model):
+    """Средний выброс за шаг на сетке модели (плоский вектор)"""
+    nx, ny = model.base.shape[-2:]
+    if model.emissions is not None:
+        return model.emissions.mean_rate(nx * ny)
+    if not model.repeat_start_conditions:
+        return np.zeros(nx * ny)
+    # Старый путь: c_start добавляется раз в секунду или раз в repeat_freq шагов
+    per_step = model.dt if model.repeat_freq == -1 else 1 / model.repeat_freq
+    c_start = np.asarray(model.c_start)
+    return (c_start[0] if c_start.ndim == 3 else c_start).reshape(-1) * per_step
+
+
+def solve_steady(model, method="lu", tol=1e-10):
+    """Установившееся поле для постоянных выбросов и ветра без шагов по времени.
+
+    Предел схемы Model.iterate: c = f B c + s, где s - средний выброс за шаг,
+    f - множитель распада. Решается (I - f B) c = s прямым разложением
+    (method="lu") или BiCGSTAB с ILU (method="bicgstab"); разложения
+    кэшируются, поэтому новые источники на том же операторе считаются
+    одной подстановкой. При периодических выбросах результат - среднее
+    поле за период.
+    """
+    if model.window:
+        raise ValueError("Steady solver does not support the moving window")
+    source = mean_source(model)
+    factors = model.decay_factor.reshape(-1) if model.decay_factor is not None else \
+        np.ones(model.base.shape[0] if model.base.ndim == 3 else 1)
+
+    start = time.time()
+    layers = []
+    for factor in factors:
+        matrix, solver = _factorize(model, factor, method)
+        if method == "lu":
+            solution = solver.solve(source)
+        else:
+            solution, info = bicgstab(matrix, source, rtol=tol, M=solver)
+            if info != 0:
+                logger.warning(f"BiCGSTAB did not converge (info={info})")
+        # Вырожденный оператор LU может разложить из-за округлений: проверяется невязка
+        residual = np.abs(matrix @ solution - source).max()
+        if not np.isfinite(residual) or residual > 1e-6 * max(np.abs(source).max(), 1e-300):
+            raise ValueError(f"Steady state does not exist for {model.conditions} boundaries "
+                             f"(residual {residual:.3g})")
+        layers.append(solution)
+    base = np.stack(layers).reshape(model.base.shape) if model.base.ndim == 3 else layers[0].reshape(model.base.shape)
+    logger.info(f"Steady state solved in {time.time() - start:.4f} s")
+    return model._expand(base)
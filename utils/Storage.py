@@ -0,0 +1,440 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESULT_PATH = "model"
+# Уровни пирамиды строятся, пока грубая копия не меньше этого размера
+LOD_MIN_SIZE = 128
+LOD_REDUCTIONS = {"mean": np.mean, "max": np.max}
+
+
+def params_hash(params):
+    """Хэш параметров расчёта для заголовка результата"""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def lod_levels(shape):
+    """Множители уровней детализации для сетки shape: 2, 4, ..., пока уровень не меньше LOD_MIN_SIZE"""
+    factors, factor = [], 2
+    while shape and max(-(-size // factor) for size in shape) >= LOD_MIN_SIZE:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def species_path(index, path=RESULT_PATH):
+    """Путь результата одного вещества многокомпонентного расчёта"""
+    return f"{path}.species{index}"
+
+
+def frame_durations(times, interval):
+    """Длительности показа кадров (мс) пропорционально времени до следующего кадра.
+
+    Наименьший промежуток между кадрами показывается за interval, поэтому
+    при равномерных срезах все длительности равны interval.
+    """
+    times = np.array([np.nan if time is None else time for time in times], dtype=np.float64)
+    gaps = np.diff(times)
+    valid = np.isfinite(gaps) & (gaps > 0)
+    durations = np.full(len(times), float(interval))
+    if valid.any():
+        durations[:-1][valid] = gaps[valid] / gaps[valid].min() * interval
+    return np.maximum(np.rint(durations), 1).astype(int).tolist()
+
+
+def block_reduce(frame, factor, func):
+    """Свёртка последних двух осей блоками factor x factor (края дополняются)"""
+    rows, cols = frame.shape[-2:]
+    pad_rows, pad_cols = -rows % factor, -cols % factor
+    if pad_rows or pad_cols:
+        frame = np.pad(frame, [(0, 0)] * (frame.ndim - 2) + [(0, pad_rows), (0, pad_cols)], mode="edge")
+    shape = frame.shape[:-2] + (frame.shape[-2] // factor, factor, frame.shape[-1] // factor, factor)
+    return func(frame.reshape(shape), axis=(-3, -1))
+
+
+def embed(frame, offset, shape):
+    """Кадр подвижного окна в полной области shape (вне окна нули)"""
+    full = np.zeros(frame.shape[:-2] + tuple(shape), dtype=frame.dtype)
+    (ox, oy), (nx, ny) = offset, shape
+    wx, wy = min(frame.shape[-2], nx - ox), min(frame.shape[-1], ny - oy)
+    full[..., ox:ox + wx, oy:oy + wy] = frame[..., :wx, :wy]
+    return full
+
+
+class FrameSequence:
+    """Последовательность кадров, вычисляемых при обращении (поддерживает срезы)"""
+
+    shape = ()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            frames = [self._frame(i) for i in range(*key.indices(len(self)))]
+            return np.stack(frames) if frames else np.empty((0,) + self.shape[1:])
+        if key < 0:
+            key += len(self)
+        return self._frame(key)
+
+
+class WindowedFrames(FrameSequence):
+    """Кадры подвижного окна, вложенные в полную область по записанным смещениям"""
+
+    def __init__(self, frames, offsets, shape, factor=1):
+        self.frames = frames
+        self.offsets = np.asarray(offsets, dtype=np.intp) // factor
+        self.shape = (len(frames),) + tuple(shape)
+
+    def _frame(self, it):
+        return embed(self.frames[it], self.offsets[it], self.shape[1:])
+
+
+class SteadyFrames(FrameSequence):
+    """Кадры после установления: последние len(repeats) номеров - повторы записанных кадров"""
+
+    def __init__(self, frames, total, repeats):
+        self.frames = frames
+        self.repeats = repeats
+        self.computed = total - len(repeats)
+        self.shape = (total,) + tuple(frames.shape[1:])
+
+    def _frame(self, it):
+        if it < self.computed:
+            return self.frames[it]
+        return self.frames[self.repeats[it - self.computed]]
+
+
+class ResultWriter:
+    """Пишет срезы подряд в несжатый файл <path>.dat.
+
+    Метаданные (форма, тип, время и min/max каждого кадра) сохраняются
+    в <path>.json при закрытии, поэтому чтение не требует прохода по данным.
+    При lod=True для больших сеток попутно пишутся уменьшенные копии
+    кадров (среднее и максимум по блокам 2x2, 4x4, ...) - <path>.lod<k>.<свёртка>.dat.
+    Если задан channel, из поля (вещества, x, y) пишется только это вещество.
+    Для подвижного окна записываются смещения кадров и размер полной области.
+    Кадры после установления (repeat_steady) не дублируются: каждая фаза
+    периода пишется один раз, а в метаданных (repeats) для этих кадров
+    хранятся номера записанных фаз.
+    """
+
+    def __init__(self, path=RESULT_PATH, dtype=np.float64, lod=True, channel=None, params=None):
+        self.path = path
+        self.channel = channel
+        self.params_hash = params_hash(params) if params is not None else None
+        self.dtype = np.dtype(dtype)
+        self.lod = lod
+        self.shape = None
+        self.times = []
+        self.minima = []
+        self.maxima = []
+        self.lod_levels = []
+        self.offsets = []
+        self.domain = None
+        self.stored = 0
+        self.repeats = []
+        self.steady_time = None
+        self._file = open(path + ".dat", "wb")
+
+    def append(self, frame, time=None, offset=None, domain=None):
+        if self.channel is not None:
+            frame = frame[self.channel]
+        frame = np.ascontiguousarray(frame, dtype=self.dtype)
+        if self.shape is None:
+            self.shape = frame.shape
+            if self.lod:
+                self._open_lod_levels(domain)
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from {self.shape}")
+
+        frame.tofile(self._file)
+        self.stored += 1
+        self._append_lod(frame)
+        self.times.append(time)
+        self.minima.append(float(frame.min()))
+        self.maxima.append(float(frame.max()))
+        if offset is not None:
+            self.offsets.append([int(offset[0]), int(offset[1])])
+            self.domain = [int(size) for size in domain]
+
+    def _open_lod_levels(self, domain=None):
+        # Уровни выбираются по показываемой сетке: для подвижного окна - по полной области
+        for factor in lod_levels(tuple(domain) if domain is not None else self.shape[-2:]):
+            level = {"factor": factor, "files": {}}
+            for reduction in LOD_REDUCTIONS:
+                level["files"][reduction] = open(f"{self.path}.lod{factor}.{reduction}.dat", "wb")
+            self.lod_levels.append(level)
+
+    def _append_lod(self, frame):
+        # Каждый уровень получается из предыдущего свёрткой 2x2
+        sources = {reduction: frame for reduction in LOD_REDUCTIONS}
+        for level in self.lod_levels:
+            for reduction, func in LOD_REDUCTIONS.items():
+                sources[reduction] = block_reduce(sources[reduction], 2, func).astype(self.dtype)
+                sources[reduction].tofile(level["files"][reduction])
+            level["shape"] = list(sources["max"].shape)
+
+    def repeat_steady(self, phases, order, times, steady_time=None):
+        """Добавляет кадры установившегося режима: кадр times[i] - фаза phases[order[i]].
+
+        Каждая использованная фаза записывается на диск один раз.
+        """
+        if not self.stored:
+            return
+        stored = {}
+        extrema = {}
+        for phase in order:
+            if phase in stored:
+                continue
+            frame = phases[phase]
+            if self.channel is not None:
+                frame = frame[self.channel]
+            frame = np.ascontiguousarray(frame, dtype=self.dtype)
+            # Фазы пишутся вслед за рассчитанными кадрами, номер кадра для них не заводится
+            frame.tofile(self._file)
+            self._append_lod(frame)
+            stored[phase] = self.stored
+            self.stored += 1
+            extrema[phase] = (float(frame.min()), float(frame.max()))
+        self.repeats.extend(stored[phase] for phase in order)
+        self.times.extend(times)
+        self.minima.extend(extrema[phase][0] for phase in order)
+        self.maxima.extend(extrema[phase][1] for phase in order)
+        if self.offsets:
+            self.offsets.extend([self.offsets[-1]] * len(times))
+        self.steady_time = steady_time
+
+    def __len__(self):
+        return len(self.times)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        for level in self.lod_levels:
+            for file in level.pop("files").values():
+                file.close()
+        meta = {
+            "shape": list(self.shape or ()),
+            "dtype": self.dtype.str,
+            "frames": len(self.times),
+            "times": self.times,
+            "min": self.minima,
+            "max": self.maxima,
+            "lod": [level for level in self.lod_levels if "shape" in level],
+        }
+        if self.offsets:
+            meta.update(offsets=self.offsets, domain=self.domain)
+        if self.repeats:
+            meta.update(stored=self.stored, repeats=self.repeats)
+        if self.steady_time is not None:
+            meta["steady_time"] = self.steady_time
+        if self.params_hash is not None:
+            meta["params_hash"] = self.params_hash
+        tmp_path = self.path + ".json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path + ".json")
+        logger.info(f"Saved {len(self.times)} frames to {self.path}.dat")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ResultStore:
+    """Результат моделирования, отображённый в память: кадры читаются по запросу"""
+
+    def __init__(self, path=RESULT_PATH):
+        self.path = path
+        self.data_path = path + ".dat"
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.shape = tuple(self.meta["shape"])
+        self.times = self.meta["times"]
+        self.minima = np.asarray(self.meta["min"])
+        self.maxima = np.asarray(self.meta["max"])
+        count = self.meta["frames"]
+        # Кадры после установления не записаны и повторяют записанные фазы;
+        # в файлах без repeats - последний записанный кадр
+        stored = self.meta.get("stored", count)
+        repeats = self.meta.get("repeats")
+        if repeats is None:
+            repeats = [stored - 1] * (count - stored)
+        self.steady_time = self.meta.get("steady_time")
+        dtype = np.dtype(self.meta["dtype"])
+        if count:
+            self.frames = np.memmap(path + ".dat", dtype=dtype, mode="r", shape=(stored,) + self.shape)
+        else:
+            self.frames = np.empty((0,) + self.shape)
+
+        # Пирамида уровней детализации: factor -> {свёртка: memmap}
+        self.lod = {}
+        for level in self.meta.get("lod", []) if count else []:
+            factor = level["factor"]
+            self.lod[factor] = {
+                reduction: np.memmap(f"{path}.lod{factor}.{reduction}.dat", dtype=dtype, mode="r",
+                                     shape=(stored,) + tuple(level["shape"]))
+                for reduction in LOD_REDUCTIONS
+            }
+        if repeats:
+            self.frames = SteadyFrames(self.frames, count, repeats)
+            self.lod = {factor: {reduction: SteadyFrames(frames, count, repeats)
+                                 for reduction, frames in levels.items()}
+                        for factor, levels in self.lod.items()}
+
+        # Кадры подвижного окна отдаются вложенными в полную область
+        if self.meta.get("offsets") and count:
+            domain = tuple(self.meta["domain"])
+            offsets = self.meta["offsets"]
+            self.shape = self.shape[:-2] + domain
+            self.frames = WindowedFrames(self.frames, offsets, domain)
+            for factor, levels in self.lod.items():
+                shape = tuple(-(-size // factor) for size in domain)
+                self.lod[factor] = {reduction: WindowedFrames(frames, offsets, shape, factor)
+                                    for reduction, frames in levels.items()}
+            # Вне окна концентрация нулевая
+            self.minima = np.minimum(self.minima, 0.0)
+
+    @staticmethod
+    def exists(path=RESULT_PATH):
+        return os.path.isfile(path + ".json") and os.path.isfile(path + ".dat")
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, it, factor=1, reduction="mean"):
+        if factor == 1:
+            return self.frames[it]
+        return self.lod[factor][reduction][it]
+
+    @property
+    def lod_factors(self):
+        return [1] + sorted(self.lod)
+
+    @property
+    def global_max(self):
+        return float(self.maxima.max()) if len(self.maxima) else 0.0
+
+    def close(self):
+        """Освобождает отображения файлов; после закрытия кадры не читаются"""
+        self.frames = np.empty((0,) + self.shape)
+        self.lod = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_result(path=RESULT_PATH):
+    """Открывает результат; старый model.npz один раз переводится в новый формат.
+
+    Если есть и несжатый, и сжатый результат, открывается более новый.
+    """
+    # Импорт здесь: utils.Compression сам зависит от этого модуля
+    from utils.Compression import CompressedStore
+    if CompressedStore.exists(path):
+        if not ResultStore.exists(path) or \
+                os.path.getmtime(path + ".rz.json") >= os.path.getmtime(path + ".json"):
+            return CompressedStore(path)
+    if not ResultStore.exists(path) and os.path.isfile(path + ".npz"):
+        logger.info(f"Converting {path}.npz to memory-mapped format")
+        with ResultWriter(path) as writer:
+            for frame in np.load(path + ".npz")["res"]:
+                writer.append(frame)
+    return ResultStore(path)
+
+
+def result_exists(path=RESULT_PATH):
+    return ResultStore.exists(path) or os.path.isfile(path + ".rz.json") or os.path.isfile(path + ".npz")
+
+
+class FrameCache:
+    """LRU-кэш кадров с упреждающим чтением следующих кадров в фоне.
+
+    Ведёт себя как последовательность кадров, поэтому подходит вместо
+    загруженного целиком массива c_list.
+    """
+
+    def __init__(self, store, transpose=True, capacity=32, prefetch=8, factor=1, reduction="mean"):
+        self.store = store
+        self.transpose = transpose
+        self.factor = factor
+        self.reduction = reduction
+        self.capacity = capacity
+        self.prefetch = prefetch
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._closed = False
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, it):
+        total = len(self.store)
+        if it < 0:
+            it += total
+        if not 0 <= it < total:
+            raise IndexError(it)
+
+        with self._lock:
+            frame = self._cache.get(it)
+            if frame is not None:
+                self._cache.move_to_end(it)
+        if frame is None:
+            frame = self._put(it, self._load(it))
+
+        self._schedule(it)
+        return frame
+
+    def _load(self, it):
+        frame = self.store.read(it, self.factor, self.reduction)
+        if self.transpose:
+            frame = frame.T
+        return np.array(frame)
+
+    def _put(self, it, frame):
+        with self._lock:
+            self._cache[it] = frame
+            self._cache.move_to_end(it)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+            self._pending.discard(it)
+        return frame
+
+    def _schedule(self, it):
+        total = len(self.store)
+        with self._lock:
+            if self._closed:
+                return
+            # По кругу: анимация с повтором после последнего кадра идёт к первому
+            ahead = [(it + k) % total for k in range(1, min(self.prefetch, total - 1) + 1)]
+            ahead = [k for k in ahead if k not in self._cache and k not in self._pending]
+            self._pending.update(ahead)
+        for k in ahead:
+            self._executor.submit(lambda k=k: self._put(k, self._load(k)))
+
+    def close(self):
+        """Останавливает упреждающее чтение; кадры после этого читаются без него"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._cache.clear()
+            self._pending.clear()